@@ -0,0 +1,79 @@
+"""
+Benchmark the authentication overhead per request of auth.user_id_from_token.
+
+Needs no database. Generates a throwaway RSA key pair, points JWT_PUBLIC_KEY at its
+public half and signs a token valid for an hour, then times three ways of getting
+the user id from it:
+
+- pem: jwt.decode with the PEM text, parsing the key on every call
+- verify: RS256 verification with the public key parsed once (cache cleared per call)
+- cached: user_id_from_token with the verified token cache, as a repeated status poll sees it
+
+Prints JSON.
+
+Usage:
+    python -m api.benchmarks.bench_auth --repeat 1000
+"""
+
+import argparse
+import os
+import time
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from api.benchmarks.common import environment, summarize, time_calls, write_results
+from api.lib import auth
+
+
+def make_token(key_size):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    pem = private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+    token = jwt.encode({'sub': 'benchmark', 'exp': int(time.time()) + 3600}, private_key, algorithm='RS256')
+    return pem, token
+
+
+def run(args):
+    pem, token = make_token(args.key_size)
+    os.environ['JWT_PUBLIC_KEY'] = pem
+    auth._public_key = None
+
+    def uncached():
+        auth.token_cache.clear()
+        auth.user_id_from_token(token)
+
+    samples = {
+        'pem': time_calls(lambda: jwt.decode(token, pem, algorithms="RS256"), args.repeat),
+        'verify': time_calls(uncached, args.repeat),
+        'cached': time_calls(lambda: auth.user_id_from_token(token), args.repeat),
+    }
+    return [
+        {
+            'benchmark': 'auth',
+            'method': method,
+            'key_size': args.key_size,
+            'call_seconds': summarize(durations),
+            'calls_per_second': 1 / summarize(durations)['p50'],
+        }
+        for method, durations in samples.items()
+    ]
+
+
+def add_arguments(parser):
+    parser.add_argument('--key-size', type=int, default=2048)
+    parser.add_argument('--repeat', type=int, default=500)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    results = run(args)
+    write_results({'environment': environment(), 'results': results, 'cache': auth.cache_stats()}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark calibrate_kc end to end on synthetic (or given) catchment and storm files.
+
+Runs against the database in POSTGRES_URL (use a disposable one). Each repetition
+calibrates fresh inputs twice: a cold run that computes every kc value, then a warm
+run of the same inputs served from the simulation cache. Tasks and the benchmark
+user's accounting are deleted afterwards; cached results and input blobs are left
+for the cache's own eviction. Prints wall time and the task's timing counters as JSON.
+
+Usage:
+    python -m api.benchmarks.bench_calibrate_kc --kc-count 20 --storms 3 --workers 4
+"""
+
+import argparse
+import time
+import uuid
+
+from api.benchmarks import synthetic
+from api.benchmarks.common import environment, init_tables, summarize, write_results
+from api.lib.calibrate_kc import calibrate_kc
+from api.lib.db import calibration_kc_db
+from api.lib.db.connection import transaction
+
+BENCHMARK_USER = 'benchmark'
+
+
+def run_once(catg, storms, args):
+    task_id = calibration_kc_db.new_task(user_id=BENCHMARK_USER)
+    try:
+        started = time.perf_counter()
+        calibrate_kc(catg, storms, args.kc_min, args.kc_min + args.kc_step * (args.kc_count - 1), args.kc_step,
+                     args.m, args.initial_loss, args.continuous_loss, task_id=task_id, user_id=BENCHMARK_USER, workers=args.workers)
+        elapsed = time.perf_counter() - started
+        task = calibration_kc_db.get_task(task_id)
+    finally:
+        with transaction() as cur:
+            cur.execute("DELETE FROM calibration_task_results WHERE task_id = %s", (task_id,))
+            cur.execute("DELETE FROM calibration_tasks WHERE task_id = %s", (task_id,))
+    if task['status'] != 'completed':
+        raise RuntimeError(f"Calibration failed: {task.get('error_message')}")
+    return elapsed, task
+
+
+def run(args):
+    runs = {'cold': [], 'warm': []}
+    counters = {'cold': [], 'warm': []}
+    try:
+        for repetition in range(args.repeat):
+            catg, storms = synthetic.load_inputs(args, args.seed or uuid.uuid4().hex)
+            for phase in ('cold', 'warm'):
+                elapsed, task = run_once(catg, storms, args)
+                runs[phase].append(elapsed)
+                counters[phase].append({name: task.get(name) for name in ('decode_seconds', 'simulate_seconds', 'cache_hits', 'cache_misses')})
+    finally:
+        with transaction() as cur:
+            cur.execute("DELETE FROM user_accounting WHERE user_id = %s", (BENCHMARK_USER,))
+
+    simulations = args.kc_count * (len(args.storm) if args.storm else args.storms)
+    return {
+        'benchmark': 'calibrate_kc',
+        'kc_count': args.kc_count,
+        'storms': len(args.storm) if args.storm else args.storms,
+        'subareas': args.subareas,
+        'steps': args.steps,
+        'workers': args.workers,
+        'cold_seconds': summarize(runs['cold']),
+        'warm_seconds': summarize(runs['warm']),
+        'cold_simulations_per_second': simulations / summarize(runs['cold'])['p50'],
+        'counters': counters,
+    }
+
+
+def add_arguments(parser):
+    synthetic.add_arguments(parser)
+    parser.add_argument('--kc-min', type=float, default=0.5)
+    parser.add_argument('--kc-step', type=float, default=0.5)
+    parser.add_argument('--kc-count', type=int, default=10)
+    parser.add_argument('--m', type=float, default=0.8)
+    parser.add_argument('--initial-loss', type=float, default=10.0)
+    parser.add_argument('--continuous-loss', type=float, default=2.5)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    init_tables()
+    write_results({'environment': environment(), 'results': [run(args)]}, args.output)
+
+
+if __name__ == "__main__":
+    main()
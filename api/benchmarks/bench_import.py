@@ -0,0 +1,104 @@
+"""
+Benchmark the cold start of the serverless entry point: importing api.index.
+
+Each sample imports --module in a fresh interpreter with `python -X importtime`, so
+nothing is cached in sys.modules, and records the wall time of the import and the
+per-module self/cumulative times Python reports. Also lists which --heavy packages
+were imported: none of them should be, the routes import pyrorb when they run a
+calibration. Prints JSON and exits 1 when the p50 import time exceeds --budget-ms
+or a heavy package was imported, so the script can gate a deploy.
+
+Usage:
+    python -m api.benchmarks.bench_import --repeat 10 --budget-ms 800
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+from api.benchmarks.common import environment, summarize, write_results
+
+HEAVY_PACKAGES = ('pyrorb', 'numpy', 'pandas', 'scipy', 'matplotlib')
+DEFAULT_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', 1000))
+
+_PROBE = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+
+def parse_importtime(stderr):
+    """Return [(module, self_us, cumulative_us)] from the -X importtime lines of stderr."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def import_once(module):
+    """Import module in a fresh interpreter, returning (seconds, importtime entries)."""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROBE.format(module=module)],
+        capture_output=True, text=True,
+    )
+    if completed.returncode:
+        errors = [line for line in completed.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(f"Importing {module} failed:\n" + '\n'.join(errors[-20:]))
+    return float(completed.stdout.strip().splitlines()[-1]), parse_importtime(completed.stderr)
+
+
+def run(args):
+    samples = []
+    modules = []
+    for _ in range(args.repeat):
+        seconds, modules = import_once(args.module)
+        samples.append(seconds)
+
+    # Top-level packages by the time spent importing them, from the last sample
+    packages = {}
+    for name, self_us, _ in modules:
+        package = name.split('.', 1)[0]
+        packages[package] = packages.get(package, 0) + self_us
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    heavy = sorted({name.split('.', 1)[0] for name, *_ in modules} & set(args.heavy))
+
+    summary = summarize(samples)
+    return {
+        'benchmark': 'import',
+        'method': args.module,
+        'import_seconds': summary,
+        'budget_ms': args.budget_ms,
+        'within_budget': summary['p50'] * 1000 <= args.budget_ms and not heavy,
+        'modules_imported': len(modules),
+        'heavy_packages_imported': heavy,
+        'slowest_packages_ms': {package: self_us / 1000 for package, self_us in slowest},
+    }
+
+
+def add_arguments(parser):
+    parser.add_argument('--module', default='api.index')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--heavy', nargs='+', default=list(HEAVY_PACKAGES))
+    parser.add_argument('--top', type=int, default=15)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    result = run(args)
+    write_results({'environment': environment(), 'results': [result]}, args.output)
+    if not result['within_budget']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
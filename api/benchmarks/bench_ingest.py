@@ -0,0 +1,80 @@
+"""
+Benchmark upload ingestion: spooling the request's files (ingest_uploads) and decoding them (decode_uploads).
+
+Needs no database. Storm files are padded to --file-bytes so large uploads (which
+roll over from memory to disk) can be measured. Prints MB/second as JSON.
+
+Usage:
+    python -m api.benchmarks.bench_ingest --storms 20 --file-bytes 2000000
+"""
+
+import argparse
+import asyncio
+import io
+import time
+
+from fastapi import UploadFile
+
+from api.benchmarks import synthetic
+from api.benchmarks.common import environment, summarize, write_results
+from api.lib.uploads import FILE_ENCODING, decode_uploads, ingest_uploads
+
+
+def make_uploads(catg, storms):
+    def upload(name, text):
+        data = text.encode(FILE_ENCODING)
+        return UploadFile(file=io.BytesIO(data), filename=name, size=len(data))
+    return upload('synthetic.catg', catg), [upload(f'synthetic_{i}.stm', storm) for i, storm in enumerate(storms)]
+
+
+def pad(text, size):
+    """Pad a file with comment lines up to about size bytes."""
+    filler = "C " + "x" * 78 + "\n"
+    missing = max(0, size - len(text))
+    title, rest = text.split('\n', 1)
+    return f"{title}\n{filler * (missing // len(filler))}{rest}"
+
+
+def run(args):
+    catg, storms = synthetic.load_inputs(args, args.seed or 0)
+    storms = [pad(storm, args.file_bytes) for storm in storms]
+    total_bytes = len(catg.encode(FILE_ENCODING)) + sum(len(storm.encode(FILE_ENCODING)) for storm in storms)
+
+    ingest_samples = []
+    decode_samples = []
+    for _ in range(args.repeat):
+        catg_upload, storm_uploads = make_uploads(catg, storms)
+        started = time.perf_counter()
+        spooled_catg, spooled_storms = asyncio.run(ingest_uploads(catg_upload, storm_uploads))
+        ingested = time.perf_counter()
+        decode_uploads(spooled_catg, spooled_storms)
+        decoded = time.perf_counter()
+        ingest_samples.append(ingested - started)
+        decode_samples.append(decoded - ingested)
+
+    return {
+        'benchmark': 'ingest',
+        'files': 1 + len(storms),
+        'total_bytes': total_bytes,
+        'ingest_seconds': summarize(ingest_samples),
+        'decode_seconds': summarize(decode_samples),
+        'mb_per_second': total_bytes / 1e6 / summarize([i + d for i, d in zip(ingest_samples, decode_samples)])['p50'],
+    }
+
+
+def add_arguments(parser):
+    synthetic.add_arguments(parser)
+    parser.add_argument('--file-bytes', type=int, default=1_000_000, help='Pad each storm file to this size')
+    parser.add_argument('--repeat', type=int, default=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    write_results({'environment': environment(), 'results': [run(args)]}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark SimulationDB.insert_simulations and commit_local_updates throughput.
+
+Runs against the database in POSTGRES_URL (use a disposable one): every insert
+method inserts the same synthetic rows under a throwaway task id, then every row
+is completed with a synthetic result of --result-points flow values through
+commit_local_updates, and the rows are deleted again afterwards. Prints rows/second
+per method as JSON.
+
+Usage:
+    python -m api.benchmarks.bench_insert_simulations --rows 10000 --batch-size 1000
+"""
+
+import argparse
+import time
+import uuid
+from datetime import datetime, timezone
+
+from api.benchmarks.common import environment, init_tables, write_results
+from api.lib.db import input_blobs_db
+from api.lib.db.connection import transaction
+from api.lib.db.simulation_db import BULK_INSERT_METHODS, EXPIRATION_TIME, SimulationDB
+
+
+def make_rows(n_rows, payload_bytes, task_id):
+    storm_hash, storm_data = input_blobs_db.make_blob(f"{task_id}\n" + 'x' * payload_bytes)
+    catg_hash, catg_data = input_blobs_db.make_blob(f"{task_id}\n" + 'y' * payload_bytes)
+    expires_at = datetime.now(timezone.utc) + EXPIRATION_TIME
+    rows = [
+        (storm_hash, catg_hash, 0.5 + i * 0.01, 0.8, 5.0, 0.5, 'benchmark', task_id, expires_at)
+        for i in range(n_rows)
+    ]
+    return rows, {storm_hash: storm_data, catg_hash: catg_data}
+
+
+def make_result(points):
+    return {'peak': float(points), 'hydrograph': [float(i % 97) for i in range(points)]}
+
+
+def bench_method(db, method, n_rows, batch_size, payload_bytes, result_points=0):
+    task_id = f"benchmark-{uuid.uuid4()}"
+    rows, blobs = make_rows(n_rows, payload_bytes, task_id)
+    try:
+        started = time.perf_counter()
+        ids = db.insert_simulations(rows, batch_size=batch_size, method=method, blobs=blobs)
+        elapsed = time.perf_counter() - started
+
+        # commit_local_updates only saves rows leased to the worker, as if db had claimed them
+        with transaction() as cur:
+            cur.execute(
+                "UPDATE simulations_queue SET status = 'in_progress', lease_owner = %s WHERE task_id = %s",
+                (db.worker_id, task_id)
+            )
+        result = make_result(result_points)
+        for simulation_id in ids:
+            db.queue_update(simulation_id, 'completed', result)
+        started = time.perf_counter()
+        db.commit_local_updates()
+        update_elapsed = time.perf_counter() - started
+    finally:
+        with transaction() as cur:
+            cur.execute("DELETE FROM simulations_queue WHERE task_id = %s", (task_id,))
+            cur.execute("DELETE FROM input_blobs WHERE hash = ANY(%s)", (list(blobs),))
+    assert len(ids) == n_rows
+    return {
+        'method': method,
+        'rows': n_rows,
+        'batch_size': batch_size,
+        'payload_bytes': payload_bytes,
+        'seconds': elapsed,
+        'rows_per_second': n_rows / elapsed if elapsed else None,
+        'result_points': result_points,
+        'update_seconds': update_elapsed,
+        'updates_per_second': n_rows / update_elapsed if update_elapsed else None,
+    }
+
+
+def run(args):
+    db = SimulationDB()
+    return [
+        {'benchmark': 'insert_simulations', **bench_method(db, method, args.rows, args.batch_size, args.payload_bytes, args.result_points)}
+        for method in args.methods
+    ]
+
+
+def add_arguments(parser):
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--payload-bytes', type=int, default=2048, help='Size of the shared storm/catg blobs')
+    parser.add_argument('--result-points', type=int, default=200, help='Flow values in each synthetic result')
+    parser.add_argument('--methods', nargs='+', default=list(BULK_INSERT_METHODS), choices=BULK_INSERT_METHODS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    init_tables()
+    write_results({'environment': environment(), 'results': run(args)}, args.output)
+
+
+if __name__ == "__main__":
+    main()
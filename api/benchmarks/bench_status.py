@@ -0,0 +1,113 @@
+"""
+Benchmark the latency of the calibration status and results endpoints.
+
+Runs against the database in POSTGRES_URL (use a disposable one). Stores a task
+with --kc-count synthetic per-kc results over --hydrographs hydrograph locations,
+then times get_calibration_status while the task is running (partial results are
+merged from calibration_task_results), after it completed (the mapping is read from
+task_data), and a partial get_calibration_results read of one hydrograph and a
+tenth of the kc range. The endpoint functions are called directly, so the numbers
+include database reads and JSON serialization but no HTTP. The status of the
+running task is also read by --concurrency concurrent requests at once, which on
+the async pool share one event loop thread. Prints JSON.
+
+Usage:
+    python -m api.benchmarks.bench_status --kc-count 200 --hydrographs 5 --repeat 50 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import random
+
+from api.benchmarks.common import environment, init_tables, summarize, time_calls, write_results
+from api.lib import parallel_calibration
+from api.lib.calibrate_kc import get_calibration_results, get_calibration_status
+from api.lib.db import async_connection, calibration_kc_db
+from api.lib.db.connection import transaction
+
+
+def make_columns(kc_count, hydrographs, seed=0):
+    rng = random.Random(seed)
+    columns = []
+    for kc_index in range(kc_count):
+        kc = 0.5 + 0.1 * kc_index
+        mapping = {
+            f"hydrograph_{h}": {
+                'kc': [kc],
+                'peak': [rng.uniform(10.0, 500.0)],
+                'critical_duration': [rng.choice([1, 2, 3, 6, 12])],
+                'critical_pattern': [rng.randrange(10)],
+            }
+            for h in range(hydrographs)
+        }
+        columns.append((kc_index, kc, mapping))
+    return columns
+
+
+def run(args):
+    columns = make_columns(args.kc_count, args.hydrographs)
+    task_id = calibration_kc_db.new_task(user_id='benchmark')
+    # One loop for every call, as in the server: the async pool belongs to the loop that created it
+    loop = asyncio.new_event_loop()
+
+    def status():
+        loop.run_until_complete(get_calibration_status(task_id))
+
+    async def gather_status():
+        await asyncio.gather(*(get_calibration_status(task_id) for _ in range(args.concurrency)))
+
+    def concurrent_status():
+        loop.run_until_complete(gather_status())
+
+    try:
+        calibration_kc_db.save_kc_results(task_id, columns)
+        record = {"total_kc": args.kc_count, "completed_kc": args.kc_count, "progress": 1.0}
+        calibration_kc_db.update_task(task_id, {**record, "status": "in_progress", "user_id": 'benchmark'})
+        running = time_calls(status, args.repeat)
+        concurrent = time_calls(concurrent_status, max(1, args.repeat // 10))
+
+        kc_max = columns[max(0, args.kc_count // 10 - 1)][1]
+        partial = time_calls(lambda: get_calibration_results(task_id, kcMax=kc_max, hydroKey='hydrograph_0'), args.repeat)
+
+        mapping = parallel_calibration.merge_kc_mappings(column for _, _, column in columns)
+        calibration_kc_db.update_task(task_id, {**record, "status": "completed", "user_id": 'benchmark', "rorb_kc_qmax_mapping": mapping})
+        completed = time_calls(status, args.repeat)
+    finally:
+        with transaction() as cur:
+            cur.execute("DELETE FROM calibration_task_results WHERE task_id = %s", (task_id,))
+            cur.execute("DELETE FROM calibration_tasks WHERE task_id = %s", (task_id,))
+        loop.run_until_complete(async_connection.close_pool())
+        loop.close()
+
+    return {
+        'benchmark': 'status',
+        'kc_count': args.kc_count,
+        'hydrographs': args.hydrographs,
+        'running_status_seconds': summarize(running),
+        'completed_status_seconds': summarize(completed),
+        'partial_results_seconds': summarize(partial),
+        'async_pool': async_connection.enabled(),
+        'concurrency': args.concurrency,
+        'concurrent_status_seconds': summarize(concurrent),
+        'concurrent_status_per_second': args.concurrency / summarize(concurrent)['p50'],
+    }
+
+
+def add_arguments(parser):
+    parser.add_argument('--kc-count', type=int, default=100)
+    parser.add_argument('--hydrographs', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=100)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    init_tables()
+    write_results({'environment': environment(), 'results': [run(args)]}, args.output)
+
+
+if __name__ == "__main__":
+    main()
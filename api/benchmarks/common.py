@@ -0,0 +1,65 @@
+"""
+Helpers shared by the benchmark scripts: timing summaries, JSON output and table setup.
+"""
+
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+def summarize(samples):
+    """Return min / mean / p50 / p95 / max of a list of durations in seconds."""
+    ordered = sorted(samples)
+    return {
+        'samples': len(ordered),
+        'min': ordered[0],
+        'mean': statistics.fmean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1],
+    }
+
+
+def time_calls(fn, repeat, warmup=1):
+    """Call fn warmup + repeat times and return the durations of the timed calls."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+    }
+
+
+def write_results(results, output=None):
+    """Print results as JSON, or write them to output when given."""
+    text = json.dumps(results, indent=2, default=str)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+def init_tables():
+    """Create every table the calibration and simulation paths touch, for a fresh throwaway database."""
+    from api.lib.db.migrate import migrate
+    migrate()
@@ -0,0 +1,98 @@
+"""
+Run the benchmark suite and optionally compare it against a previous run.
+
+Every benchmark runs with its default options (see each module's --help). The
+database benchmarks use POSTGRES_URL, so point it at a local disposable Postgres.
+With --baseline, p50 latencies and per-second throughputs are compared against an
+earlier output file and the exit status is 1 when any got worse by more than
+--tolerance, so the suite can gate a deploy.
+
+Usage:
+    python -m api.benchmarks.run_all --output benchmarks.json
+    python -m api.benchmarks.run_all --skip calibrate_kc --baseline benchmarks.json
+"""
+
+import argparse
+import json
+import sys
+
+from api.benchmarks import bench_auth, bench_calibrate_kc, bench_import, bench_ingest, bench_insert_simulations, bench_status
+from api.benchmarks.common import environment, init_tables, write_results
+
+BENCHMARKS = {
+    'import': bench_import,
+    'auth': bench_auth,
+    'ingest': bench_ingest,
+    'insert_simulations': bench_insert_simulations,
+    'status': bench_status,
+    'calibrate_kc': bench_calibrate_kc,
+}
+DATABASE_BENCHMARKS = ('insert_simulations', 'status', 'calibrate_kc')
+
+
+def default_args(module):
+    parser = argparse.ArgumentParser()
+    module.add_arguments(parser)
+    return parser.parse_args([])
+
+
+def _metrics(result):
+    """Yield (name, value, higher_is_better) for the comparable numbers of one result."""
+    for name, value in result.items():
+        if name.endswith('_per_second') and isinstance(value, (int, float)):
+            yield name, value, True
+        elif name.endswith('_seconds') and isinstance(value, dict) and 'p50' in value:
+            yield f"{name}.p50", value['p50'], False
+
+
+def _result_key(result):
+    return result['benchmark'], result.get('method')
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions of results against the baseline results."""
+    previous = {_result_key(result): dict((name, value) for name, value, _ in _metrics(result)) for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(_result_key(result), {})
+        for name, value, higher_is_better in _metrics(result):
+            old = before.get(name)
+            if not old or not value:
+                continue
+            change = (old - value) / old if higher_is_better else (value - old) / old
+            if change > tolerance:
+                regressions.append({'benchmark': result['benchmark'], 'method': result.get('method'),
+                                    'metric': name, 'baseline': old, 'current': value, 'change': change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--skip', nargs='+', default=[], choices=list(BENCHMARKS))
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--baseline', default=None, help='Earlier output file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative slowdown before failing')
+    args = parser.parse_args()
+
+    selected = [name for name in BENCHMARKS if name not in args.skip]
+    if any(name in DATABASE_BENCHMARKS for name in selected):
+        init_tables()
+
+    results = []
+    for name in selected:
+        print(f"Running {name}...", file=sys.stderr)
+        result = BENCHMARKS[name].run(default_args(BENCHMARKS[name]))
+        results.extend(result if isinstance(result, list) else [result])
+
+    output = {'environment': environment(), 'results': results}
+    if args.baseline:
+        with open(args.baseline) as f:
+            output['regressions'] = compare(results, json.load(f)['results'], args.tolerance)
+    write_results(output, args.output)
+
+    if output.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Synthetic RORB catchment (.catg) and storm (.stm) files for benchmarks.
+
+The catchment is a chain of sub-areas, each added to the running hydrograph and
+routed through a natural reach down to the outlet, where the hydrograph is
+printed. Each storm is a single burst with a random temporal pattern, uniform
+sub-area depths and a synthetic observed hydrograph. Sizes scale with the number
+of sub-areas and time steps; the seed makes the files reproducible, and a
+different seed gives different content (so different content hashes and a cold
+simulation cache).
+
+Usage:
+    python -m api.benchmarks.synthetic --subareas 50 --storms 3 --steps 96 --output-dir /tmp/synthetic
+"""
+
+import argparse
+import os
+import random
+
+
+def _values_line(values, fmt='{:.3f}'):
+    return ', '.join(fmt.format(v) for v in values) + ', -99'
+
+
+def make_catchment(n_subareas=10, seed=0, name='Synthetic catchment'):
+    rng = random.Random(f"catg-{seed}")
+    lines = [
+        f"{name} ({n_subareas} sub-areas, seed {seed})",
+        "C Generated by api.benchmarks.synthetic",
+        "0",
+    ]
+    for _ in range(n_subareas):
+        # Code 1: add sub-area hydrograph and route through a natural (type 1) reach of the given length
+        lines.append(f"1, 1, {rng.uniform(0.5, 5.0):.2f}, -99")
+    lines.append("7.1, -99")  # print the outlet hydrograph
+    lines.append("0")
+    lines.append(_values_line([rng.uniform(1.0, 20.0) for _ in range(n_subareas)], '{:.2f}'))
+    lines.append(_values_line([rng.uniform(0.0, 0.3) for _ in range(n_subareas)], '{:.2f}'))
+    return '\n'.join(lines) + '\n'
+
+
+def make_storm(n_subareas=10, n_steps=48, seed=0, time_step=1.0, name='Synthetic storm'):
+    rng = random.Random(f"storm-{seed}")
+    burst_steps = max(1, n_steps // 3)
+    pattern = [rng.random() for _ in range(burst_steps)]
+    total = sum(pattern)
+    pattern = [100.0 * p / total for p in pattern]
+    depth = rng.uniform(20.0, 150.0)
+
+    peak_step = burst_steps + rng.randrange(max(1, n_steps - burst_steps))
+    peak_flow = rng.uniform(10.0, 500.0)
+    observed = [peak_flow * max(0.0, 1.0 - abs(i - peak_step) / (n_steps / 4)) for i in range(n_steps)]
+
+    lines = [
+        f"{name} ({n_steps} steps, seed {seed})",
+        "C Generated by api.benchmarks.synthetic",
+        f"{time_step:.2f}, {n_steps}, 1, 1, 1",
+        f"1, {burst_steps}, -99",
+        _values_line(pattern),
+        _values_line([depth] * n_subareas, '{:.1f}'),
+        _values_line(observed),
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def make_inputs(n_subareas=10, n_storms=3, n_steps=48, seed=0):
+    """Return (catg_text, [storm_text, ...])."""
+    catg = make_catchment(n_subareas, seed)
+    storms = [make_storm(n_subareas, n_steps, seed=f"{seed}-{i}") for i in range(n_storms)]
+    return catg, storms
+
+
+def add_arguments(parser):
+    """Add the input size options shared by the benchmarks, plus --catg/--storm for real files."""
+    parser.add_argument('--subareas', type=int, default=10)
+    parser.add_argument('--storms', type=int, default=3)
+    parser.add_argument('--steps', type=int, default=48)
+    parser.add_argument('--seed', default=None, help='Fixed seed, a fresh one per run when omitted')
+    parser.add_argument('--catg', default=None, help='Use this catchment file instead of a synthetic one')
+    parser.add_argument('--storm', action='append', default=None, help='Use this storm file (repeatable)')
+
+
+def load_inputs(args, seed):
+    """Return (catg_text, [storm_text, ...]) from --catg/--storm files or generated from the size options."""
+    catg, storms = make_inputs(args.subareas, args.storms, args.steps, seed)
+    if args.catg:
+        with open(args.catg, encoding='ISO-8859-1') as f:
+            catg = f.read()
+    if args.storm:
+        storms = []
+        for path in args.storm:
+            with open(path, encoding='ISO-8859-1') as f:
+                storms.append(f.read())
+    return catg, storms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subareas', type=int, default=10)
+    parser.add_argument('--storms', type=int, default=3)
+    parser.add_argument('--steps', type=int, default=48)
+    parser.add_argument('--seed', default='0')
+    parser.add_argument('--output-dir', required=True)
+    args = parser.parse_args()
+
+    catg, storms = make_inputs(args.subareas, args.storms, args.steps, args.seed)
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, 'synthetic.catg'), 'w', encoding='ISO-8859-1') as f:
+        f.write(catg)
+    for i, storm in enumerate(storms):
+        with open(os.path.join(args.output_dir, f'synthetic_{i}.stm'), 'w', encoding='ISO-8859-1') as f:
+            f.write(storm)
+
+
+if __name__ == "__main__":
+    main()
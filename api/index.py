@@ -1,10 +1,33 @@
+import logging
+import os
+
+# Loads the .env files before any module reads its settings
+from api.lib import config  # noqa: F401
 from fastapi import FastAPI
-from api.lib.calibrate_kc import start_calibration, get_calibration_status
+from api.lib.calibrate_kc import start_calibration, start_sweep, resume_calibration, cancel_calibration, get_calibration_status, get_calibration_results, export_calibration_results, watch_calibration_status, stream_calibration_status
+from api.lib.simulation_manager import queue_simulations_for_kc_calibration, get_status
 from api.lib.accounting_endpoints import get_accounting
+from api.lib.metrics_endpoints import get_metrics
+from api.lib.db import async_connection
+
+# DEBUG also logs request details (never file contents), WARNING and above is the default
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING'))
+
 ### Create FastAPI instance with custom docs and openapi url
 app = FastAPI(docs_url="/api/py/docs", openapi_url="/api/py/openapi.json")
+app.add_event_handler("shutdown", async_connection.close_pool)
 
 
 app.add_api_route("/api/py/start_calibration", start_calibration, methods=["POST"])
+app.add_api_route("/api/py/start_sweep", start_sweep, methods=["POST"])
+app.add_api_route("/api/py/queue_calibration", queue_simulations_for_kc_calibration, methods=["POST"])
+app.add_api_route("/api/py/get_simulation_status/{task_id}", get_status, methods=["GET"])
+app.add_api_route("/api/py/resume_calibration/{task_id}", resume_calibration, methods=["POST"])
+app.add_api_route("/api/py/cancel_calibration/{task_id}", cancel_calibration, methods=["POST"])
 app.add_api_route("/api/py/get_calibration_status/{task_id}", get_calibration_status, methods=["GET"])
-app.add_api_route("/api/py/get_accounting", get_accounting, methods=["GET"])
\ No newline at end of file
+app.add_api_route("/api/py/get_calibration_results/{task_id}", get_calibration_results, methods=["GET"])
+app.add_api_route("/api/py/export_calibration_results/{task_id}", export_calibration_results, methods=["GET"])
+app.add_api_route("/api/py/watch_calibration_status/{task_id}", watch_calibration_status, methods=["GET"])
+app.add_api_route("/api/py/stream_calibration_status/{task_id}", stream_calibration_status, methods=["GET"])
+app.add_api_route("/api/py/get_accounting", get_accounting, methods=["GET"])
+app.add_api_route("/api/py/metrics", get_metrics, methods=["GET"])
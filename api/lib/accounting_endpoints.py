@@ -1,12 +1,38 @@
+import os
+import time
+
 from api.lib.db import accounting
+from api.lib.input_cache import LRUCache
 from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from api.lib.security import security
 from api.lib import auth
 from fastapi.security import HTTPAuthorizationCredentials
 from typing import Annotated
 
-def get_accounting(credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)]):
+# Seconds a user's accounting is served from memory before it is read again, 0 disables the cache
+ACCOUNTING_CACHE_TTL = float(os.environ.get('ACCOUNTING_CACHE_TTL', 5))
+
+# user_id -> (expires_at, accounting)
+_accounting_cache = LRUCache()
+
+
+async def get_accounting(credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)]):
     token = credentials.credentials
-    user_id = auth.user_id_from_token(token)
-    return accounting.get_user_accounting(user_id)
+    user_id = await run_in_threadpool(auth.user_id_from_token, token)
+
+    cached = _accounting_cache.get(user_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
+    result = await accounting.get_user_accounting_async(user_id)
+    if ACCOUNTING_CACHE_TTL > 0:
+        _accounting_cache.update({user_id: (time.monotonic() + ACCOUNTING_CACHE_TTL, result)})
+    return result
+
 
+def quota_exceeded_response(error):
+    """Response for a request whose simulations would take the user past their limit."""
+    return JSONResponse(content={"message": "Simulation limit exceeded", "requested_simulations": error.requested,
+                                 "remaining_simulations": error.remaining}, status_code=403)
@@ -1,17 +1,89 @@
+import hashlib
 import os
+import threading
+import time
+
 import jwt
-import dotenv
+from jwt.algorithms import RSAAlgorithm
 
-dotenv.load_dotenv('.env.local')
+from api.lib import config  # noqa: F401  loads JWT_PUBLIC_KEY from the .env files
+from api.lib.input_cache import LRUCache
 
-def user_id_from_token(token: str):
-    public_key = os.getenv('JWT_PUBLIC_KEY')
-    if not public_key:
-        raise Exception('JWT_PUBLIC_KEY is not set')
+# Verified tokens kept in memory so repeated requests (e.g. status polls) skip the RSA check
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', 1024))
+# Upper bound on how long (seconds) a verified token is trusted without re-verifying, also
+# used for tokens without an exp claim; 0 disables the cache
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', 300))
+
+_public_key = None
+_key_lock = threading.Lock()
+
+# sha256(token) -> (valid_until, sub)
+token_cache = LRUCache(AUTH_CACHE_MAX_ENTRIES)
+_counters = {'hits': 0, 'misses': 0}
+_counters_lock = threading.Lock()
+
+
+def public_key():
+    """Return JWT_PUBLIC_KEY parsed once per process."""
+    global _public_key
+    if _public_key is None:
+        with _key_lock:
+            if _public_key is None:
+                pem = os.getenv('JWT_PUBLIC_KEY')
+                if not pem:
+                    raise Exception('JWT_PUBLIC_KEY is not set')
+                _public_key = RSAAlgorithm(RSAAlgorithm.SHA256).prepare_key(pem)
+    return _public_key
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def cache_stats():
+    """Return hits/misses of the verified token cache and its hit rate."""
+    with _counters_lock:
+        hits, misses = _counters['hits'], _counters['misses']
+    return {
+        'entries': len(token_cache),
+        'max_entries': token_cache.max_entries,
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+    }
+
+
+def verify_token(token: str):
+    """Verify the token's RS256 signature and claims, returning its payload."""
     try:
-        res = jwt.decode(token, public_key, algorithms="RS256")
+        return jwt.decode(token, public_key(), algorithms="RS256")
     except jwt.exceptions.InvalidSignatureError:
         raise Exception('Invalid token signature')
     except jwt.exceptions.InvalidTokenError:
         raise Exception('Invalid token')
-    return res['sub']
\ No newline at end of file
+
+
+def user_id_from_token(token: str):
+    """
+    Return the user id (sub claim) of a bearer token.
+
+    A verified token is cached until its exp claim, or for at most AUTH_CACHE_TTL
+    seconds, so a token that expires is verified (and rejected) again.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    cached = token_cache.get(key)
+    if cached is not None and cached[0] > now:
+        _count('hits')
+        return cached[1]
+    _count('misses')
+
+    res = verify_token(token)
+    if AUTH_CACHE_TTL > 0:
+        valid_until = now + AUTH_CACHE_TTL
+        if 'exp' in res:
+            valid_until = min(valid_until, float(res['exp']))
+        token_cache.update({key: (valid_until, res['sub'])})
+    return res['sub']
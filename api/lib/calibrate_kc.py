@@ -1,55 +1,212 @@
 import asyncio
+import functools
+import inspect
+import json
 import logging
+import threading
+import time
 from datetime import datetime
 from typing import Annotated, List, Optional
 
-from fastapi import BackgroundTasks, Depends, File, Form, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import BackgroundTasks, Depends, File, Form, Query, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPAuthorizationCredentials
-from pyrorb.tools import kc_calibration
-
 from api.lib import auth
-from api.lib.db import calibration_kc_db, accounting
+from api.lib.accounting_endpoints import quota_exceeded_response
+from api.lib import export, kc_search, metrics, parallel_calibration, sweep, task_events
+from api.lib.db import calibration_kc_db, accounting, input_blobs_db, simulation_cache_db
+from api.lib.db.simulation_db import SimulationDB
+from api.lib.hashing import content_hash
 from api.lib.security import security
+from api.lib.uploads import close_uploads, decode_uploads, ingest_uploads
+
+FINAL_STATUSES = calibration_kc_db.FINAL_STATUSES
+STATUS_WATCH_TIMEOUT = 25.0  # seconds, below typical proxy / serverless idle timeouts
+STATUS_RECHECK_SECONDS = 5.0
+SWEEP_CACHE_LOOKUP_BATCH = 1000  # cache keys per simulation_cache query
 
 
 # Helper functions
-def arange(start, stop, step):
-    """Generate a list of numbers from start to stop with given step size."""
-    current = start
-    result = []
-    while current <= stop:
-        result.append(current)
-        current += step
-    return result
-
-
-async def read_content(catg, storms):
-    """Read content from catchment and storm files concurrently."""
-    print(f"Starting concurrent reads at {datetime.now()}")
-    
-    # Use asyncio.gather() to perform concurrent I/O operations
-    catg_task = catg.read() if catg else None
-    storm_tasks = [storm.read() for storm in storms]
-    
-    # Gather all tasks (catg_task only if catg exists)
-    all_results = await asyncio.gather(catg_task, *storm_tasks)
-    
-    # Split results into catg_content and storms_content
-    catg_content = all_results[0] if catg_task else None
-    storms_content = all_results[1:] if catg_task else all_results    
-    print(f"Finished reading all contents at {datetime.now()}")    
-    return catg_content, storms_content
+def kc_range(kc_min, kc_max, kc_step):
+    """The kc grid of a calibration as a sweep axis, so grids and sweeps count and space kc values alike."""
+    return {'min': kc_min, 'max': kc_max, 'step': kc_step}
+
+
+def kc_values(kc_min, kc_max, kc_step):
+    """kc values a grid calibration runs, kc_min to kc_max inclusive; kc_step must be positive."""
+    return sweep.axis_values('kc', kc_range(kc_min, kc_max, kc_step))
+
+
+def kc_count(kc_min, kc_max, kc_step):
+    """Number of values kc_values() returns, without building them."""
+    return sweep.axis_count('kc', kc_range(kc_min, kc_max, kc_step))
+
+
+def _beat(task_id, stop):
+    while not stop.wait(calibration_kc_db.TASK_HEARTBEAT_SECONDS):
+        try:
+            calibration_kc_db.touch_task(task_id)
+        except Exception as e:
+            logging.warning(f"Heartbeat of task {task_id} failed: {e}")
+
+
+def _heartbeat(fn):
+    """
+    Refresh the task's heartbeat while fn runs, so resume_calibration and the queue sweeper
+    can tell a live task from one whose process died (e.g. a frozen serverless instance).
+    """
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        task_id = signature.bind(*args, **kwargs).arguments['task_id']
+        calibration_kc_db.touch_task(task_id)
+        stop = threading.Event()
+        threading.Thread(target=_beat, args=(task_id, stop), name='task-heartbeat', daemon=True).start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stop.set()
+    return wrapper
+
+
+def _settle(task_id, user_id, simulation_count):
+    """
+    Bill simulation_count simulations and release what the task still holds reserved (nothing if already released).
+
+    Flushed right away: the task is over and a serverless instance may never run the flush thread again.
+    """
+    released = calibration_kc_db.take_reservation(task_id)
+    accounting.record_simulations(user_id, simulation_count, released_simulations=released, flush=True)
 
 
 # Core calibration functions
-def calibrate_kc(catg_data, storms_data, kc_min, kc_max, kc_step, m, initial_loss, continuous_loss, task_id, user_id=None):
+def run_cached_kc_calibration(catg_data, storms_data, kc_list, m, initial_loss, continuous_loss, workers=1, done=None, on_columns=None, hashes=None):
+    """
+    Run the kc grid, reusing per-kc results stored in the simulation cache.
+
+    Parameters:
+    - done (dict): {kc_index: single-kc mapping} already computed for this task, these are not run again
+    - on_columns (callable): Called with [(kc_index, kc, single-kc mapping), ...] as cached
+      or computed columns become available, in completion order
+    - hashes (list): Content hashes of [catg_data, *storms_data] when the caller already has them
+
+    Returns:
+    - tuple: (rorb_kc_qmax_mapping, {"cache_hits": ..., "cache_misses": ..., "simulate_seconds": ...})
+      with counts in simulations and the seconds spent waiting on pyrorb
+    """
+    columns = dict(done or {})
+    todo = [i for i in range(len(kc_list)) if i not in columns]
+
+    inputs = [catg_data, *storms_data]
+    catg_hash, *storm_hashes = [known or content_hash(data) for known, data in zip(hashes or [None] * len(inputs), inputs)]
+    keys = {i: simulation_cache_db.cache_key('kc_calibration', catg_hash, storm_hashes, kc_list[i], m, initial_loss, continuous_loss) for i in todo}
+
+    cached = simulation_cache_db.get_results(list(keys.values()))
+    hits = [(i, kc_list[i], cached[keys[i]]) for i in todo if keys[i] in cached]
+    missing = [i for i in todo if keys[i] not in cached]
+    columns.update((i, column) for i, _, column in hits)
+    if hits and on_columns:
+        on_columns(hits)
+
+    missing_kcs = [kc_list[i] for i in missing]
+    simulate_seconds = 0.0
+    # Nothing runs when every kc value is cached or already stored (e.g. on resume)
+    if missing:
+        results = parallel_calibration.iter_kc_calibration(catg_data, storms_data, missing_kcs, m, initial_loss, continuous_loss, workers=workers)
+        try:
+            while True:
+                started = time.perf_counter()
+                item = next(results, None)
+                simulate_seconds += time.perf_counter() - started
+                if item is None:
+                    break
+                positions, mapping = item
+                fresh = [(missing[p], missing_kcs[p], column) for p, column in zip(positions, parallel_calibration.split_kc_mapping(mapping, len(positions)))]
+                simulation_cache_db.put_results({keys[i]: column for i, _, column in fresh})
+                columns.update((i, column) for i, _, column in fresh)
+                if on_columns:
+                    on_columns(fresh)
+        finally:
+            # Stops outstanding chunks when on_columns raises, e.g. on cancellation
+            results.close()
+        simulation_cache_db.evict()
+
+    kc_q_mapping = parallel_calibration.merge_kc_mappings(columns[i] for i in range(len(kc_list)))
+    stats = {
+        "cache_hits": len(hits) * len(storms_data),
+        "cache_misses": len(missing) * len(storms_data),
+        "simulate_seconds": simulate_seconds,
+    }
+    return kc_q_mapping, stats
+
+
+def run_cached_sweep(catg_data, storms_data, points, workers=1, hashes=None, on_points=None):
+    """
+    Run kc_calibration at every sweep point, reusing results stored in the simulation cache.
+
+    Points share cache entries with grid calibrations of the same inputs and parameters.
+
+    Parameters:
+    - points (list[tuple]): (kc, m, initial_loss, continuous_loss) per point, see sweep.build_sweep
+    - on_points (callable): Called with the number of points that just became available
+    - hashes (list): Content hashes of [catg_data, *storms_data] when the caller already has them
+
+    Returns:
+    - tuple: ({point_index: single-point mapping}, {"cache_hits": ..., "cache_misses": ..., "simulate_seconds": ...})
+    """
+    inputs = [catg_data, *storms_data]
+    catg_hash, *storm_hashes = [known or content_hash(data) for known, data in zip(hashes or [None] * len(inputs), inputs)]
+    keys = [simulation_cache_db.cache_key('kc_calibration', catg_hash, storm_hashes, *point) for point in points]
+
+    columns = {}
+    for start in range(0, len(keys), SWEEP_CACHE_LOOKUP_BATCH):
+        batch = range(start, min(start + SWEEP_CACHE_LOOKUP_BATCH, len(keys)))
+        cached = simulation_cache_db.get_results([keys[i] for i in batch])
+        columns.update((i, cached[keys[i]]) for i in batch if keys[i] in cached)
+    hits = len(columns)
+    if hits and on_points:
+        on_points(hits)
+
+    missing = [i for i in range(len(points)) if i not in columns]
+    results = sweep.iter_sweep(catg_data, storms_data, points, missing, workers=workers)
+    simulate_seconds = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            item = next(results, None)
+            simulate_seconds += time.perf_counter() - started
+            if item is None:
+                break
+            positions, mapping = item
+            fresh = dict(zip(positions, parallel_calibration.split_kc_mapping(mapping, len(positions))))
+            simulation_cache_db.put_results({keys[i]: column for i, column in fresh.items()})
+            columns.update(fresh)
+            if on_points:
+                on_points(len(fresh))
+    finally:
+        # Stops outstanding jobs when on_points raises, e.g. on cancellation
+        results.close()
+    if missing:
+        simulation_cache_db.evict()
+
+    stats = {
+        "cache_hits": hits * len(storms_data),
+        "cache_misses": len(missing) * len(storms_data),
+        "simulate_seconds": simulate_seconds,
+    }
+    return columns, stats
+
+
+@_heartbeat
+def calibrate_kc(catg_data, storms_data, kc_min, kc_max, kc_step, m, initial_loss, continuous_loss, task_id, user_id=None, workers=1):
     """
     Calibrates the kc value based on provided data and updates the CALIBRATION_TASKS dictionary.
 
     Parameters:
-    - catg_data (bytes): Raw catchment file data in bytes format, will be decoded to ISO-8859-1
-    - storms_data (list[bytes]): List of raw storm file data in bytes format, will be decoded to ISO-8859-1
+    - catg_data (SpooledUpload | bytes | str): Catchment file, decoded from ISO-8859-1 when the task starts
+    - storms_data (list[SpooledUpload | bytes | str]): Storm files, decoded from ISO-8859-1 when the task starts
     - kc_min (float): Minimum kc value to test in calibration
     - kc_max (float): Maximum kc value to test in calibration  
     - kc_step (float): Step size between kc values to test
@@ -57,33 +214,188 @@ def calibrate_kc(catg_data, storms_data, kc_min, kc_max, kc_step, m, initial_los
     - initial_loss (float): The initial loss parameter for RORB model
     - continuous_loss (float): The continuous loss parameter for RORB model
     - task_id (str): Unique identifier for tracking this calibration task
+    - workers (int): Number of worker processes the kc grid is split across, 1 runs sequentially
 
     Returns:
     - None: Updates task status and results in database:
-        - Sets status to "in_progress" when starting
-        - Sets status to "completed" with rorb_kc_qmax_mapping results on success
+        - Sets status to "in_progress" when starting, then stores each finished batch of kc
+          results and the progress fraction as they complete; kc values already stored for
+          the task (when it is resumed) are not run again
+        - Stops after the current batch once the task is cancelled, billing only the kc values run
+        - Sets status to "completed" with rorb_kc_qmax_mapping results on success,
+          along with the worker count, wall-clock time, cache hit/miss counts and the
+          seconds spent decoding inputs (decode_seconds) vs running pyrorb (simulate_seconds)
         - Sets status to "error" with error message on failure
     """
     
 
-    catg_data = catg_data.decode('ISO-8859-1') if catg_data else None
-    storms_data = [storm.decode('ISO-8859-1') for storm in storms_data] if storms_data else []
-    kc_list = arange(kc_min, kc_max, kc_step)
+    started = time.perf_counter()
+    catg_data, storms_data = decode_uploads(catg_data, storms_data)
+    decode_seconds = time.perf_counter() - started
+    kc_list = kc_values(kc_min, kc_max, kc_step)
 
     simulation_count = len(storms_data)*len(kc_list)
 
-    calibration_kc_db.update_task(task_id, {"status": "in_progress", "user_id": user_id})
+    # Inputs and parameters are kept with the task so resume_calibration can restart it
+    inputs = input_blobs_db.save_blobs([catg_data, *storms_data])
+    record = {
+        "workers": workers,
+        "params": {"kc_min": kc_min, "kc_max": kc_max, "kc_step": kc_step, "m": m, "initial_loss": initial_loss, "continuous_loss": continuous_loss},
+        "inputs": {"catg_hash": inputs[0], "storm_hashes": inputs[1:]},
+        "total_kc": len(kc_list),
+        "decode_seconds": decode_seconds,
+    }
+
+    done = calibration_kc_db.get_kc_results(task_id)
+    progress = {"completed_kc": len(done)}
+
+    def update_progress():
+        calibration_kc_db.update_task(task_id, {**record, "status": "in_progress", "user_id": user_id,
+                                                "completed_kc": progress["completed_kc"],
+                                                "progress": progress["completed_kc"] / len(kc_list) if kc_list else 1.0})
+
+    def save_columns(columns):
+        calibration_kc_db.save_kc_results(task_id, columns)
+        progress["completed_kc"] += len(columns)
+        # Only the progress keys change, the rest of the record is already stored
+        status = calibration_kc_db.merge_task(task_id, {"completed_kc": progress["completed_kc"],
+                                                        "progress": progress["completed_kc"] / len(kc_list)})
+        if status == 'cancelled':
+            raise calibration_kc_db.TaskCancelled(task_id)
+
+    update_progress()
+
+    try:
+        started = time.perf_counter()
+        with metrics.timed(metrics.KC_CALIBRATION_SECONDS, mode='grid'):
+            kc_q_mapping, cache_stats = run_cached_kc_calibration(catg_data, storms_data, kc_list, m, initial_loss, continuous_loss, workers=workers, done=done, on_columns=save_columns, hashes=inputs)
+        wall_time = time.perf_counter() - started
+        calibration_kc_db.update_task(task_id, {**record, "status": "completed", "rorb_kc_qmax_mapping": kc_q_mapping, "user_id": user_id, "successful_simulation_count": simulation_count, "completed_kc": len(kc_list), "progress": 1.0, "wall_time_seconds": wall_time, **cache_stats})
+        # As on cancel, only the kc values this run computed are billed: a resume reserves just those
+        _settle(task_id, user_id, (len(kc_list) - len(done)) * len(storms_data))
+    except calibration_kc_db.TaskCancelled:
+        # Only the kc values this run got through are billed
+        _settle(task_id, user_id, (progress["completed_kc"] - len(done)) * len(storms_data))
+    except Exception as e:
+        calibration_kc_db.update_task(task_id, {**record, "status": "error", "error_message": str(e), "user_id": user_id, "successful_simulation_count": 0, "completed_kc": progress["completed_kc"]})
+        _settle(task_id, user_id, 0)
+
+
+@_heartbeat
+def calibrate_kc_adaptive(catg_data, storms_data, target_peaks, kc_min, kc_max, tolerance, max_evaluations, m, initial_loss, continuous_loss, task_id, user_id=None, target_key=None, workers=1):
+    """
+    Calibrates kc per storm with a bracketing search against target peaks and updates the task in the database.
+
+    Parameters:
+    - catg_data (SpooledUpload | bytes): Catchment file, decoded from ISO-8859-1 when the task starts
+    - storms_data (list[SpooledUpload | bytes]): Storm files, decoded from ISO-8859-1 when the task starts
+    - target_peaks (list[float]): Target peak per storm, or a single value shared by all storms
+    - kc_min (float): Lower end of the kc search interval
+    - kc_max (float): Upper end of the kc search interval
+    - tolerance (float): kc precision at which a storm's search stops
+    - max_evaluations (int): Maximum number of RORB runs per storm
+    - m (float): The m parameter value for RORB model
+    - initial_loss (float): The initial loss parameter for RORB model
+    - continuous_loss (float): The continuous loss parameter for RORB model
+    - task_id (str): Unique identifier for tracking this calibration task
+    - target_key (str): Hydrograph to match, defaults to the first one in the results
+    - workers (int): Number of worker processes storms are spread across
+
+    Returns:
+    - None: Updates task status and results in database:
+        - Sets status to "in_progress" when starting
+        - Sets status to "completed" with the per-storm kc_search results and the number
+          of simulations actually run, which is also what gets billed
+        - Leaves a cancelled task as it is, billing only the RORB runs made before the
+          searches saw the cancellation
+        - Sets status to "error" with error message on failure
+    """
+    catg_data, storms_data = decode_uploads(catg_data, storms_data)
+
+    calibration_kc_db.update_task(task_id, {"status": "in_progress", "user_id": user_id, "search_mode": "adaptive", "workers": workers})
+    # A partial of a module-level function, so worker processes can run the check too
+    cancelled = functools.partial(calibration_kc_db.task_cancelled, task_id)
 
     try:
-        kc_q_mapping = kc_calibration.kc_calibration(catg_data, storms_data, kc_list, m, initial_loss, continuous_loss)
-        calibration_kc_db.update_task(task_id, {"status": "completed", "rorb_kc_qmax_mapping": kc_q_mapping, "user_id": user_id, "successful_simulation_count": simulation_count})
-        accounting.update_simulation_count(user_id, simulation_count)
+        started = time.perf_counter()
+        with metrics.timed(metrics.KC_CALIBRATION_SECONDS, mode='adaptive'):
+            searches = kc_search.adaptive_kc_search(catg_data, storms_data, target_peaks, kc_min, kc_max, m, initial_loss, continuous_loss,
+                                                    tolerance, max_evaluations, target_key=target_key, workers=workers,
+                                                    should_stop=cancelled)
+        wall_time = time.perf_counter() - started
+        simulation_count = sum(search['evaluations'] for search in searches)
+        if any(search['stopped'] for search in searches):
+            _settle(task_id, user_id, simulation_count)
+            return
+        calibration_kc_db.update_task(task_id, {"status": "completed", "search_mode": "adaptive", "kc_search": searches, "user_id": user_id, "successful_simulation_count": simulation_count, "workers": workers, "wall_time_seconds": wall_time})
+        _settle(task_id, user_id, simulation_count)
     except Exception as e:
         calibration_kc_db.update_task(task_id, {"status": "error", "error_message": str(e), "user_id": user_id, "successful_simulation_count": 0})
+        _settle(task_id, user_id, 0)
+
+
+@_heartbeat
+def sweep_parameters(catg_data, storms_data, points, layout, task_id, user_id=None, workers=1):
+    """
+    Runs a kc x m x initial loss x continuous loss sweep and updates the task in the database.
+
+    Parameters:
+    - catg_data (SpooledUpload | bytes): Catchment file, decoded from ISO-8859-1 when the task starts
+    - storms_data (list[SpooledUpload | bytes]): Storm files, decoded from ISO-8859-1 when the task starts
+    - points (list[tuple]): (kc, m, initial_loss, continuous_loss) per point, from sweep.build_sweep
+    - layout (dict): How the result arrays are indexed, from sweep.build_sweep
+    - task_id (str): Unique identifier for tracking this sweep task
+    - workers (int): Number of worker processes the points are spread across
+
+    Returns:
+    - None: Updates task status and results in database:
+        - Sets status to "in_progress" when starting, then the progress fraction as points finish
+        - Stops after the current batch once the task is cancelled, billing only the points run
+        - Sets status to "completed" with the layout and a flat array per hydrograph and field
+          under "sweep" (see api.lib.sweep), along with cache hit/miss counts and timings
+        - Sets status to "error" with error message on failure
+    """
+    started = time.perf_counter()
+    catg_data, storms_data = decode_uploads(catg_data, storms_data)
+    decode_seconds = time.perf_counter() - started
+    simulation_count = len(storms_data) * len(points)
+
+    # One copy of the inputs, however many points reference them
+    inputs = input_blobs_db.save_blobs([catg_data, *storms_data])
+    record = {
+        "search_mode": "sweep",
+        "workers": workers,
+        "inputs": {"catg_hash": inputs[0], "storm_hashes": inputs[1:]},
+        "total_points": len(points),
+        "decode_seconds": decode_seconds,
+    }
+    calibration_kc_db.update_task(task_id, {**record, "status": "in_progress", "user_id": user_id, "completed_points": 0, "progress": 0.0})
+    progress = {"completed_points": 0}
+
+    def update_progress(count):
+        progress["completed_points"] += count
+        status = calibration_kc_db.merge_task(task_id, {"completed_points": progress["completed_points"],
+                                                        "progress": progress["completed_points"] / len(points)})
+        if status == 'cancelled':
+            raise calibration_kc_db.TaskCancelled(task_id)
+
+    try:
+        started = time.perf_counter()
+        with metrics.timed(metrics.KC_CALIBRATION_SECONDS, mode='sweep'):
+            columns, cache_stats = run_cached_sweep(catg_data, storms_data, points, workers=workers, hashes=inputs, on_points=update_progress)
+        wall_time = time.perf_counter() - started
+        result = {**layout, "hydrographs": sweep.to_arrays(columns, len(points))}
+        calibration_kc_db.update_task(task_id, {**record, "status": "completed", "sweep": result, "user_id": user_id, "successful_simulation_count": simulation_count, "completed_points": len(points), "progress": 1.0, "wall_time_seconds": wall_time, **cache_stats})
+        _settle(task_id, user_id, simulation_count)
+    except calibration_kc_db.TaskCancelled:
+        _settle(task_id, user_id, progress["completed_points"] * len(storms_data))
+    except Exception as e:
+        calibration_kc_db.update_task(task_id, {**record, "status": "error", "error_message": str(e), "user_id": user_id, "successful_simulation_count": 0, "completed_points": progress["completed_points"]})
+        _settle(task_id, user_id, 0)
 
 
 # API endpoints
-def start_calibration(
+async def start_calibration(
     credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
     catg: UploadFile|None = None,
     storms: Optional[List[UploadFile]] = File(None),
@@ -93,18 +405,68 @@ def start_calibration(
     m: float = Form(...),
     initialLoss: float = Form(...),
     continuousLoss: float = Form(...),
+    workers: Optional[int] = Form(None),
+    searchMode: str = Form('grid'),
+    targetPeaks: Optional[List[float]] = Form(None),
+    targetKey: Optional[str] = Form(None),
+    tolerance: Optional[float] = Form(None),
+    maxEvaluations: int = Form(kc_search.DEFAULT_MAX_EVALUATIONS, ge=1),
     background_tasks: BackgroundTasks = BackgroundTasks(),
 ):
     token = credentials.credentials
-    user_id = auth.user_id_from_token(token)
+    user_id = await run_in_threadpool(auth.user_id_from_token, token)
 
-    catg_content, storms_content = asyncio.run(read_content(catg, storms))
+    if searchMode not in ('grid', 'adaptive'):
+        return JSONResponse(content={"message": f"Unknown search mode: {searchMode}"}, status_code=400)
+    if searchMode == 'adaptive' and not targetPeaks:
+        return JSONResponse(content={"message": "Adaptive search requires targetPeaks"}, status_code=400)
+    if kcStep <= 0 or kcMax < kcMin:
+        return JSONResponse(content={"message": "kcStep must be positive and kcMax at least kcMin"}, status_code=400)
 
-    print(f"Catg content: {catg_content}")
-    print(f"Storms content: {storms_content}")
+    catg_content, storms_content = await ingest_uploads(catg, storms)
+    logging.debug("Received catchment %r and %d storm files", catg_content, len(storms_content))
+
+    # Reserved up front so a user cannot start more simulations than their limit allows
+    if searchMode == 'adaptive':
+        reserved = len(storms_content) * maxEvaluations
+    else:
+        reserved = len(storms_content) * kc_count(kcMin, kcMax, kcStep)
+    try:
+        await run_in_threadpool(accounting.reserve_simulations, user_id, reserved)
+    except accounting.QuotaExceededError as e:
+        close_uploads([catg_content, *storms_content])
+        return quota_exceeded_response(e)
+    except Exception:
+        close_uploads([catg_content, *storms_content])
+        raise
+
+    try:
+        task_id = await run_in_threadpool(calibration_kc_db.new_task, user_id=user_id, reserved_simulations=reserved)
+    except Exception:
+        close_uploads([catg_content, *storms_content])
+        await run_in_threadpool(accounting.record_simulations, user_id, 0, released_simulations=reserved, flush=True)
+        raise
+
+    if searchMode == 'adaptive':
+        background_tasks.add_task(
+            calibrate_kc_adaptive,
+            catg_content,
+            storms_content,
+            targetPeaks,
+            kcMin,
+            kcMax,
+            tolerance or kcStep,
+            maxEvaluations,
+            m,
+            initialLoss,
+            continuousLoss,
+            task_id=task_id,
+            user_id=user_id,
+            target_key=targetKey,
+            workers=parallel_calibration.resolve_workers(workers),
+        )
+        return JSONResponse(content={"message": "Calibration started", "task_id": task_id, "time": str(datetime.now())})
 
-    task_id = calibration_kc_db.new_task(user_id=user_id)
-    
     background_tasks.add_task(
         calibrate_kc, 
         catg_content, 
@@ -116,22 +478,312 @@ def start_calibration(
         initialLoss, 
         continuousLoss, 
         task_id=task_id, 
-        user_id=user_id
+        user_id=user_id,
+        workers=parallel_calibration.resolve_workers(workers),
     )
     return JSONResponse(content={"message": "Calibration started", "task_id": task_id, "time": str(datetime.now())})
 
 
-def get_calibration_status(task_id: str):
-    """Get the status of a calibration task."""
-    print(f"Checking calibration status for task: {task_id}")
-    print(f"Available tasks: {calibration_kc_db.get_all_tasks()}")
-    
+async def start_sweep(
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
+    catg: UploadFile|None = None,
+    storms: Optional[List[UploadFile]] = File(None),
+    kc: str = Form(...),
+    m: str = Form(...),
+    initialLoss: str = Form(...),
+    continuousLoss: str = Form(...),
+    mode: str = Form('grid'),
+    samples: Optional[int] = Form(None),
+    seed: Optional[int] = Form(None),
+    workers: Optional[int] = Form(None),
+    background_tasks: BackgroundTasks = BackgroundTasks(),
+):
+    """
+    Start a sweep over kc, m, initialLoss and continuousLoss as one task.
+
+    Each parameter is a JSON number, list of numbers or {"min", "max", "step"} object.
+    mode 'grid' runs their cartesian product, 'lhs' a Latin hypercube sample of
+    `samples` points (ranges need no step). Results are in the task's "sweep" entry.
+    """
+    token = credentials.credentials
+    user_id = await run_in_threadpool(auth.user_id_from_token, token)
+
+    try:
+        axes = [sweep.parse_axis(name, value) for name, value in zip(sweep.AXES, (kc, m, initialLoss, continuousLoss))]
+        points, layout = sweep.build_sweep(mode, axes, samples=samples, seed=seed)
+    except ValueError as e:
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+
+    catg_content, storms_content = await ingest_uploads(catg, storms)
+
+    reserved = len(storms_content) * len(points)
+    try:
+        await run_in_threadpool(accounting.reserve_simulations, user_id, reserved)
+    except accounting.QuotaExceededError as e:
+        close_uploads([catg_content, *storms_content])
+        return quota_exceeded_response(e)
+    except Exception:
+        close_uploads([catg_content, *storms_content])
+        raise
+
+    try:
+        task_id = await run_in_threadpool(calibration_kc_db.new_task, user_id=user_id, reserved_simulations=reserved)
+    except Exception:
+        close_uploads([catg_content, *storms_content])
+        await run_in_threadpool(accounting.record_simulations, user_id, 0, released_simulations=reserved, flush=True)
+        raise
+
+    background_tasks.add_task(
+        sweep_parameters,
+        catg_content,
+        storms_content,
+        points,
+        layout,
+        task_id=task_id,
+        user_id=user_id,
+        workers=parallel_calibration.resolve_workers(workers),
+    )
+    return JSONResponse(content={"message": "Sweep started", "task_id": task_id, "points": len(points), "time": str(datetime.now())})
+
+
+def _has_partial_results(task):
+    return task is not None and task['status'] != 'completed' and 'total_kc' in task
+
+
+def _add_partial_results(task, stored):
+    if stored:
+        task['rorb_kc_qmax_mapping'] = parallel_calibration.merge_kc_mappings(stored[i] for i in sorted(stored))
+    return task
+
+
+def load_task_status(task_id):
+    """Return the task, with the kc results stored so far as rorb_kc_qmax_mapping while it is unfinished."""
+    task = calibration_kc_db.get_task(task_id)
+    if _has_partial_results(task):
+        _add_partial_results(task, calibration_kc_db.get_kc_results(task_id))
+    return task
+
+
+async def load_task_status_async(task_id):
+    """load_task_status on the async pool, so status polls do not hold a threadpool slot."""
+    task = await calibration_kc_db.get_task_async(task_id)
+    if _has_partial_results(task):
+        _add_partial_results(task, await calibration_kc_db.get_kc_results_async(task_id))
+    return task
+
+
+def resume_calibration(
+    task_id: str,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
+    background_tasks: BackgroundTasks = BackgroundTasks(),
+):
+    """
+    Restart an interrupted grid calibration, running only the kc values it has not stored yet.
+
+    Only failed tasks and tasks whose run stopped sending heartbeats can be resumed; the
+    reservation the interrupted run held is released and a new one made for the rest.
+    """
+    token = credentials.credentials
+    user_id = auth.user_id_from_token(token)
+
     task = calibration_kc_db.get_task(task_id)
+    if task is None or task['user_id'] != user_id:
+        return JSONResponse(content={"message": "Task ID not found", "task_id": task_id}, status_code=404)
+    if task['status'] == 'completed':
+        return JSONResponse(content={"message": "Task already completed", "task_id": task_id}, status_code=409)
+    if task['status'] == 'cancelled':
+        return JSONResponse(content={"message": "Task was cancelled", "task_id": task_id}, status_code=409)
+    if 'params' not in task or 'inputs' not in task:
+        return JSONResponse(content={"message": "Task cannot be resumed", "task_id": task_id}, status_code=409)
+
+    if task['status'] not in FINAL_STATUSES and not calibration_kc_db.task_is_stale(task_id):
+        return JSONResponse(content={"message": "Task is still running", "task_id": task_id}, status_code=409)
+
+    inputs = task['inputs']
+    params = task['params']
+    blobs = input_blobs_db.get_blobs([inputs['catg_hash'], *inputs['storm_hashes']])
+    if any(blob_hash is not None and blob_hash not in blobs for blob_hash in [inputs['catg_hash'], *inputs['storm_hashes']]):
+        return JSONResponse(content={"message": "Task inputs are no longer stored", "task_id": task_id}, status_code=409)
+
+    total_kc = kc_count(params['kc_min'], params['kc_max'], params['kc_step'])
+    reserved = len(inputs['storm_hashes']) * max(total_kc - task.get('completed_kc', 0), 0)
+    try:
+        accounting.reserve_simulations(user_id, reserved)
+    except accounting.QuotaExceededError as e:
+        return quota_exceeded_response(e)
+
+    # Atomic, so of two concurrent resumes only one starts a run
+    previous = calibration_kc_db.claim_task(task_id, reserved)
+    if previous is None:
+        accounting.record_simulations(user_id, 0, released_simulations=reserved, flush=True)
+        return JSONResponse(content={"message": "Task is still running", "task_id": task_id}, status_code=409)
+    # The interrupted run never released its reservation
+    if previous:
+        accounting.record_simulations(user_id, 0, released_simulations=previous, flush=True)
+
+    background_tasks.add_task(
+        calibrate_kc,
+        blobs.get(inputs['catg_hash']),
+        [blobs[storm_hash] for storm_hash in inputs['storm_hashes']],
+        params['kc_min'],
+        params['kc_max'],
+        params['kc_step'],
+        params['m'],
+        params['initial_loss'],
+        params['continuous_loss'],
+        task_id=task_id,
+        user_id=user_id,
+        workers=task.get('workers', 1),
+    )
+    return JSONResponse(content={"message": "Calibration resumed", "task_id": task_id, "completed_kc": task.get('completed_kc', 0), "time": str(datetime.now())})
+
+
+def cancel_calibration(
+    task_id: str,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
+):
+    """
+    Cancel a calibration, sweep or queued simulation task.
+
+    Running calibrations stop after their current batch, queued simulations that no
+    worker has claimed yet are cancelled, and only simulations that ran are billed.
+    """
+    token = credentials.credentials
+    user_id = auth.user_id_from_token(token)
+
+    task = calibration_kc_db.get_task(task_id, fields=[])
+    if task is None or task['user_id'] != user_id:
+        return JSONResponse(content={"message": "Task ID not found", "task_id": task_id}, status_code=404)
+    if not calibration_kc_db.cancel_task(task_id):
+        return JSONResponse(content={"message": "Task already finished", "task_id": task_id, "status": task['status']}, status_code=409)
+
+    cancelled = SimulationDB().cancel_pending(task_id)
+    if cancelled:
+        accounting.record_simulations(user_id, 0, released_simulations=cancelled, flush=True)
+    return JSONResponse(content={"message": "Calibration cancelled", "task_id": task_id, "cancelled_simulations": cancelled, "time": str(datetime.now())})
+
+
+async def get_calibration_status(task_id: str):
+    """Get the status of a calibration task, including partial results and progress while it runs."""
+    task = await load_task_status_async(task_id)
     if task is None:
         logging.warning(f"Task ID {task_id} not found")
         return JSONResponse(content={"message": "Task ID not found", "task_id": task_id}, status_code=404)
     
     result = task
-    print(f"Retrieved status for task {task_id}: {result}")
     result.pop('user_id', None)  # Remove user_id from response
     return JSONResponse(content={"message": "Calibration status", "task_id": task_id, 'result': result})
+
+
+def get_calibration_results(task_id: str, kcMin: Optional[float] = None, kcMax: Optional[float] = None, hydroKey: Optional[str] = None):
+    """
+    Get the stored kc results of a grid calibration, optionally only a kc range and one hydrograph.
+
+    Unlike get_calibration_status this never loads the whole task, so clients can page
+    through the results of a large calibration.
+    """
+    task = calibration_kc_db.get_task(task_id, fields=['total_kc'])
+    if task is None:
+        logging.warning(f"Task ID {task_id} not found")
+        return JSONResponse(content={"message": "Task ID not found", "task_id": task_id}, status_code=404)
+
+    stored = calibration_kc_db.get_kc_results(task_id, kc_min=kcMin, kc_max=kcMax, hydro_key=hydroKey)
+    result = {
+        "status": task['status'],
+        "total_kc": task.get('total_kc'),
+        "rorb_kc_qmax_mapping": parallel_calibration.merge_kc_mappings(stored[i] for i in sorted(stored)),
+    }
+    return JSONResponse(content={"message": "Calibration results", "task_id": task_id, 'result': result})
+
+
+async def export_calibration_results(task_id: str, export_format: str = Query('csv', alias='format'), offset: int = 0):
+    """
+    Stream the results of a grid calibration or sweep as CSV, NDJSON or Parquet.
+
+    Rows are read from a server-side cursor and sent as they are encoded, so large
+    exports never sit in memory. offset skips that many rows, to resume an interrupted
+    download; CSV then leaves out the header so the rest can be appended.
+    """
+    if export_format not in export.EXPORT_FORMATS:
+        return JSONResponse(content={"message": f"format must be one of {export.EXPORT_FORMATS}"}, status_code=400)
+    if offset < 0:
+        return JSONResponse(content={"message": "offset must not be negative"}, status_code=400)
+    if export_format == 'parquet' and not export.HAS_PYARROW:
+        return JSONResponse(content={"message": "Parquet export is not available on this server"}, status_code=501)
+
+    task = await calibration_kc_db.get_task_async(task_id, fields=['search_mode', 'params', 'total_kc'])
+    if task is None:
+        logging.warning(f"Task ID {task_id} not found")
+        return JSONResponse(content={"message": "Task ID not found", "task_id": task_id}, status_code=404)
+    if export.export_kind(task) is None:
+        return JSONResponse(content={"message": "Only grid calibrations and sweeps can be exported", "task_id": task_id}, status_code=409)
+
+    chunks = export.iter_export(task_id, task, export_format, offset)
+    return StreamingResponse(
+        export.iterate_in_thread(chunks),
+        media_type=export.MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{task_id}.{export_format}"', "X-Export-Offset": str(offset)},
+    )
+
+
+async def _wait_for_task_change(task_id, version, timeout):
+    """
+    Return the task once its version differs from `version` or it reaches a final status,
+    or as it is when `timeout` seconds pass without a change. Returns None for unknown tasks.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        # Subscribe before reading so a change between the read and the wait still wakes us
+        with task_events.notifier.subscribe(task_id) as changed:
+            task = await load_task_status_async(task_id)
+            if task is None or task['version'] != version or task['status'] in FINAL_STATUSES:
+                return task
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return task
+            if not task_events.ensure_listener():
+                # Without LISTEN, changes made by other processes are only seen by re-reading
+                remaining = min(remaining, STATUS_RECHECK_SECONDS)
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def watch_calibration_status(task_id: str, version: Optional[int] = None, timeout: float = STATUS_WATCH_TIMEOUT):
+    """
+    Long-poll the status of a calibration task.
+
+    Responds as soon as the task's version differs from `version` (immediately when no
+    version is given), or with the unchanged task after `timeout` seconds.
+    """
+    timeout = max(0.0, min(timeout, STATUS_WATCH_TIMEOUT))
+    task = await _wait_for_task_change(task_id, version, timeout)
+    if task is None:
+        logging.warning(f"Task ID {task_id} not found")
+        return JSONResponse(content={"message": "Task ID not found", "task_id": task_id}, status_code=404)
+
+    task.pop('user_id', None)  # Remove user_id from response
+    return JSONResponse(content={"message": "Calibration status", "task_id": task_id, 'result': task})
+
+
+async def stream_calibration_status(task_id: str):
+    """Stream the status of a calibration task as server-sent events until it reaches a final status."""
+
+    async def events():
+        version = None
+        while True:
+            task = await _wait_for_task_change(task_id, version, STATUS_WATCH_TIMEOUT)
+            if task is None:
+                yield f"event: error\ndata: {json.dumps({'message': 'Task ID not found', 'task_id': task_id})}\n\n"
+                return
+            if task['version'] == version and task['status'] not in FINAL_STATUSES:
+                yield ": keep-alive\n\n"
+                continue
+            version = task['version']
+            task.pop('user_id', None)
+            yield f"event: status\ndata: {json.dumps(task)}\n\n"
+            if task['status'] in FINAL_STATUSES:
+                return
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
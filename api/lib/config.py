@@ -0,0 +1,37 @@
+"""
+Environment configuration, loaded once per process.
+
+Importing this module loads the .env files into os.environ (variables already set in the
+environment win). Modules read their settings from os.environ at import time, so api/index.py
+imports it first, and auth and db.connection import it for the CLIs and benchmarks, which
+reach every setting through them.
+
+Functions:
+    - load() -> None: Load ENV_FILES into os.environ, once
+"""
+
+import threading
+
+import dotenv
+
+# Local overrides first: load_dotenv never overrides a variable that is already set
+ENV_FILES = ('.env.local', '.env.development.local')
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load():
+    """Load ENV_FILES into os.environ; later calls do nothing."""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if _loaded:
+            return
+        for path in ENV_FILES:
+            dotenv.load_dotenv(path)
+        _loaded = True
+
+
+load()
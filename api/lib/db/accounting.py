@@ -1,109 +1,221 @@
+import atexit
+import logging
 import os
-import psycopg2
-import json
-import dotenv
+import threading
+import time
 
-dotenv.load_dotenv('.env.development.local')
+from api.lib import metrics
+from api.lib.db import async_connection
+from api.lib.db.connection import is_sqlite, transaction
+from api.lib.db.schema import add_column
 
 DEFAULT_SIMULATION_LIMIT = 1_000_000 # number of simulations per user
+# Seconds between write-behind flushes of recorded usage, 0 writes every record through immediately
+FLUSH_INTERVAL = float(os.environ.get('ACCOUNTING_FLUSH_SECONDS', 5))
+
+_SELECT_USAGE = "SELECT total_simulations, simulation_limit, reserved_simulations FROM user_accounting WHERE user_id = %s"
+_INSERT_ACCOUNTING = "INSERT INTO user_accounting (user_id, simulation_limit) VALUES (%s, %s) ON CONFLICT DO NOTHING"
+
+
+class QuotaExceededError(Exception):
+    """Raised when a reservation would take a user past their simulation_limit."""
+
+    def __init__(self, user_id, requested, remaining):
+        super().__init__(f"User {user_id} requested {requested} simulations but has {remaining} remaining")
+        self.requested = requested
+        self.remaining = remaining
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['POSTGRES_URL'])
 
 def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Create user accounting table if it doesn't exist
-    cur.execute(f"""
-        CREATE TABLE IF NOT EXISTS user_accounting (
-            user_id VARCHAR(255) PRIMARY KEY,
-            total_simulations INT DEFAULT 0,
-            simulation_limit INT DEFAULT {DEFAULT_SIMULATION_LIMIT},
-            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+    with transaction() as cur:
+        # Create user accounting table if it doesn't exist
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS user_accounting (
+                user_id VARCHAR(255) PRIMARY KEY,
+                total_simulations INT DEFAULT 0,
+                simulation_limit INT DEFAULT {DEFAULT_SIMULATION_LIMIT},
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Simulations of started tasks that are not billed yet, they count against the limit
+        add_column(cur, 'user_accounting', 'reserved_simulations', "INT NOT NULL DEFAULT 0")
 
+@metrics.db_call
 def get_user_accounting(user_id):
-    conn = get_db_connection()
-    cur = conn.cursor()    
-    cur.execute(
-        "SELECT total_simulations, simulation_limit FROM user_accounting WHERE user_id = %s",
-        (user_id,)
-    )
+    """Read a user's usage; users without a row yet get the defaults, the row is created by the first write."""
+    with transaction() as cur:
+        cur.execute(_SELECT_USAGE, (user_id,))
+        return _usage(user_id, cur.fetchone())
 
-    result = cur.fetchone()
 
-    if not result:
-        create_user_accounting(user_id)
-        result = cur.fetchone()
-    cur.close()
-    conn.close()
+@metrics.db_call
+@async_connection.fallback(get_user_accounting)
+async def get_user_accounting_async(user_id):
+    """get_user_accounting on the async pool."""
+    async with async_connection.transaction() as cur:
+        await cur.execute(_SELECT_USAGE, (user_id,))
+        return _usage(user_id, cur.fetchone())
 
 
+def _usage(user_id, row):
+    total_simulations, simulation_limit, reserved_simulations = row or (0, DEFAULT_SIMULATION_LIMIT, 0)
+    # Usage recorded by this process but not flushed yet
+    used, released = usage_buffer.pending(user_id)
+    total_simulations += used
+    reserved_simulations = max(reserved_simulations - released, 0)
     return {
-        'total_simulations': result[0],
-        'simulation_limit': result[1],
-        'remaining_simulations': result[1] - result[0]
+        'total_simulations': total_simulations,
+        'simulation_limit': simulation_limit,
+        'reserved_simulations': reserved_simulations,
+        'remaining_simulations': simulation_limit - total_simulations - reserved_simulations
     }
 
+def _create_user_accounting(cur, user_id, simulation_limit=DEFAULT_SIMULATION_LIMIT):
+    cur.execute(_INSERT_ACCOUNTING, (user_id, simulation_limit))
+
+@metrics.db_call
 def create_user_accounting(user_id, simulation_limit=DEFAULT_SIMULATION_LIMIT):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute(
-        "INSERT INTO user_accounting (user_id, simulation_limit) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-        (user_id, simulation_limit)
-    )
-    
-    conn.commit()
-    cur.close()
-    conn.close()
-
-def update_simulation_count(user_id, simulation_count):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute(
-        """
-        INSERT INTO user_accounting (user_id, total_simulations) 
-        VALUES (%s, %s)
-        ON CONFLICT (user_id) 
-        DO UPDATE SET 
-            total_simulations = user_accounting.total_simulations + %s,
-            last_updated = CURRENT_TIMESTAMP
-        """,
-        (user_id, simulation_count, simulation_count)
-    )
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+    with transaction() as cur:
+        _create_user_accounting(cur, user_id, simulation_limit)
+
+@metrics.db_call
+def reserve_simulations(user_id, count):
+    """
+    Reserve count simulations against the user's limit before any of them are queued.
+
+    The check and the reservation are one conditional UPDATE, so concurrent requests
+    cannot both pass the check. Raises QuotaExceededError when the limit would be exceeded.
+    """
+    if count <= 0:
+        return
+    with transaction() as cur:
+        _create_user_accounting(cur, user_id)
+        cur.execute(
+            """
+            UPDATE user_accounting
+            SET reserved_simulations = reserved_simulations + %s
+            WHERE user_id = %s AND total_simulations + reserved_simulations + %s <= simulation_limit
+            """,
+            (count, user_id, count)
+        )
+        if cur.rowcount:
+            return
+        cur.execute(
+            "SELECT simulation_limit - total_simulations - reserved_simulations FROM user_accounting WHERE user_id = %s",
+            (user_id,)
+        )
+        remaining = cur.fetchone()[0]
+    raise QuotaExceededError(user_id, count, remaining)
+
+@metrics.db_call
+def update_simulation_count(user_id, simulation_count, released_simulations=0):
+    """Bill simulation_count simulations and release released_simulations of the user's reservation."""
+    _apply_usage([(user_id, simulation_count, released_simulations)])
+
+def _apply_usage(rows):
+    greatest = "MAX" if is_sqlite() else "GREATEST"
+    with transaction() as cur:
+        cur.executemany(
+            f"""
+            INSERT INTO user_accounting (user_id, total_simulations)
+            VALUES (%s, %s)
+            ON CONFLICT (user_id)
+            DO UPDATE SET
+                total_simulations = user_accounting.total_simulations + %s,
+                reserved_simulations = {greatest}(user_accounting.reserved_simulations - %s, 0),
+                last_updated = CURRENT_TIMESTAMP
+            """,
+            [(user_id, used, used, released) for user_id, used, released in rows]
+        )
+
 
+class UsageBuffer:
+    """
+    Write-behind buffer of billed simulations.
+
+    record() only adds to in-memory totals per user; a daemon thread applies them every
+    FLUSH_INTERVAL seconds in a single transaction, and whatever is left is flushed at exit.
+    A serverless invocation can be frozen or dropped without exiting, so requests and tasks
+    flush what they recorded before they finish.
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._pid = None
+
+    def record(self, user_id, used, released=0):
+        if self.interval <= 0:
+            update_simulation_count(user_id, used, released)
+            return
+        with self._lock:
+            totals = self._pending.setdefault(user_id, [0, 0])
+            totals[0] += used
+            totals[1] += released
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='accounting-flush', daemon=True)
+                self._thread.start()
+
+    def pending(self, user_id):
+        with self._lock:
+            used, released = self._pending.get(user_id, (0, 0))
+        return used, released
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            _apply_usage([(user_id, used, released) for user_id, (used, released) in pending.items()])
+        except Exception as e:
+            logging.warning(f"Accounting flush failed, retrying later: {e}")
+            with self._lock:
+                for user_id, (used, released) in pending.items():
+                    totals = self._pending.setdefault(user_id, [0, 0])
+                    totals[0] += used
+                    totals[1] += released
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+usage_buffer = UsageBuffer()
+atexit.register(usage_buffer.flush)
+
+
+def record_simulations(user_id, simulation_count, released_simulations=0, flush=False):
+    """
+    Bill simulations through the write-behind buffer, releasing the given part of the reservation.
+
+    flush=True writes everything buffered before returning, for callers about to finish a
+    request or task; long-running processes leave it to the flush thread.
+    """
+    usage_buffer.record(user_id, simulation_count, released_simulations)
+    if flush:
+        usage_buffer.flush()
+
+@metrics.db_call
 def update_simulation_limit(user_id, new_limit):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute(
-        "UPDATE user_accounting SET simulation_limit = %s WHERE user_id = %s",
-        (new_limit, user_id)
-    )
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+    with transaction() as cur:
+        # Reads no longer create the row, so a user may not have one yet
+        cur.execute(
+            """
+            INSERT INTO user_accounting (user_id, simulation_limit)
+            VALUES (%s, %s)
+            ON CONFLICT (user_id) DO UPDATE SET simulation_limit = %s
+            """,
+            (user_id, new_limit, new_limit)
+        )
 
 def reset_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DROP TABLE IF EXISTS user_accounting")
-    conn.commit()
-    cur.close()
-    conn.close()
+    with transaction() as cur:
+        cur.execute("DROP TABLE IF EXISTS user_accounting")
     init_db()
 
 if __name__ == "__main__":
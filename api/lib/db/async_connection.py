@@ -0,0 +1,163 @@
+"""
+Async Postgres pool (asyncpg) for the read paths of high-concurrency endpoints.
+
+The status, watch and accounting endpoints are polled by many clients at once. Running
+them on psycopg2 holds a threadpool slot for every database round trip, so request
+concurrency is capped by the threadpool size; on this pool they only hold a connection.
+
+Queries are written as for psycopg2 (%s placeholders) and translated to asyncpg's $n,
+so async readers share their SQL with the sync ones. JSON/JSONB columns are decoded and
+UUIDs returned as text, as psycopg2 does.
+
+With DATABASE_BACKEND=sqlite, DATABASE_ASYNC=0 or asyncpg not installed, enabled() is
+False and fallback() runs the sync reader in a worker thread instead.
+
+Functions:
+    - enabled() -> bool: Whether async readers use this pool
+    - get_pool() -> asyncpg.Pool: This event loop's pool, created on first use
+    - transaction() -> async context manager yielding an AsyncCursor in a transaction
+    - fallback(sync_fn) -> decorator running sync_fn in a worker thread when not enabled()
+    - pool_stats() -> dict: Size, idle and max size of the pool
+    - close_pool(): Close the pool (async)
+"""
+
+import asyncio
+import functools
+import importlib.util
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+from api.lib.db.connection import POOL_TIMEOUT, is_sqlite
+
+# asyncpg itself is imported with the first pool, to keep it out of cold starts
+HAS_ASYNCPG = importlib.util.find_spec('asyncpg') is not None
+
+ASYNC_POOL_MIN_SIZE = int(os.environ.get('POSTGRES_ASYNC_POOL_MIN_SIZE', 1))
+ASYNC_POOL_MAX_SIZE = int(os.environ.get('POSTGRES_ASYNC_POOL_MAX_SIZE', 20))
+# Prepared statements break behind pgbouncer in transaction mode (e.g. pooled POSTGRES_URLs),
+# raise it for direct connections
+STATEMENT_CACHE_SIZE = int(os.environ.get('POSTGRES_ASYNC_STATEMENT_CACHE_SIZE', 0))
+DATABASE_ASYNC = os.environ.get('DATABASE_ASYNC', '1') != '0'
+
+# (event loop, pid, task creating the pool): asyncpg pools are bound to the loop that made them
+_pool = None
+
+
+def enabled():
+    return DATABASE_ASYNC and HAS_ASYNCPG and not is_sqlite()
+
+
+@functools.lru_cache(maxsize=256)
+def translate(query):
+    """Rewrite %s placeholders as $1, $2, ..."""
+    first, *rest = query.split('%s')
+    return first + ''.join(f'${i}{part}' for i, part in enumerate(rest, 1))
+
+
+async def _init_connection(conn):
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def _create_pool():
+    import asyncpg
+    return await asyncpg.create_pool(
+        os.environ['POSTGRES_URL'],
+        min_size=ASYNC_POOL_MIN_SIZE,
+        max_size=ASYNC_POOL_MAX_SIZE,
+        statement_cache_size=STATEMENT_CACHE_SIZE,
+        init=_init_connection,
+    )
+
+
+async def get_pool():
+    """Return this event loop's pool, creating it on first use (and again in a new loop or after a fork)."""
+    global _pool
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool[0] is not loop or _pool[1] != os.getpid():
+        # Concurrent first requests await the same task instead of each creating a pool
+        _pool = (loop, os.getpid(), loop.create_task(_create_pool()))
+    creating = _pool
+    try:
+        return await creating[2]
+    except Exception:
+        if _pool is creating:
+            _pool = None
+        raise
+
+
+def _row(record):
+    return tuple(str(value) if isinstance(value, uuid.UUID) else value for value in record)
+
+
+class AsyncCursor:
+    """The part of a psycopg2 cursor the readers use: await execute(), then fetchone() / fetchall()."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+        self._position = 0
+
+    async def execute(self, query, params=()):
+        self._rows = await self.conn.fetch(translate(query), *params)
+        self._position = 0
+
+    def fetchone(self):
+        if self._position >= len(self._rows):
+            return None
+        self._position += 1
+        return _row(self._rows[self._position - 1])
+
+    def fetchall(self):
+        rows = [_row(record) for record in self._rows[self._position:]]
+        self._position = len(self._rows)
+        return rows
+
+
+@asynccontextmanager
+async def transaction():
+    """Yield an AsyncCursor on a pooled connection; commit when the block succeeds, roll back otherwise."""
+    pool = await get_pool()
+    async with pool.acquire(timeout=POOL_TIMEOUT) as conn:
+        async with conn.transaction():
+            yield AsyncCursor(conn)
+
+
+def fallback(sync_fn):
+    """Decorate an async reader to run sync_fn, with the same arguments, in a worker thread when not enabled()."""
+
+    # The async reader is timed by its own metrics.db_call, so the fallback skips sync_fn's
+    untimed = getattr(sync_fn, 'untimed', sync_fn)
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not enabled():
+                return await asyncio.to_thread(untimed, *args, **kwargs)
+            return await fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def _current_pool():
+    if _pool is None or not _pool[2].done() or _pool[2].cancelled() or _pool[2].exception():
+        return None
+    return _pool[2].result()
+
+
+def pool_stats():
+    pool = _current_pool()
+    if pool is None:
+        return {}
+    return {'size': pool.get_size(), 'idle': pool.get_idle_size(), 'max_size': pool.get_max_size()}
+
+
+async def close_pool():
+    global _pool
+    pool = _current_pool()
+    _pool = None
+    if pool is not None:
+        await pool.close()
@@ -1,126 +1,539 @@
-import uuid
+import itertools
+import logging
+import math
 import os
-import psycopg2
-import json
+import uuid
+from datetime import datetime, timedelta, timezone
 
+from psycopg2.extras import Json
 
-import dotenv
-dotenv.load_dotenv('.env.development.local')
+from api.lib import metrics
+from api.lib.db import async_connection
+from api.lib.db.connection import connection, execute_values, is_sqlite, json_value, transaction
+from api.lib.db.schema import add_column, ensure_jsonb, json_type
+from api.lib.task_events import notifier, publish_task_changed
+
+FINAL_STATUSES = ('completed', 'error', 'cancelled')
+# Rows fetched per round trip by the export cursors
+EXPORT_FETCH_SIZE = int(os.environ.get('EXPORT_FETCH_SIZE', 1000))
+# A running task refreshes heartbeat_at this often; one silent for TASK_STALE_SECONDS is taken for dead
+TASK_HEARTBEAT_SECONDS = float(os.environ.get('TASK_HEARTBEAT_SECONDS', 30))
+TASK_STALE_SECONDS = float(os.environ.get('TASK_STALE_SECONDS', 300))
 
-# Ensure the database is initialized before performing any operations
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['POSTGRES_URL'])
+class TaskCancelled(Exception):
+    """Raised inside a running task once it has been cancelled, to stop it between batches."""
 
 
+# Ensure the database is initialized before performing any operations
+
 def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Create tasks table if it doesn't exist
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS calibration_tasks (
-            task_id UUID PRIMARY KEY,
-            task_data TEXT,
-            status VARCHAR(50) NOT NULL DEFAULT 'pending',
-            user_id VARCHAR(255),
-            successful_simulation_count INT DEFAULT 0
-        )
-    """)
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+    with transaction() as cur:
+        # Create tasks table if it doesn't exist
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS calibration_tasks (
+                task_id UUID PRIMARY KEY,
+                task_data {json_type()},
+                status VARCHAR(50) NOT NULL DEFAULT 'pending',
+                user_id VARCHAR(255),
+                successful_simulation_count INT DEFAULT 0
+            )
+        """)
+        # Bumped on every change so status watchers can tell whether anything happened
+        add_column(cur, 'calibration_tasks', 'version', "INT NOT NULL DEFAULT 0")
+
+        # Per-kc results stored while a calibration runs, for partial results and resuming
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS calibration_task_results (
+                task_id UUID NOT NULL,
+                kc_index INT NOT NULL,
+                kc FLOAT NOT NULL,
+                mapping {json_type()} NOT NULL,
+                PRIMARY KEY (task_id, kc_index)
+            )
+        """)
+        # Simulations the task's current run holds reserved, and when that run last showed it is alive
+        add_column(cur, 'calibration_tasks', 'reserved_simulations', "INT NOT NULL DEFAULT 0")
+        add_column(cur, 'calibration_tasks', 'heartbeat_at', 'TIMESTAMPTZ')
+
+        # Tables created before results were stored as JSONB
+        ensure_jsonb(cur, 'calibration_tasks', 'task_data')
+        ensure_jsonb(cur, 'calibration_task_results', 'mapping')
 
 
 def generate_task_id():
     return str(uuid.uuid4())
 
 
-def new_task(user_id=None):
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _stale_before():
+    return _utcnow() - timedelta(seconds=TASK_STALE_SECONDS)
+
+
+@metrics.db_call
+def new_task(user_id=None, reserved_simulations=0):
+    """Create a pending task holding reserved_simulations of the user's reservation until its run releases them."""
     task_id = generate_task_id()
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute(
-        "INSERT INTO calibration_tasks (task_id, task_data, status, user_id, successful_simulation_count) VALUES (%s, %s, %s, %s, %s)",
-        (task_id, json.dumps({}), 'pending', user_id, 0)
-    )
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+    with transaction() as cur:
+        cur.execute(
+            """INSERT INTO calibration_tasks (task_id, task_data, status, user_id, successful_simulation_count, reserved_simulations, heartbeat_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+            (task_id, Json({}), 'pending', user_id, 0, reserved_simulations, _utcnow())
+        )
     return task_id
 
-def get_task(task_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
+
+@metrics.db_call
+def touch_task(task_id):
+    """Refresh a running task's heartbeat. Not a change watchers see: the version is left as it is."""
+    with transaction() as cur:
+        cur.execute("UPDATE calibration_tasks SET heartbeat_at = %s WHERE task_id = %s", (_utcnow(), task_id))
+
+
+@metrics.db_call
+def task_cancelled(task_id):
+    """Whether the task was cancelled, for runs that poll between evaluations."""
+    with transaction() as cur:
+        cur.execute("SELECT status FROM calibration_tasks WHERE task_id = %s", (task_id,))
+        row = cur.fetchone()
+    return bool(row and row[0] == 'cancelled')
+
+
+@metrics.db_call
+def task_is_stale(task_id):
+    """Whether the task's run sent no heartbeat for TASK_STALE_SECONDS (or never sent one)."""
+    with transaction() as cur:
+        cur.execute(
+            "SELECT heartbeat_at IS NULL OR heartbeat_at < %s FROM calibration_tasks WHERE task_id = %s",
+            (_stale_before(), task_id)
+        )
+        row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def _swap_task_run(cur, task_id, condition, params, assignments, assignment_params):
+    # Returns the reservation the task held before the update, or None when condition did not match.
+    # SQLite transactions hold the write lock from the start, so select-then-update is as atomic as the lock
+    if is_sqlite():
+        cur.execute(f"SELECT reserved_simulations FROM calibration_tasks WHERE task_id = %s AND {condition}", (task_id, *params))
+        row = cur.fetchone()
+        if row:
+            cur.execute(f"UPDATE calibration_tasks SET {assignments} WHERE task_id = %s", (*assignment_params, task_id))
+        return row[0] if row else None
     cur.execute(
-        "SELECT task_data, status, user_id FROM calibration_tasks WHERE task_id = %s",
-        (task_id,)
+        f"""UPDATE calibration_tasks t SET {assignments}
+        FROM (SELECT task_id, reserved_simulations FROM calibration_tasks WHERE task_id = %s AND {condition} FOR UPDATE) old
+        WHERE t.task_id = old.task_id
+        RETURNING old.reserved_simulations""",
+        (*assignment_params, task_id, *params)
     )
-    result = cur.fetchone()
-    
-    cur.close()
-    conn.close()
-    
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+@metrics.db_call
+def take_reservation(task_id):
+    """Return the simulations a task holds reserved and set them to 0, so each reservation is released once."""
+    with transaction() as cur:
+        return _swap_task_run(cur, task_id, "TRUE", (), "reserved_simulations = 0", ()) or 0
+
+
+@metrics.db_call
+def claim_task(task_id, reserved_simulations):
+    """
+    Take over an unfinished task for a new run (resume_calibration).
+
+    Succeeds only for tasks that failed or whose run stopped sending heartbeats (TASK_STALE_SECONDS),
+    so two runs never work on one task. The task becomes pending with a fresh heartbeat and holds
+    reserved_simulations.
+
+    Returns:
+    - int | None: The reservation the earlier run left behind, for the caller to release;
+      None when the task finished or is still running
+    """
+    with transaction() as cur:
+        previous = _swap_task_run(
+            cur, task_id,
+            "status NOT IN ('completed', 'cancelled') AND (status = 'error' OR heartbeat_at IS NULL OR heartbeat_at < %s)",
+            (_stale_before(),),
+            "status = 'pending', heartbeat_at = %s, reserved_simulations = %s, version = version + 1",
+            (_utcnow(), reserved_simulations),
+        )
+        if previous is not None:
+            publish_task_changed(cur, task_id)
+    if previous is not None:
+        notifier.publish(task_id)
+    return previous
+
+@metrics.db_call
+def release_stale_reservations(batch_size):
+    """
+    Take the reservations of up to batch_size tasks whose run stopped sending heartbeats.
+
+    The run died before it could release them (a killed serverless invocation, a crashed worker).
+    Unfinished tasks among them are marked 'error', which resume_calibration accepts.
+
+    Returns:
+    - list[tuple]: (user_id, reserved_simulations) per task, for the caller to release
+    """
+    condition = "reserved_simulations > 0 AND (heartbeat_at IS NULL OR heartbeat_at < %s)"
+    dead = {"error_message": "Task stopped sending heartbeats"}
+    with transaction() as cur:
+        if is_sqlite():
+            cur.execute(
+                f"SELECT task_id, user_id, reserved_simulations, status, task_data FROM calibration_tasks WHERE {condition} LIMIT %s",
+                (_stale_before(), batch_size)
+            )
+            rows = cur.fetchall()
+            for task_id, _, _, status, task_data in rows:
+                final = status in FINAL_STATUSES
+                cur.execute(
+                    "UPDATE calibration_tasks SET reserved_simulations = 0, status = %s, task_data = %s, version = version + 1 WHERE task_id = %s",
+                    (status if final else 'error', Json(json_value(task_data) if final else {**(json_value(task_data) or {}), **dead}), task_id)
+                )
+            released = [(task_id, user_id, reserved) for task_id, user_id, reserved, _, _ in rows]
+        else:
+            cur.execute(
+                f"""UPDATE calibration_tasks t SET reserved_simulations = 0,
+                    status = CASE WHEN t.status = ANY(%s) THEN t.status ELSE 'error' END,
+                    task_data = CASE WHEN t.status = ANY(%s) THEN t.task_data ELSE COALESCE(t.task_data, '{{}}'::jsonb) || %s END,
+                    version = t.version + 1
+                FROM (
+                    SELECT task_id, reserved_simulations FROM calibration_tasks
+                    WHERE {condition} LIMIT %s FOR UPDATE SKIP LOCKED
+                ) old
+                WHERE t.task_id = old.task_id
+                RETURNING t.task_id, t.user_id, old.reserved_simulations""",
+                (list(FINAL_STATUSES), list(FINAL_STATUSES), Json(dead), _stale_before(), batch_size)
+            )
+            released = cur.fetchall()
+        for task_id, _, _ in released:
+            publish_task_changed(cur, task_id)
+    for task_id, _, _ in released:
+        notifier.publish(task_id)
+    return [(user_id, reserved) for _, user_id, reserved in released]
+
+
+@metrics.db_call
+def get_task(task_id, fields=None):
+    """Return a task's data with its status, user_id and version; only the given task_data keys when fields is set."""
+    with transaction() as cur:
+        cur.execute(*_task_query(task_id, fields))
+        return _task_from_row(cur.fetchone(), fields)
+
+
+@metrics.db_call
+@async_connection.fallback(get_task)
+async def get_task_async(task_id, fields=None):
+    """get_task on the async pool."""
+    async with async_connection.transaction() as cur:
+        await cur.execute(*_task_query(task_id, fields))
+        return _task_from_row(cur.fetchone(), fields)
+
+
+def _task_query(task_id, fields):
+    if fields is None or is_sqlite():
+        return "SELECT task_data, status, user_id, version FROM calibration_tasks WHERE task_id = %s", (task_id,)
+    # Pick the keys server-side so large results are never sent for a partial read
+    return (
+        """SELECT (SELECT jsonb_object_agg(key, value) FROM jsonb_each(task_data) WHERE key = ANY(%s)),
+               status, user_id, version
+        FROM calibration_tasks WHERE task_id = %s""",
+        (list(fields), task_id)
+    )
+
+
+def _task_from_row(result, fields):
     if result:
-        task_data = json.loads(result[0]) if result[0] else {}
+        task_data = json_value(result[0]) or {}
+        if fields is not None:
+            task_data = {key: value for key, value in task_data.items() if key in fields}
         task_data['status'] = result[1]
         task_data['user_id'] = result[2]
+        task_data['version'] = result[3]
         return task_data
     return None
 
 
+@metrics.db_call
 def get_all_tasks(user_id=None):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    if user_id:
-        cur.execute("SELECT task_id FROM calibration_tasks WHERE user_id = %s", (user_id,))
-    else:
-        cur.execute("SELECT task_id FROM calibration_tasks")
-    tasks = [str(row[0]) for row in cur.fetchall()]
-    
-    cur.close()
-    conn.close()
+    with transaction() as cur:
+        if user_id:
+            cur.execute("SELECT task_id FROM calibration_tasks WHERE user_id = %s", (user_id,))
+        else:
+            cur.execute("SELECT task_id FROM calibration_tasks")
+        tasks = [str(row[0]) for row in cur.fetchall()]
     return tasks
 
 
+@metrics.db_call
 def update_task(task_id, task_data):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
+    """Replace a task's data and status. Cancelled tasks are final and left as they are."""
     status = task_data.pop('status', 'pending')
     user_id = task_data.pop('user_id', None)
     successful_simulation_count = task_data.pop('successful_simulation_count', 0)
-    
-    cur.execute(
-        "UPDATE calibration_tasks SET task_data = %s, status = %s, user_id = %s, successful_simulation_count = %s WHERE task_id = %s",
-        (json.dumps(task_data), status, user_id, successful_simulation_count, task_id)
-    )
-    
-    conn.commit()
-    cur.close()
-    conn.close()
 
+    with transaction() as cur:
+        cur.execute(
+            "UPDATE calibration_tasks SET task_data = %s, status = %s, user_id = %s, successful_simulation_count = %s, version = version + 1 WHERE task_id = %s AND status <> 'cancelled'",
+            (Json(task_data), status, user_id, successful_simulation_count, task_id)
+        )
+        publish_task_changed(cur, task_id)
+    notifier.publish(task_id)
+
+
+def _update_task_data_in_place(cur, task_id, update, status=None):
+    # SQLite has no JSONB operators; transactions there hold the write lock from the start,
+    # so reading and rewriting the document is as atomic as the single Postgres statement
+    cur.execute("SELECT task_data, status FROM calibration_tasks WHERE task_id = %s", (task_id,))
+    result = cur.fetchone()
+    if result:
+        task_data = update(json_value(result[0]) or {})
+        cur.execute(
+            "UPDATE calibration_tasks SET task_data = %s, status = COALESCE(%s, status), version = version + 1 WHERE task_id = %s",
+            (Json(task_data), status, task_id)
+        )
+        return status or result[1]
+    return None
+
+
+@metrics.db_call
+def merge_task(task_id, fields, status=None):
+    """
+    Merge fields into a task's data with jsonb ||, leaving its other keys as stored (and its status unless given).
+
+    Returns the task's status after the update, so running tasks notice cancellation without another query.
+    """
+    with transaction() as cur:
+        if is_sqlite():
+            new_status = _update_task_data_in_place(cur, task_id, lambda task_data: {**task_data, **fields}, status)
+        else:
+            cur.execute(
+                """UPDATE calibration_tasks
+                SET task_data = COALESCE(task_data, '{}'::jsonb) || %s, status = COALESCE(%s, status), version = version + 1
+                WHERE task_id = %s
+                RETURNING status""",
+                (Json(fields), status, task_id)
+            )
+            result = cur.fetchone()
+            new_status = result[0] if result else None
+        publish_task_changed(cur, task_id)
+    notifier.publish(task_id)
+    return new_status
+
+
+@metrics.db_call
+def cancel_task(task_id):
+    """Mark a task cancelled unless it already finished. Returns whether it was cancelled."""
+    with transaction() as cur:
+        cur.execute(
+            "UPDATE calibration_tasks SET status = 'cancelled', version = version + 1 WHERE task_id = %s AND NOT (status = ANY(%s))",
+            (task_id, list(FINAL_STATUSES))
+        )
+        cancelled = cur.rowcount > 0
+        if cancelled:
+            publish_task_changed(cur, task_id)
+    if cancelled:
+        notifier.publish(task_id)
+    return cancelled
+
+
+@metrics.db_call
+def add_task_counters(task_id, counters):
+    """Add numeric counters (e.g. cache hits) to a task's data without touching its other fields."""
+    if not counters:
+        return
+    with transaction() as cur:
+        if is_sqlite():
+            _update_task_data_in_place(cur, task_id, lambda task_data: {
+                **task_data, **{name: task_data.get(name, 0) + value for name, value in counters.items()}
+            })
+        else:
+            # One statement, so concurrent workers adding to the same task cannot lose increments
+            cur.execute(
+                """UPDATE calibration_tasks
+                SET task_data = COALESCE(task_data, '{}'::jsonb) || (
+                        SELECT jsonb_object_agg(key, to_jsonb(COALESCE((task_data ->> key)::numeric, 0) + value::numeric))
+                        FROM jsonb_each_text(%s)
+                    ),
+                    version = version + 1
+                WHERE task_id = %s""",
+                (Json(counters), task_id)
+            )
+        publish_task_changed(cur, task_id)
+    notifier.publish(task_id)
+
+
+@metrics.db_call
+def save_kc_results(task_id, columns):
+    """Store [(kc_index, kc, single-kc rorb_kc_qmax_mapping), ...] computed for a task."""
+    if not columns:
+        return
+    with transaction() as cur:
+        execute_values(
+            cur,
+            """INSERT INTO calibration_task_results (task_id, kc_index, kc, mapping) VALUES %s
+            ON CONFLICT (task_id, kc_index) DO UPDATE SET kc = EXCLUDED.kc, mapping = EXCLUDED.mapping""",
+            [(task_id, kc_index, kc, Json(mapping)) for kc_index, kc, mapping in columns]
+        )
+
+
+@metrics.db_call
+def get_kc_results(task_id, kc_min=None, kc_max=None, hydro_key=None):
+    """
+    Return {kc_index: single-kc rorb_kc_qmax_mapping} stored for a task so far.
+
+    kc_min / kc_max restrict the kc range and hydro_key keeps only that hydrograph's
+    entry of each mapping, both applied in the query (hydro_key after it on SQLite).
+    """
+    with transaction() as cur:
+        cur.execute(*_kc_results_query(task_id, kc_min, kc_max, hydro_key))
+        return _kc_results_from_rows(cur.fetchall(), hydro_key)
+
+
+@metrics.db_call
+@async_connection.fallback(get_kc_results)
+async def get_kc_results_async(task_id, kc_min=None, kc_max=None, hydro_key=None):
+    """get_kc_results on the async pool."""
+    async with async_connection.transaction() as cur:
+        await cur.execute(*_kc_results_query(task_id, kc_min, kc_max, hydro_key))
+        return _kc_results_from_rows(cur.fetchall(), hydro_key)
+
+
+def _kc_results_query(task_id, kc_min, kc_max, hydro_key):
+    in_query = hydro_key is not None and not is_sqlite()
+    mapping = "jsonb_build_object(%s, mapping -> %s)" if in_query else "mapping"
+    params = [hydro_key, hydro_key] if in_query else []
+    query = f"SELECT kc_index, {mapping} FROM calibration_task_results WHERE task_id = %s"
+    params.append(task_id)
+    if in_query:
+        query += " AND mapping ? %s"
+        params.append(hydro_key)
+    if kc_min is not None:
+        query += " AND kc >= %s"
+        params.append(kc_min)
+    if kc_max is not None:
+        query += " AND kc <= %s"
+        params.append(kc_max)
+    return query + " ORDER BY kc_index", tuple(params)
+
+
+def _kc_results_from_rows(rows, hydro_key):
+    results = {kc_index: json_value(mapping) for kc_index, mapping in rows}
+    if hydro_key is not None and is_sqlite():
+        results = {kc_index: {hydro_key: mapping[hydro_key]} for kc_index, mapping in results.items() if hydro_key in mapping}
+    return results
+
+
+def _stream(query, params, fetch_size):
+    """Yield the rows of query through a named (server-side) cursor, fetch_size rows at a time."""
+    with connection() as conn:
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+            cur.itersize = fetch_size
+            cur.execute(query, params)
+            while rows := cur.fetchmany(fetch_size):
+                yield from rows
+
+
+@metrics.db_call
+def iter_kc_result_rows(task_id, offset=0, fetch_size=EXPORT_FETCH_SIZE):
+    """
+    Stream a grid calibration's stored results one (kc, hydrograph) row at a time, in kc order.
+
+    Postgres expands each kc's mapping into rows and skips the first offset rows in the query,
+    SQLite does both here.
+
+    Yields:
+    - tuple: (kc_index, kc, hydrograph key, {field: [value]}) as in a single-kc rorb_kc_qmax_mapping
+    """
+    if is_sqlite():
+        rows = (
+            (kc_index, kc, key, values)
+            for kc_index, kc, mapping in _stream(
+                "SELECT kc_index, kc, mapping FROM calibration_task_results WHERE task_id = %s ORDER BY kc_index",
+                (task_id,), fetch_size)
+            for key, values in json_value(mapping).items()
+        )
+        yield from itertools.islice(rows, offset, None)
+        return
+    yield from _stream(
+        """SELECT r.kc_index, r.kc, m.key, m.value
+        FROM calibration_task_results r, jsonb_each(r.mapping) m
+        WHERE r.task_id = %s
+        ORDER BY r.kc_index, m.key
+        OFFSET %s""",
+        (task_id, offset), fetch_size)
+
+
+@metrics.db_call
+def iter_sweep_rows(task_id, offset=0, fetch_size=EXPORT_FETCH_SIZE):
+    """
+    Stream a completed sweep's results one (point, hydrograph) row at a time, in point order.
+
+    Postgres pivots the stored per-field arrays into rows in the query, so the (large)
+    sweep result is never loaded here. Points without a result are skipped.
+
+    Yields:
+    - tuple: (point index, hydrograph key, point or None, {field: value}) where point is the
+      (kc, m, initial_loss, continuous_loss) of Latin hypercube sweeps; grid points follow
+      from the layout (get_sweep_layout)
+    """
+    if is_sqlite():
+        sweep = (get_task(task_id, fields=['sweep']) or {}).get('sweep') or {}
+        points = sweep.get('points')
+        rows = (
+            (i, key, points[i] if points is not None else None, {field: values[i] for field, values in fields.items()})
+            for i in range(math.prod(sweep.get('shape', [0])))
+            for key, fields in sweep.get('hydrographs', {}).items()
+            if any(values[i] is not None for values in fields.values())
+        )
+        yield from itertools.islice(rows, offset, None)
+        return
+    yield from _stream(
+        """SELECT r.idx, r.hydrograph, t.task_data -> 'sweep' -> 'points' -> r.idx, r.fields
+        FROM (
+            SELECT (p.i - 1)::int AS idx, h.key AS hydrograph, jsonb_object_agg(f.key, p.value) AS fields
+            FROM calibration_tasks t,
+                 jsonb_each(t.task_data -> 'sweep' -> 'hydrographs') h,
+                 jsonb_each(h.value) f,
+                 jsonb_array_elements(f.value) WITH ORDINALITY p(value, i)
+            WHERE t.task_id = %s
+            GROUP BY 1, 2
+            HAVING bool_or(p.value <> 'null'::jsonb)
+        ) r
+        JOIN calibration_tasks t ON t.task_id = %s
+        ORDER BY r.idx, r.hydrograph
+        OFFSET %s""",
+        (task_id, task_id, offset), fetch_size)
+
+
+@metrics.db_call
+def get_sweep_layout(task_id):
+    """Return a sweep's layout (mode, dims, axes, shape) without its result arrays and sample points."""
+    if is_sqlite():
+        sweep = (get_task(task_id, fields=['sweep']) or {}).get('sweep')
+        return {key: value for key, value in sweep.items() if key not in ('hydrographs', 'points')} if sweep else None
+    with transaction() as cur:
+        cur.execute("SELECT task_data -> 'sweep' - 'hydrographs' - 'points' FROM calibration_tasks WHERE task_id = %s", (task_id,))
+        row = cur.fetchone()
+    return row[0] if row else None
 
 
 def reset_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DROP TABLE IF EXISTS calibration_tasks")
-    conn.commit()
-    cur.close()
-    conn.close()
+    with transaction() as cur:
+        cur.execute("DROP TABLE IF EXISTS calibration_task_results")
+        cur.execute("DROP TABLE IF EXISTS calibration_tasks")
     init_db()
 
 if __name__ == "__main__":
     reset_db()
     
+    logging.basicConfig(level=logging.INFO)
     all_tasks = get_all_tasks()
-    print(all_tasks)
+    logging.info("%d tasks", len(all_tasks))
 
     if all_tasks:
-        print(get_task(all_tasks[0]))
+        logging.debug("First task: %s", get_task(all_tasks[0]))
@@ -0,0 +1,249 @@
+"""
+Shared Postgres connection pool used by every db module.
+
+Connections are checked out for the duration of a `connection()` or `transaction()`
+block and handed back instead of being closed, so a request that touches several
+db modules pays for one connection setup rather than one per call. A connection that
+sat in the pool for POSTGRES_POOL_PING_SECONDS is pinged when checked out, and replaced
+if the server or a proxy dropped it meanwhile (e.g. while a serverless instance was frozen).
+
+DATABASE_BACKEND=sqlite swaps Postgres for the embedded SQLite database in
+api.lib.db.sqlite_backend behind the same functions; modules branch on
+is_sqlite() for the few statements that differ between the two.
+
+Functions:
+    - connection() -> context manager yielding a pooled psycopg2 connection
+    - transaction(cursor_factory=None) -> context manager yielding a cursor, committing on success
+    - is_sqlite() -> bool: Whether the SQLite backend is selected
+    - execute_values(cur, sql, argslist, ...): psycopg2.extras.execute_values on either backend
+    - json_value(value): Decode a JSON column as read on either backend
+    - pool_stats() -> dict: checkouts, wait time and exhaustion counters of this process' pool
+    - server_connections() -> dict: {state: count} of the database's connections, from pg_stat_activity
+    - close_pool(): Close every pooled connection
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, extras
+from psycopg2.pool import ThreadedConnectionPool
+
+from api.lib import config  # noqa: F401  loads POSTGRES_URL from the .env files
+from api.lib.db import sqlite_backend
+
+POOL_MIN_SIZE = int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 1))
+POOL_MAX_SIZE = int(os.environ.get('POSTGRES_POOL_MAX_SIZE', 10))
+POOL_TIMEOUT = float(os.environ.get('POSTGRES_POOL_TIMEOUT', 30))
+# Connections idle in the pool at least this long are pinged before being handed out, 0 pings every checkout
+POOL_PING_SECONDS = float(os.environ.get('POSTGRES_POOL_PING_SECONDS', 30))
+DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'postgres')
+DATABASE_BACKENDS = ('postgres', 'sqlite')
+
+if DATABASE_BACKEND not in DATABASE_BACKENDS:
+    raise ValueError(f"Unknown DATABASE_BACKEND: {DATABASE_BACKEND}, expected one of {DATABASE_BACKENDS}")
+
+
+def is_sqlite():
+    return DATABASE_BACKEND == 'sqlite'
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no pooled connection became available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """ThreadedConnectionPool that blocks (up to a timeout) instead of failing when exhausted."""
+
+    def __init__(self, dsn, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT, ping_seconds=POOL_PING_SECONDS):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_seconds = ping_seconds
+        self.pid = os.getpid()
+        self._pool = ThreadedConnectionPool(min_size, max_size, dsn)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._wait_seconds = 0.0
+        self._exhausted = 0
+        self._timeouts = 0
+        self._in_use = 0
+        self._max_in_use = 0
+        self._discarded = 0
+        # id(conn) -> time.monotonic() it was handed back, for the idle check in _usable
+        self._returned = {}
+
+    def getconn(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._exhausted += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._timeouts += 1
+                raise PoolExhaustedError(f"No database connection available after {self.timeout}s (pool size {self.max_size})")
+        waited = time.perf_counter() - started
+
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._checkouts += 1
+            self._wait_seconds += waited
+            self._in_use += 1
+            self._max_in_use = max(self._max_in_use, self._in_use)
+        return conn
+
+    def _checkout(self):
+        # Every connection in the pool may be dead (the server restarted), hence one try per
+        # pooled connection; the pool then opens a new one, which needs no ping
+        for _ in range(self.max_size + 1):
+            conn = self._pool.getconn()
+            if self._usable(conn):
+                return conn
+            with self._lock:
+                self._discarded += 1
+            self._pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("No usable database connection in the pool")
+
+    def _usable(self, conn):
+        with self._lock:
+            returned = self._returned.pop(id(conn), None)
+        if conn.closed:
+            return False
+        if returned is None or time.monotonic() - returned < self.ping_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def putconn(self, conn, close=False):
+        try:
+            if not close:
+                with self._lock:
+                    self._returned[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=close)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'wait_seconds': self._wait_seconds,
+                'exhausted': self._exhausted,
+                'timeouts': self._timeouts,
+                'in_use': self._in_use,
+                'max_in_use': self._max_in_use,
+                'discarded': self._discarded,
+            }
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this process' pool, creating it on first use (and again after a fork)."""
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool(os.environ['POSTGRES_URL'])
+    return _pool
+
+
+@contextmanager
+def connection():
+    """Check out a pooled connection, rolling back anything left uncommitted on return."""
+    if is_sqlite():
+        with sqlite_backend.connection() as conn:
+            yield conn
+        return
+    pool = get_pool()
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except psycopg2.OperationalError:
+        broken = True
+        raise
+    finally:
+        if not conn.closed and not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        pool.putconn(conn, close=broken or bool(conn.closed))
+
+
+@contextmanager
+def transaction(cursor_factory=None):
+    """Yield a cursor on a pooled connection; commit when the block succeeds, roll back otherwise."""
+    if is_sqlite():
+        with sqlite_backend.transaction(cursor_factory) as cur:
+            yield cur
+        return
+    with connection() as conn:
+        cur = conn.cursor(cursor_factory=cursor_factory)
+        try:
+            yield cur
+            conn.commit()
+        finally:
+            cur.close()
+
+
+def execute_values(cur, sql, argslist, template=None, page_size=100, fetch=False):
+    """psycopg2.extras.execute_values, or its row-by-row equivalent on SQLite."""
+    if is_sqlite():
+        return sqlite_backend.execute_values(cur, sql, argslist, template=template, page_size=page_size, fetch=fetch)
+    return extras.execute_values(cur, sql, argslist, template=template, page_size=page_size, fetch=fetch)
+
+
+def json_value(value):
+    """Decode a JSON / JSONB column: psycopg2 already parses JSONB, SQLite returns the stored text."""
+    if is_sqlite() and isinstance(value, (str, bytes)):
+        return json.loads(value)
+    return value
+
+
+def pool_stats():
+    return get_pool().stats() if _pool is not None else {}
+
+
+def server_connections():
+    """Return {state: count} of the server's connections to this database, empty on SQLite."""
+    if is_sqlite():
+        return {}
+    with transaction() as cur:
+        cur.execute(
+            "SELECT COALESCE(state, 'unknown'), COUNT(*) FROM pg_stat_activity WHERE datname = current_database() GROUP BY 1"
+        )
+        return dict(cur.fetchall())
+
+
+def close_pool():
+    global _pool
+    if is_sqlite():
+        sqlite_backend.close()
+        return
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
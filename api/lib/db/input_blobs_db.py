@@ -0,0 +1,84 @@
+"""
+Content-addressed storage for catchment and storm file text.
+
+simulations_queue rows reference these blobs by hash, so a catchment shared by
+every kc and storm of a task is stored once instead of once per row. The helpers
+take an open cursor so callers can store or resolve blobs inside the same
+transaction as the rows that reference them.
+"""
+
+from api.lib import metrics
+from api.lib.db.connection import execute_values, transaction
+from api.lib.hashing import content_hash
+
+
+def init_db():
+    with transaction() as cur:
+        # Create input blobs table if it doesn't exist
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS input_blobs (
+                hash CHAR(64) PRIMARY KEY,
+                data TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+
+def make_blob(data):
+    """Return (hash, data) for a file's text content."""
+    return content_hash(data), data
+
+
+def store_blobs(cur, blobs):
+    """Insert {hash: data} blobs that are not stored yet."""
+    if not blobs:
+        return
+    execute_values(
+        cur,
+        "INSERT INTO input_blobs (hash, data) VALUES %s ON CONFLICT (hash) DO NOTHING",
+        list(blobs.items())
+    )
+
+
+def fetch_blobs(cur, hashes):
+    """Return {hash: data} for the given hashes in a single query."""
+    hashes = [h for h in set(hashes) if h]
+    if not hashes:
+        return {}
+    cur.execute("SELECT hash, data FROM input_blobs WHERE hash = ANY(%s)", (hashes,))
+    return dict(cur.fetchall())
+
+
+async def fetch_blobs_async(cur, hashes):
+    """fetch_blobs on an async_connection cursor."""
+    hashes = [h for h in set(hashes) if h]
+    if not hashes:
+        return {}
+    await cur.execute("SELECT hash, data FROM input_blobs WHERE hash = ANY(%s)", (hashes,))
+    return dict(cur.fetchall())
+
+
+@metrics.db_call
+def save_blobs(texts):
+    """Store file texts, returning their hashes in the same order (None for missing files)."""
+    hashes = [content_hash(text) if text is not None else None for text in texts]
+    blobs = {blob_hash: text for blob_hash, text in zip(hashes, texts) if text is not None}
+    with transaction() as cur:
+        store_blobs(cur, blobs)
+    return hashes
+
+
+@metrics.db_call
+def get_blobs(hashes):
+    with transaction() as cur:
+        return fetch_blobs(cur, hashes)
+
+
+def reset_db():
+    with transaction() as cur:
+        cur.execute("DROP TABLE IF EXISTS input_blobs")
+    init_db()
+
+
+if __name__ == "__main__":
+    init_db()
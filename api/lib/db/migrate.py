@@ -0,0 +1,45 @@
+"""
+Create or upgrade every table the API and workers use, without dropping anything.
+
+Each db module's init_db() only creates missing tables, columns and indexes and converts
+older JSON columns to JSONB, so this is safe to run against a live database, and again
+on every deploy. The API never creates its schema itself: run this before deploying a
+version that adds to it. (The modules' own __main__ blocks call reset_db(), which drops
+their tables.)
+
+Usage:
+    python -m api.lib.db.migrate
+
+Functions:
+    - migrate() -> list: Run every module's init_db(), returning the module names in order
+"""
+
+import logging
+import os
+
+from api.lib.db import accounting, calibration_kc_db, input_blobs_db, simulation_cache_db
+from api.lib.db.simulation_db import SimulationDB
+
+# input_blobs first, simulations_queue rows reference it
+MIGRATIONS = (
+    ('input_blobs_db', input_blobs_db.init_db),
+    ('simulation_db', lambda: SimulationDB().init_db()),
+    ('calibration_kc_db', calibration_kc_db.init_db),
+    ('accounting', accounting.init_db),
+    ('simulation_cache_db', simulation_cache_db.init_db),
+)
+
+
+def migrate():
+    """Run every module's init_db(), returning the names of the modules migrated."""
+    migrated = []
+    for name, init_db in MIGRATIONS:
+        init_db()
+        logging.info("Migrated %s", name)
+        migrated.append(name)
+    return migrated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+    migrate()
@@ -0,0 +1,18 @@
+"""
+Migrate simulations_queue rows that still carry inline storm_data / catg_data text
+to input_blobs references.
+
+Usage:
+    python -m api.lib.db.migrate_input_blobs
+"""
+
+import logging
+import os
+
+from api.lib.db.simulation_db import SimulationDB
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+    db = SimulationDB()
+    db.init_db()  # adds the hash columns and the input_blobs table
+    logging.info("Migrated %d simulations to input_blobs", db.migrate_inline_blobs())
@@ -0,0 +1,58 @@
+"""
+Schema helpers shared by the db modules' init_db functions, for either backend.
+
+Functions:
+    - json_type() -> str: Column type for JSON documents (JSONB, TEXT on SQLite)
+    - column_type(cur, table, column) -> str: Declared type of a column, None when it does not exist
+    - add_column(cur, table, column, definition): ALTER TABLE ... ADD COLUMN IF NOT EXISTS
+    - ensure_jsonb(cur, table, column): Convert a TEXT column holding JSON to JSONB in place
+"""
+
+from api.lib.db.connection import is_sqlite
+
+
+def json_type():
+    return 'TEXT' if is_sqlite() else 'JSONB'
+
+
+def column_type(cur, table, column):
+    if is_sqlite():
+        cur.execute(f"SELECT type FROM pragma_table_info('{table}') WHERE name = %s", (column,))
+    else:
+        cur.execute(
+            "SELECT data_type FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+            (table, column)
+        )
+    result = cur.fetchone()
+    return result[0].lower() if result else None
+
+
+def add_column(cur, table, column, definition):
+    """Add a column unless it exists (SQLite has no ADD COLUMN IF NOT EXISTS)."""
+    if is_sqlite():
+        if column_type(cur, table, column) is None:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    else:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+
+
+def ensure_jsonb(cur, table, column):
+    """
+    Convert a TEXT column holding JSON documents to JSONB, once.
+
+    Values that are not valid JSON are kept as JSON strings rather than failing the
+    migration. Does nothing when the column already is JSONB, or on SQLite, where
+    JSON is stored as TEXT.
+    """
+    if is_sqlite() or column_type(cur, table, column) != 'text':
+        return
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION pg_temp.text_to_jsonb(value TEXT) RETURNS JSONB AS $$
+        BEGIN
+            RETURN value::jsonb;
+        EXCEPTION WHEN others THEN
+            RETURN to_jsonb(value);
+        END
+        $$ LANGUAGE plpgsql IMMUTABLE
+    """)
+    cur.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB USING pg_temp.text_to_jsonb({column})")
@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+import logging
+from functools import cache
+from importlib import metadata
+
+from api.lib import metrics
+from api.lib.db.connection import execute_values, is_sqlite, transaction
+
+MAX_ENTRIES = int(os.environ.get('SIMULATION_CACHE_MAX_ENTRIES', 100_000))
+MAX_AGE_DAYS = int(os.environ.get('SIMULATION_CACHE_MAX_AGE_DAYS', 30))
+
+
+@cache
+def pyrorb_version():
+    # Read on first use: scanning installed package metadata is slow enough to show in cold starts
+    try:
+        return metadata.version('pyrorb')
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def init_db():
+    with transaction() as cur:
+        # Create simulation cache table if it doesn't exist
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS simulation_cache (
+                cache_key CHAR(64) PRIMARY KEY,
+                result TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                last_accessed TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS simulation_cache_last_accessed_idx ON simulation_cache (last_accessed)")
+
+
+def _normalize_number(value):
+    # kc values come out of float arithmetic (0.8 + 3 * 0.2 ...), so round before hashing
+    return format(float(value), '.10g')
+
+
+def cache_key(kind, catg_hash, storm_hashes, kc, m, initial_loss, continuous_loss):
+    """
+    Build the content-addressed key of one RORB result.
+
+    Parameters:
+    - kind (str): Result namespace, e.g. 'kc_calibration' or 'experiment', as they store different shapes
+    - catg_hash (str): content_hash of the catchment file
+    - storm_hashes (str | list[str]): content_hash of the storm file(s), order matters
+    - kc, m, initial_loss, continuous_loss (float): RORB model parameters
+    """
+    if isinstance(storm_hashes, str):
+        storm_hashes = [storm_hashes]
+    parts = [kind, pyrorb_version(), catg_hash, *storm_hashes,
+             *(_normalize_number(v) for v in (kc, m, initial_loss, continuous_loss))]
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+@metrics.db_call
+def get_results(cache_keys):
+    """Return {cache_key: result} for the keys present in the cache, refreshing their access time."""
+    if not cache_keys:
+        return {}
+    try:
+        with transaction() as cur:
+            cur.execute(
+                "UPDATE simulation_cache SET last_accessed = CURRENT_TIMESTAMP WHERE cache_key = ANY(%s) RETURNING cache_key, result",
+                (list(cache_keys),)
+            )
+            rows = cur.fetchall()
+    except Exception as e:
+        # A cache failure should only cost compute, never fail the simulation
+        logging.warning(f"Simulation cache lookup failed: {e}")
+        return {}
+    return {key: json.loads(result) for key, result in rows}
+
+
+@metrics.db_call
+def put_results(results):
+    """Store {cache_key: result} in the cache, overwriting existing entries."""
+    if not results:
+        return
+    try:
+        rows = [(key, json.dumps(result)) for key, result in results.items()]
+        with transaction() as cur:
+            execute_values(
+                cur,
+                """INSERT INTO simulation_cache (cache_key, result) VALUES %s
+                ON CONFLICT (cache_key) DO UPDATE SET result = EXCLUDED.result, last_accessed = CURRENT_TIMESTAMP""",
+                rows
+            )
+    except Exception as e:
+        logging.warning(f"Simulation cache write failed: {e}")
+
+
+@metrics.db_call
+def evict(max_entries=MAX_ENTRIES, max_age_days=MAX_AGE_DAYS):
+    """Delete entries not accessed within max_age_days, then the least recently used beyond max_entries."""
+    try:
+        with transaction() as cur:
+            if is_sqlite():
+                cur.execute(
+                    "DELETE FROM simulation_cache WHERE last_accessed < datetime('now', %s)",
+                    (f"-{max_age_days} days",)
+                )
+            else:
+                cur.execute(
+                    "DELETE FROM simulation_cache WHERE last_accessed < CURRENT_TIMESTAMP - make_interval(days => %s)",
+                    (max_age_days,)
+                )
+            cur.execute(
+                f"""DELETE FROM simulation_cache WHERE cache_key IN (
+                    SELECT cache_key FROM simulation_cache ORDER BY last_accessed DESC {'LIMIT -1 ' if is_sqlite() else ''}OFFSET %s
+                )""",
+                (max_entries,)
+            )
+    except Exception as e:
+        logging.warning(f"Simulation cache eviction failed: {e}")
+
+
+def reset_db():
+    with transaction() as cur:
+        cur.execute("DROP TABLE IF EXISTS simulation_cache")
+    init_db()
+
+
+if __name__ == "__main__":
+    reset_db()
@@ -3,7 +3,7 @@ SimulationDB Class - Database operations for RORB simulations
 
 Functions:
     Database Connection:
-        - get_db_connection() -> psycopg2.connection: Get database connection
+        - connections are checked out from the shared pool in api.lib.db.connection
         - init_db(): Initialize database tables
         - reset_db(): Reset database to initial state
 
@@ -12,46 +12,209 @@ Functions:
         - get_simulation(simulation_id) -> dict: Get simulation details
         - get_simulation_by_task_id(task_id) -> dict: Get simulation by task ID
         - get_simulation_by_user_id(user_id) -> list: Get simulations by user ID
+        - getters take columns=... (e.g. METADATA_COLUMNS) to skip the storm/catg/result payloads
+        - iter_simulations(task_id=None, user_id=None, status=None, columns=None, fetch_size=STREAM_FETCH_SIZE): Stream rows through a server-side cursor
+        - get_status_counts(task_id) -> dict: Count a task's simulations per status
+        - get_queue_depth() -> dict: Count every queued simulation per status
+        - cancel_pending(task_id) -> int: Cancel a task's simulations that have not been claimed yet
+        - get_results(task_id, storm_hash=None, kc_min=None, kc_max=None, path=None) -> list: Partial reads of a task's results
+        - the getters, get_results, get_status_counts and get_queue_depth have *_async twins on the async pool (api.lib.db.async_connection)
 
 
     Bulk Operations:
-        - insert_simulations(simulations_data) -> list: Bulk insert multiple simulations
+        - insert_simulations(simulations_data, batch_size=BULK_INSERT_BATCH_SIZE, method='values') -> list: Bulk insert multiple simulations
         - queue_simulation(storm_data, catg_data, kc, m, initial_loss, continuous_loss, user_id=None, task_id=None): Queue simulation for bulk insert
+        - queue_grid(storms_data, catg_data, kc_list, m, initial_loss, continuous_loss, user_id=None, task_id=None): Queue a kc x storm grid for bulk insert
         - commit_local_simulations() -> list: Commit all queued simulations
         - queue_update(simulation_id, status, result=None): Queue simulation update
-        - commit_local_updates(): Commit all queued updates
+        - commit_local_updates() -> set: Commit all queued updates to rows this worker holds, returning their ids
+
+    Migration:
+        - migrate_inline_blobs(batch_size=1000) -> int: Move inline storm/catg text of old rows into input_blobs
 
     Queue Management:
+        - claim_simulations(task_id=None, chunk_size=20) -> list: Atomically claim pending simulations for a worker, under a lease
+        - renew_leases() -> int: Heartbeat extending the leases of this worker's claimed rows
+        - reclaim_expired_leases(batch_size=SWEEP_BATCH_SIZE) -> int: Put rows of dead workers back to 'pending'
         - get_pending_simulations(chunk_size=None) -> list: Get pending simulation IDs
-        - clean_expired_tasks(): Clean up expired simulations
+        - mark_expired_tasks(batch_size=SWEEP_BATCH_SIZE) -> dict: Expire pending rows past their retention
+        - clean_expired_tasks(batch_size=SWEEP_BATCH_SIZE) -> int: Delete finished rows past their retention, one batch
 """
 
-import uuid
+import io
+import logging
 import os
-import psycopg2
+import socket
+import uuid
 import json
 from datetime import datetime, timedelta, timezone
 
-import dotenv
-dotenv.load_dotenv('.env.development.local')
-
-EXPIRATION_TIME = timedelta(minutes=1)
+from psycopg2.extras import Json
+
+from api.lib import hydrograph_codec, input_cache, metrics
+from api.lib.db import async_connection, input_blobs_db
+from api.lib.db.connection import connection, execute_values, is_sqlite, json_value, transaction
+from api.lib.db.schema import add_column, ensure_jsonb, json_type
+
+# How long a row is kept once it reaches a status: pending rows that no worker claims in time
+# become 'expired', rows in FINAL_STATUSES are deleted by the sweeper (api.lib.queue_sweeper)
+RETENTION_DEFAULT_HOURS = {'pending': 24, 'completed': 24 * 7, 'error': 24 * 7, 'cancelled': 24, 'expired': 24}
+RETENTION = {
+    status: timedelta(hours=float(os.environ.get(f'SIMULATION_RETENTION_{status.upper()}_HOURS', hours)))
+    for status, hours in RETENTION_DEFAULT_HOURS.items()
+}
+FINAL_STATUSES = ('completed', 'error', 'cancelled', 'expired')
+EXPIRATION_TIME = RETENTION['pending']
+# Claimed rows whose worker stops renewing its lease for this long go back to 'pending'
+LEASE_SECONDS = float(os.environ.get('SIMULATION_LEASE_SECONDS', 300))
+SWEEP_BATCH_SIZE = int(os.environ.get('SIMULATION_SWEEP_BATCH_SIZE', 1000))
+BULK_INSERT_BATCH_SIZE = int(os.environ.get('SIMULATION_BULK_INSERT_BATCH_SIZE', 1000))
+BULK_INSERT_METHODS = ('row', 'values', 'copy')
+STREAM_FETCH_SIZE = int(os.environ.get('SIMULATION_STREAM_FETCH_SIZE', 500))
+# 'binary' stores long float series of results (hydrographs) zlib-compressed in the hydrographs column
+RESULT_ENCODING = os.environ.get('SIMULATION_RESULT_ENCODING', 'json')
+
+_INSERT_COLUMNS = "storm_hash, catg_hash, kc, m, initial_loss, continuous_loss, user_id, task_id, expires_at"
+
+# storm_data / catg_data only hold text for rows queued before input_blobs existed,
+# newer rows reference input_blobs through storm_hash / catg_hash
+_SIMULATION_COLUMNS = ('id', 'storm_data', 'catg_data', 'kc', 'initial_loss', 'm', 'continuous_loss',
+                       'status', 'user_id', 'task_id', 'result', 'submitted_at', 'expires_at',
+                       'storm_hash', 'catg_hash', 'hydrographs')
+_RETURNING_SIMULATIONS = f"RETURNING {', '.join(_SIMULATION_COLUMNS)}"
+_BLOB_COLUMNS = (('storm_data', 'storm_hash'), ('catg_data', 'catg_hash'))
+# Everything except the file texts and the result, for listings that never look at the payloads
+METADATA_COLUMNS = tuple(column for column in _SIMULATION_COLUMNS if column not in ('storm_data', 'catg_data', 'result', 'hydrographs'))
+
+
+def _projection(columns):
+    """Validate a requested column set, adding the hash columns its blob-backed columns resolve through."""
+    if columns is None:
+        return _SIMULATION_COLUMNS
+    columns = tuple(columns)
+    unknown = set(columns) - set(_SIMULATION_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown simulation columns: {sorted(unknown)}")
+    extra = tuple(hash_column for data_column, hash_column in _BLOB_COLUMNS
+                  if data_column in columns and hash_column not in columns)
+    if 'result' in columns and 'hydrographs' not in columns:
+        extra += ('hydrographs',)
+    return columns + extra
+
+
+def _encode_result(result, encoding=RESULT_ENCODING):
+    """Return the (result, hydrographs) column values stored for a result."""
+    if result is None:
+        return None, None
+    if encoding == 'binary':
+        result, series = hydrograph_codec.split_series(result)
+        if series:
+            return Json(result), hydrograph_codec.encode(series)
+    return Json(result), None
+
+
+def _decode_result(result, hydrographs):
+    """Put the series stored in hydrographs back into result, decoding only those it references."""
+    if not hydrographs or result is None:
+        return result
+    paths = hydrograph_codec.series_paths(result)
+    if not paths:
+        return result
+    return hydrograph_codec.join_series(result, hydrograph_codec.decode(hydrographs, paths))
+
+
+def _utcnow():
+    # Passed as a parameter rather than CURRENT_TIMESTAMP, so both backends compare like with like
+    return datetime.now(timezone.utc)
+
+
+def _expires_at(status, now=None):
+    return (now or _utcnow()) + RETENTION[status]
+
+
+def _skip_locked():
+    # SQLite transactions hold the database write lock from BEGIN, so rows need no locking there
+    return "" if is_sqlite() else "FOR UPDATE SKIP LOCKED"
+
+
+_STATUS_COUNTS = "SELECT status, COUNT(*) FROM simulations_queue WHERE task_id = %s GROUP BY status"
+_QUEUE_DEPTH = "SELECT status, COUNT(*) FROM simulations_queue GROUP BY status"
+
+
+def _filtered_select(columns, filters, limit=None):
+    """Return (query, params) selecting columns of the rows equal to every (column, value) of filters."""
+    query = _select(columns)
+    params = [value for _, value in filters]
+    if filters:
+        query += " WHERE " + " AND ".join(f"{column} = %s" for column, _ in filters)
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, tuple(params)
+
+
+def _task_filters(task_id, status=None):
+    return [('task_id', task_id)] + ([('status', status)] if status else [])
+
+
+def _results_query(task_id, storm_hash, kc_min, kc_max, path):
+    params = []
+    result = "result"
+    if path and not is_sqlite():
+        result = "result #> %s"
+        params.append(list(path))
+    query = f"SELECT id, storm_hash, kc, {result}, hydrographs FROM simulations_queue WHERE task_id = %s AND status = 'completed'"
+    params.append(task_id)
+    if storm_hash is not None:
+        query += " AND storm_hash = %s"
+        params.append(storm_hash)
+    if kc_min is not None:
+        query += " AND kc >= %s"
+        params.append(kc_min)
+    if kc_max is not None:
+        query += " AND kc <= %s"
+        params.append(kc_max)
+    return query + " ORDER BY storm_hash, kc", tuple(params)
+
+
+def _results_from_rows(rows, path):
+    results = []
+    for sim_id, sim_storm_hash, kc, value, hydrographs in rows:
+        value = json_value(value)
+        if path and is_sqlite():
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+        results.append({'id': str(sim_id), 'storm_hash': sim_storm_hash, 'kc': kc, 'result': _decode_result(value, hydrographs)})
+    return results
+
+
+def _select(columns):
+    return f"SELECT {', '.join(columns)} FROM simulations_queue"
+
+
+def _copy_value(value):
+    """Format one value for COPY ... FROM STDIN text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
 
 class SimulationDB:
-    def __init__(self):
+    def __init__(self, worker_id=None):
         self.pending_simulations = []
+        self.pending_blobs = {}
         self.pending_updates = []
+        # Owner of the leases on rows this instance claims
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
         
-    def get_db_connection(self):
-        return psycopg2.connect(os.environ['POSTGRES_URL'])
-
     def reset_db(self):
-        conn = self.get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DROP TABLE IF EXISTS simulations_queue")
-        conn.commit()
-        cur.close()
-        conn.close()
+        with transaction() as cur:
+            cur.execute("DROP TABLE IF EXISTS simulations_queue")
         self.init_db()
 
 
@@ -59,91 +222,282 @@ class SimulationDB:
         return f"SimulationDB(pending_simulations={len(self.pending_simulations)}, pending_updates={len(self.pending_updates)})"
 
     def init_db(self):
-        conn = self.get_db_connection()
-        cur = conn.cursor()
-        
-        # Create simulations table if it doesn't exist
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS simulations_queue (
-                id UUID PRIMARY KEY,
-                storm_data TEXT,
-                catg_data TEXT,
-                kc FLOAT,
-                initial_loss FLOAT,
-                m FLOAT,
-                continuous_loss FLOAT,
-                status VARCHAR(50) NOT NULL DEFAULT 'pending',
-                user_id VARCHAR(255),
-                task_id VARCHAR(255),
-                result TEXT,
-                submitted_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMPTZ NOT NULL
-            )
-        """)
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-
-    def _get_simulation_dict(self, result):
+        with transaction() as cur:
+            # Create simulations table if it doesn't exist
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS simulations_queue (
+                    id UUID PRIMARY KEY,
+                    storm_data TEXT,
+                    catg_data TEXT,
+                    kc FLOAT,
+                    initial_loss FLOAT,
+                    m FLOAT,
+                    continuous_loss FLOAT,
+                    status VARCHAR(50) NOT NULL DEFAULT 'pending',
+                    user_id VARCHAR(255),
+                    task_id VARCHAR(255),
+                    result {json_type()},
+                    submitted_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    expires_at TIMESTAMPTZ NOT NULL
+                )
+            """)
+            if not is_sqlite():
+                # Let bulk inserts generate ids server-side (SQLite inserts always pass gen_random_uuid())
+                cur.execute("ALTER TABLE simulations_queue ALTER COLUMN id SET DEFAULT gen_random_uuid()")
+            add_column(cur, 'simulations_queue', 'storm_hash', 'CHAR(64)')
+            add_column(cur, 'simulations_queue', 'catg_hash', 'CHAR(64)')
+            # Results are JSONB, with long float series optionally split out into a compressed binary column
+            ensure_jsonb(cur, 'simulations_queue', 'result')
+            add_column(cur, 'simulations_queue', 'hydrographs', 'BYTEA')
+            # Status counts per task and expiry sweeps stay index-only regardless of table size
+            cur.execute("CREATE INDEX IF NOT EXISTS simulations_queue_task_status_idx ON simulations_queue (task_id, status)")
+            cur.execute("CREATE INDEX IF NOT EXISTS simulations_queue_expires_at_idx ON simulations_queue (expires_at)")
+            # Worker lease of in_progress rows, renewed by heartbeats and reclaimed once it lapses
+            add_column(cur, 'simulations_queue', 'lease_owner', 'VARCHAR(255)')
+            add_column(cur, 'simulations_queue', 'lease_expires_at', 'TIMESTAMPTZ')
+            cur.execute("CREATE INDEX IF NOT EXISTS simulations_queue_status_expires_at_idx ON simulations_queue (status, expires_at)")
+            cur.execute("CREATE INDEX IF NOT EXISTS simulations_queue_lease_idx ON simulations_queue (lease_expires_at) WHERE status = 'in_progress'")
+        input_blobs_db.init_db()
+
+    def _get_simulation_dict(self, result, columns=_SIMULATION_COLUMNS):
         """Helper function to convert DB result to simulation dict"""
         if not result:
             return None
-        return {
-            'storm_data': result[0],
-            'catg_data': result[1],
-            'kc': result[2],
-            'initial_loss': result[3],
-            'm': result[4],
-            'continuous_loss': result[5],
-            'status': result[6],
-            'user_id': result[7],
-            'task_id': result[8],
-            'result': result[9],
-            'submitted_at': result[10],
-            'expires_at': result[11]
-        }
-    
-    def _execute_query(self, query, params, single_result=False):
+        simulation = dict(zip(columns, result))
+        if 'result' in simulation:
+            simulation['result'] = _decode_result(json_value(simulation['result']), simulation.pop('hydrographs', None))
+        return simulation
+
+    def _resolve_blobs(self, cur, simulations, cache=None):
+        """
+        Fill storm_data / catg_data from input_blobs, fetching each distinct blob once per batch.
+
+        Only the data columns present in the rows are resolved. Pass a dict or an
+        input_cache.LRUCache as cache to reuse blobs across batches.
+        """
+        if not simulations:
+            return simulations
+        blob_columns, blobs, missing = self._cached_blobs(simulations, cache)
+        return self._fill_blobs(simulations, blob_columns, blobs, input_blobs_db.fetch_blobs(cur, missing), cache)
+
+    async def _resolve_blobs_async(self, cur, simulations, cache=None):
+        """_resolve_blobs on an async_connection cursor."""
+        if not simulations:
+            return simulations
+        blob_columns, blobs, missing = self._cached_blobs(simulations, cache)
+        return self._fill_blobs(simulations, blob_columns, blobs, await input_blobs_db.fetch_blobs_async(cur, missing), cache)
+
+    def _cached_blobs(self, simulations, cache):
+        """Return the blob columns present in the rows, the blobs found in cache and the hashes left to fetch."""
+        blob_columns = [(data_column, hash_column) for data_column, hash_column in _BLOB_COLUMNS
+                        if data_column in simulations[0]]
+        hashes = {sim[hash_column] for sim in simulations for data_column, hash_column in blob_columns
+                  if sim[data_column] is None and sim[hash_column]}
+        blobs = {}
+        if cache is not None:
+            for blob_hash in hashes:
+                data = cache.get(blob_hash)
+                if data is not None:
+                    blobs[blob_hash] = data
+        return blob_columns, blobs, [blob_hash for blob_hash in hashes if blob_hash not in blobs]
+
+    def _fill_blobs(self, simulations, blob_columns, blobs, fetched, cache):
+        blobs.update(fetched)
+        if cache is not None:
+            cache.update(fetched)
+        for sim in simulations:
+            for data_column, hash_column in blob_columns:
+                if sim[data_column] is None:
+                    sim[data_column] = blobs.get(sim[hash_column])
+        return simulations
+
+    def _execute_query(self, query, params, single_result=False, columns=_SIMULATION_COLUMNS):
         """Helper function to execute a query and return simulation data."""
         try:
-            conn = self.get_db_connection()
-            cur = conn.cursor()
-            cur.execute(query, params)
-            if single_result:
-                result = cur.fetchone()
-                return self._get_simulation_dict(result)
-            else:
-                results = cur.fetchall()
-                return [self._get_simulation_dict(row) for row in results]
+            with transaction() as cur:
+                cur.execute(query, params)
+                if single_result:
+                    result = self._get_simulation_dict(cur.fetchone(), columns)
+                    return self._resolve_blobs(cur, [result])[0] if result else None
+                else:
+                    results = [self._get_simulation_dict(row, columns) for row in cur.fetchall()]
+                    return self._resolve_blobs(cur, results)
+        except Exception as e:
+            logging.warning("Error executing query: %s", e)
+        return None if single_result else []
+
+    async def _execute_query_async(self, query, params, single_result=False, columns=_SIMULATION_COLUMNS):
+        """_execute_query on the async pool."""
+        try:
+            async with async_connection.transaction() as cur:
+                await cur.execute(query, params)
+                if single_result:
+                    result = self._get_simulation_dict(cur.fetchone(), columns)
+                    return (await self._resolve_blobs_async(cur, [result]))[0] if result else None
+                results = [self._get_simulation_dict(row, columns) for row in cur.fetchall()]
+                return await self._resolve_blobs_async(cur, results)
         except Exception as e:
-            print(f"Error executing query: {e}")
-        finally:
-            cur.close()
-            conn.close()
+            logging.warning("Error executing query: %s", e)
         return None if single_result else []
 
-    # Retrieval functions
-    def get_simulation_by_id(self, simulation_id):
+    # Retrieval functions. Each has an _async twin on the async pool for the async endpoints,
+    # which falls back to running it in a worker thread where that pool is not available
+    @metrics.db_call
+    def get_simulation_by_id(self, simulation_id, columns=None):
         """Get simulation by ID using the unified query function."""
-        query = """SELECT storm_data, catg_data, kc, initial_loss, m, continuous_loss,
-                status, user_id, task_id, result, submitted_at, expires_at 
-                FROM simulations_queue WHERE id = %s"""
-        return self._execute_query(query, (simulation_id,), single_result=True)
+        columns = _projection(columns)
+        return self._execute_query(*_filtered_select(columns, [('id', simulation_id)]), single_result=True, columns=columns)
 
-    def get_simulations_by_task_id(self, task_id, status=None, chunk_size=None):
+    @metrics.db_call
+    @async_connection.fallback(get_simulation_by_id)
+    async def get_simulation_by_id_async(self, simulation_id, columns=None):
+        columns = _projection(columns)
+        return await self._execute_query_async(*_filtered_select(columns, [('id', simulation_id)]), single_result=True, columns=columns)
+
+    @metrics.db_call
+    def get_simulations_by_task_id(self, task_id, status=None, chunk_size=None, columns=None):
         """Get simulation by task ID using the unified query function."""
-        params = [task_id]
-        query = """SELECT storm_data, catg_data, kc, initial_loss, m, continuous_loss,
-                status, user_id, task_id, result, submitted_at, expires_at 
-                FROM simulations_queue WHERE task_id = %s"""
-        if status:
-            query += " AND status = %s"
-            params.append(status)
-        if chunk_size:
-            query += " LIMIT %s"
-            params.append(chunk_size)
-        return self._execute_query(query, tuple(params))
+        columns = _projection(columns)
+        return self._execute_query(*_filtered_select(columns, _task_filters(task_id, status), chunk_size), columns=columns)
+
+    @metrics.db_call
+    @async_connection.fallback(get_simulations_by_task_id)
+    async def get_simulations_by_task_id_async(self, task_id, status=None, chunk_size=None, columns=None):
+        columns = _projection(columns)
+        return await self._execute_query_async(*_filtered_select(columns, _task_filters(task_id, status), chunk_size), columns=columns)
+
+    @metrics.db_call
+    def iter_simulations(self, task_id=None, user_id=None, status=None, columns=None, fetch_size=STREAM_FETCH_SIZE):
+        """
+        Stream the simulations matching the given filters in constant memory.
+
+        Rows are read through a named (server-side) cursor fetch_size at a time, and the blobs
+        of each batch are resolved before it is yielded. The pooled connection stays checked
+        out until the generator is exhausted or closed.
+
+        Parameters:
+        - task_id, user_id, status: Optional equality filters
+        - columns (iterable): Columns to select, every column when None
+        - fetch_size (int): Rows fetched from the server per round trip
+
+        Returns:
+        - generator of dict, ordered by submission time
+        """
+        columns = _projection(columns)
+        filters = []
+        params = []
+        for column, value in (('task_id', task_id), ('user_id', user_id), ('status', status)):
+            if value is not None:
+                filters.append(f"{column} = %s")
+                params.append(value)
+        query = _select(columns)
+        if filters:
+            query += " WHERE " + " AND ".join(filters)
+        query += " ORDER BY submitted_at, id"
+
+        blob_cache = input_cache.LRUCache(fetch_size)
+        with connection() as conn:
+            with conn.cursor(name=f"simulations_{uuid.uuid4().hex}") as cur, conn.cursor() as blob_cur:
+                cur.itersize = fetch_size
+                cur.execute(query, tuple(params))
+                while rows := cur.fetchmany(fetch_size):
+                    batch = [self._get_simulation_dict(row, columns) for row in rows]
+                    yield from self._resolve_blobs(blob_cur, batch, blob_cache)
+
+    @metrics.db_call
+    def claim_simulations(self, task_id=None, chunk_size=20):
+        """
+        Atomically claim up to chunk_size pending simulations for this worker.
+
+        The rows are selected with FOR UPDATE SKIP LOCKED and moved to 'in_progress' in the
+        same statement, so concurrent workers never receive the same simulation. Each row
+        gets a lease of LEASE_SECONDS held by self.worker_id; renew_leases extends it while
+        the batch runs, and reclaim_expired_leases puts rows of a dead worker back to 'pending'.
+        """
+        params = [self.worker_id, _utcnow() + timedelta(seconds=LEASE_SECONDS)]
+        task_filter = ""
+        if task_id:
+            task_filter = "AND task_id = %s"
+            params.append(task_id)
+        params.append(chunk_size)
+        with transaction() as cur:
+            cur.execute(
+                f"""UPDATE simulations_queue SET status = 'in_progress', lease_owner = %s, lease_expires_at = %s
+                WHERE id IN (
+                    SELECT id FROM simulations_queue
+                    WHERE status = 'pending' {task_filter}
+                    ORDER BY submitted_at
+                    LIMIT %s
+                    {_skip_locked()}
+                )
+                {_RETURNING_SIMULATIONS}""",
+                tuple(params)
+            )
+            simulations = [self._get_simulation_dict(row) for row in cur.fetchall()]
+            # Workers see the same catchment and storms batch after batch, keep them in process
+            return self._resolve_blobs(cur, simulations, input_cache.blobs)
+
+    @metrics.db_call
+    def get_results(self, task_id, storm_hash=None, kc_min=None, kc_max=None, path=None):
+        """
+        Return the completed results of a task, optionally one storm, a kc range or part of each result.
+
+        Parameters:
+        - storm_hash (str): Only the simulations of this storm file
+        - kc_min, kc_max (float): Only kc values within this range
+        - path (list[str]): Keys leading to the part of each result to return, extracted in the query
+
+        Returns:
+        - list: [{'id', 'storm_hash', 'kc', 'result'}, ...] ordered by storm and kc
+        """
+        with transaction() as cur:
+            cur.execute(*_results_query(task_id, storm_hash, kc_min, kc_max, path))
+            return _results_from_rows(cur.fetchall(), path)
+
+    @metrics.db_call
+    @async_connection.fallback(get_results)
+    async def get_results_async(self, task_id, storm_hash=None, kc_min=None, kc_max=None, path=None):
+        async with async_connection.transaction() as cur:
+            await cur.execute(*_results_query(task_id, storm_hash, kc_min, kc_max, path))
+            return _results_from_rows(cur.fetchall(), path)
+
+    @metrics.db_call
+    def get_status_counts(self, task_id):
+        """Return {status: count} of a task's simulations, aggregated in SQL."""
+        with transaction() as cur:
+            cur.execute(_STATUS_COUNTS, (task_id,))
+            return dict(cur.fetchall())
+
+    @metrics.db_call
+    @async_connection.fallback(get_status_counts)
+    async def get_status_counts_async(self, task_id):
+        async with async_connection.transaction() as cur:
+            await cur.execute(_STATUS_COUNTS, (task_id,))
+            return dict(cur.fetchall())
+
+    @metrics.db_call
+    def get_queue_depth(self):
+        """Return {status: count} over the whole queue."""
+        with transaction() as cur:
+            cur.execute(_QUEUE_DEPTH)
+            return dict(cur.fetchall())
+
+    @metrics.db_call
+    @async_connection.fallback(get_queue_depth)
+    async def get_queue_depth_async(self):
+        async with async_connection.transaction() as cur:
+            await cur.execute(_QUEUE_DEPTH)
+            return dict(cur.fetchall())
+
+    @metrics.db_call
+    def cancel_pending(self, task_id):
+        """Move a task's pending simulations to 'cancelled' in one statement, returning how many moved."""
+        with transaction() as cur:
+            cur.execute(
+                "UPDATE simulations_queue SET status = 'cancelled', expires_at = %s WHERE task_id = %s AND status = 'pending'",
+                (_expires_at('cancelled'), task_id)
+            )
+            return cur.rowcount
 
     def update_simulation_status(self, simulations, status):
         """Update the status of a list of simulations"""
@@ -152,39 +506,66 @@ class SimulationDB:
         self.commit_local_updates()
     
 
-    def get_simulations_by_user_id(self, user_id):
+    @metrics.db_call
+    def get_simulations_by_user_id(self, user_id, columns=None):
         """Get all simulations for a given user ID."""
-        query = """SELECT storm_data, catg_data, kc, initial_loss, m, continuous_loss,
-                status, user_id, task_id, result, submitted_at, expires_at 
-                FROM simulations_queue WHERE user_id = %s"""
-        return self._execute_query(query, (user_id,))
+        columns = _projection(columns)
+        return self._execute_query(*_filtered_select(columns, [('user_id', user_id)]), columns=columns)
 
-    def get_simulations_by_status(self, status, chunk_size=None):
+    @metrics.db_call
+    @async_connection.fallback(get_simulations_by_user_id)
+    async def get_simulations_by_user_id_async(self, user_id, columns=None):
+        columns = _projection(columns)
+        return await self._execute_query_async(*_filtered_select(columns, [('user_id', user_id)]), columns=columns)
+
+    @metrics.db_call
+    def get_simulations_by_status(self, status, chunk_size=None, columns=None):
         """Get simulations filtered by status."""
-        query = """SELECT storm_data, catg_data, kc, initial_loss, m, continuous_loss,
-                status, user_id, task_id, result, submitted_at, expires_at 
-                FROM simulations_queue WHERE status = %s"""
-        params = [status]
-        if chunk_size:
-            query += " LIMIT %s"
-            params.append(chunk_size)
-        return self._execute_query(query, tuple(params))
-
-    def get_all_simulations(self, chunk_size=None):
+        columns = _projection(columns)
+        return self._execute_query(*_filtered_select(columns, [('status', status)], chunk_size), columns=columns)
+
+    @metrics.db_call
+    @async_connection.fallback(get_simulations_by_status)
+    async def get_simulations_by_status_async(self, status, chunk_size=None, columns=None):
+        columns = _projection(columns)
+        return await self._execute_query_async(*_filtered_select(columns, [('status', status)], chunk_size), columns=columns)
+
+    @metrics.db_call
+    def get_all_simulations(self, chunk_size=None, columns=None):
         """Get all simulations"""
-        query = """SELECT storm_data, catg_data, kc, initial_loss, m, continuous_loss,
-                status, user_id, task_id, result, submitted_at, expires_at
-                FROM simulations_queue"""
-        if chunk_size:
-            query += " LIMIT %s"
-            return self._execute_query(query, (chunk_size,))
-        return self._execute_query(query, ())
+        columns = _projection(columns)
+        return self._execute_query(*_filtered_select(columns, [], chunk_size), columns=columns)
+
+    @metrics.db_call
+    @async_connection.fallback(get_all_simulations)
+    async def get_all_simulations_async(self, chunk_size=None, columns=None):
+        columns = _projection(columns)
+        return await self._execute_query_async(*_filtered_select(columns, [], chunk_size), columns=columns)
    
     # Queue functions
     def queue_simulation(self, storm_data, catg_data, kc, m, initial_loss, continuous_loss, user_id=None, task_id=None):
         """Add a simulation to the pending queue without inserting to database"""
-        expires_at = (datetime.now(timezone.utc) + EXPIRATION_TIME)
-        self.pending_simulations.append((storm_data, catg_data, kc, m, initial_loss, continuous_loss, user_id, task_id, expires_at))
+        expires_at = _expires_at('pending')
+        storm_hash = self._queue_blob(storm_data)
+        catg_hash = self._queue_blob(catg_data)
+        self.pending_simulations.append((storm_hash, catg_hash, kc, m, initial_loss, continuous_loss, user_id, task_id, expires_at))
+
+    def queue_grid(self, storms_data, catg_data, kc_list, m, initial_loss, continuous_loss, user_id=None, task_id=None):
+        """Queue one simulation per (kc, storm), hashing each input file once rather than once per row."""
+        expires_at = _expires_at('pending')
+        catg_hash = self._queue_blob(catg_data)
+        storm_hashes = [self._queue_blob(storm) for storm in storms_data]
+        self.pending_simulations.extend(
+            (storm_hash, catg_hash, kc, m, initial_loss, continuous_loss, user_id, task_id, expires_at)
+            for kc in kc_list for storm_hash in storm_hashes
+        )
+
+    def _queue_blob(self, data):
+        if data is None:
+            return None
+        blob_hash, data = input_blobs_db.make_blob(data)
+        self.pending_blobs[blob_hash] = data
+        return blob_hash
 
 
     def commit_local_simulations(self):
@@ -192,30 +573,101 @@ class SimulationDB:
         if not self.pending_simulations:
             return []
             
-        simulation_ids = self.insert_simulations(self.pending_simulations)
+        simulation_ids = self.insert_simulations(self.pending_simulations, blobs=self.pending_blobs)
         self.pending_simulations = []  # Clear the pending queue
+        self.pending_blobs = {}
         return simulation_ids
     
 
-    def insert_simulations(self, simulations_data):
-        """Bulk insert simulations into the database"""
-        conn = self.get_db_connection()
-        cur = conn.cursor()
-        
+    @metrics.db_call
+    def insert_simulations(self, simulations_data, batch_size=BULK_INSERT_BATCH_SIZE, method='values', blobs=None):
+        """
+        Bulk insert simulations into the database in a single transaction.
+
+        Parameters:
+        - simulations_data (list[tuple]): Rows as built by queue_simulation, referencing blobs by hash
+        - blobs (dict): {hash: text} input blobs the rows reference, stored first if not already present
+        - batch_size (int): Rows sent per statement / COPY round trip
+        - method (str): 'values' for multi-row INSERT ... VALUES, 'copy' for COPY FROM STDIN
+          through a staging table, 'row' for one INSERT per row (kept as the benchmark baseline)
+
+        Returns:
+        - list[str]: Server-generated simulation IDs, in the order of simulations_data
+        """
+        if method not in BULK_INSERT_METHODS:
+            raise ValueError(f"Unknown insert method: {method}, expected one of {BULK_INSERT_METHODS}")
+        simulations_data = list(simulations_data)
+        if not simulations_data:
+            return []
+
+        if method == 'copy' and is_sqlite():
+            method = 'values'  # no COPY in SQLite, and in-process inserts gain nothing from it
+        with transaction() as cur:
+            input_blobs_db.store_blobs(cur, blobs)
+            if method == 'row':
+                return self._insert_rows(cur, simulations_data)
+            if method == 'copy':
+                return self._insert_copy(cur, simulations_data, batch_size)
+            return self._insert_values(cur, simulations_data, batch_size)
+
+    def _insert_rows(self, cur, simulations_data):
         simulation_ids = []
         for simulation in simulations_data:
             simulation_id = str(uuid.uuid4())
             cur.execute(
                 """INSERT INTO simulations_queue 
-                (id, storm_data, catg_data, kc, m, initial_loss, continuous_loss, user_id, task_id, status, expires_at)
+                (id, storm_hash, catg_hash, kc, m, initial_loss, continuous_loss, user_id, task_id, status, expires_at)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending', %s)""",
                 (simulation_id, *simulation)
             )
             simulation_ids.append(simulation_id)
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        return simulation_ids
+
+    def _insert_values(self, cur, simulations_data, batch_size):
+        # execute_values returns RETURNING rows page by page, in VALUES order
+        rows = execute_values(
+            cur,
+            f"""INSERT INTO simulations_queue (id, {_INSERT_COLUMNS}, status)
+            VALUES %s RETURNING id""",
+            simulations_data,
+            template="(gen_random_uuid(), %s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending')",
+            page_size=batch_size,
+            fetch=True,
+        )
+        return [str(row[0]) for row in rows]
+
+    def _insert_copy(self, cur, simulations_data, batch_size):
+        # ids are generated in the staging table so they can be read back in input order
+        cur.execute("""
+            CREATE TEMP TABLE simulations_staging (
+                ord SERIAL,
+                id UUID NOT NULL DEFAULT gen_random_uuid(),
+                storm_hash CHAR(64),
+                catg_hash CHAR(64),
+                kc FLOAT,
+                m FLOAT,
+                initial_loss FLOAT,
+                continuous_loss FLOAT,
+                user_id VARCHAR(255),
+                task_id VARCHAR(255),
+                expires_at TIMESTAMPTZ
+            ) ON COMMIT DROP
+        """)
+        simulation_ids = []
+        for start in range(0, len(simulations_data), batch_size):
+            buffer = io.StringIO()
+            for simulation in simulations_data[start:start + batch_size]:
+                buffer.write('\t'.join(_copy_value(value) for value in simulation))
+                buffer.write('\n')
+            buffer.seek(0)
+            cur.copy_expert(f"COPY simulations_staging ({_INSERT_COLUMNS}) FROM STDIN", buffer)
+            cur.execute(
+                f"""INSERT INTO simulations_queue (id, {_INSERT_COLUMNS}, status)
+                SELECT id, {_INSERT_COLUMNS}, 'pending' FROM simulations_staging"""
+            )
+            cur.execute("SELECT id FROM simulations_staging ORDER BY ord")
+            simulation_ids.extend(str(row[0]) for row in cur.fetchall())
+            cur.execute("TRUNCATE simulations_staging")
         return simulation_ids
 
 
@@ -224,83 +676,186 @@ class SimulationDB:
         """Add a simulation update to the pending queue"""
         self.pending_updates.append((simulation_id, status, result))
 
+    @metrics.db_call
     def commit_local_updates(self):
-        """Commit all pending updates to database at once"""
+        """
+        Commit all pending updates to database at once.
+
+        Only rows still in_progress under this worker's lease are updated: a row whose lease
+        lapsed may have been reclaimed and claimed by another worker, which saves it instead.
+
+        Returns:
+        - set: Ids of the simulations that were updated
+        """
         if not self.pending_updates:
-            return
+            return set()
             
-        conn = self.get_db_connection()
-        cur = conn.cursor()
-        
-        cur.executemany(
-            "UPDATE simulations_queue SET status = %s, result = %s WHERE id = %s",
-            [(status, result, sim_id) for sim_id, status, result in self.pending_updates]
-        )
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        now = _utcnow()
+        updated = set()
+        # Finished rows are kept for their status' retention, then deleted by the sweeper
+        with transaction() as cur:
+            for sim_id, status, result in self.pending_updates:
+                cur.execute(
+                    """UPDATE simulations_queue
+                    SET status = %s, result = %s, hydrographs = %s, expires_at = %s, lease_owner = NULL, lease_expires_at = NULL
+                    WHERE id = %s AND lease_owner = %s AND status = 'in_progress'""",
+                    (status, *_encode_result(result), now + RETENTION.get(status, RETENTION['completed']), sim_id, self.worker_id)
+                )
+                if cur.rowcount:
+                    updated.add(sim_id)
         
         self.pending_updates = []  # Clear the pending updates
+        return updated
+
+
+    # Migration functions
+    @metrics.db_call
+    def migrate_inline_blobs(self, batch_size=1000):
+        """
+        Move storm_data / catg_data text of rows queued before input_blobs existed into input_blobs.
+
+        Runs in batches of batch_size rows, each in its own transaction, so it can run
+        alongside workers. Returns the number of rows migrated.
+        """
+        if is_sqlite():
+            return 0  # SQLite databases start out with input_blobs, there are no inline rows
+        migrated = 0
+        while True:
+            with transaction() as cur:
+                cur.execute("""
+                    WITH batch AS (
+                        SELECT id FROM simulations_queue
+                        WHERE storm_data IS NOT NULL OR catg_data IS NOT NULL
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    ), blobs AS (
+                        INSERT INTO input_blobs (hash, data)
+                        SELECT DISTINCT encode(sha256(convert_to(v.data, 'UTF8')), 'hex'), v.data
+                        FROM simulations_queue q
+                        JOIN batch ON batch.id = q.id,
+                        LATERAL (VALUES (q.storm_data), (q.catg_data)) AS v(data)
+                        WHERE v.data IS NOT NULL
+                        ON CONFLICT (hash) DO NOTHING
+                    )
+                    UPDATE simulations_queue q SET
+                        storm_hash = COALESCE(encode(sha256(convert_to(q.storm_data, 'UTF8')), 'hex'), q.storm_hash),
+                        catg_hash = COALESCE(encode(sha256(convert_to(q.catg_data, 'UTF8')), 'hex'), q.catg_hash),
+                        storm_data = NULL,
+                        catg_data = NULL
+                    FROM batch
+                    WHERE q.id = batch.id
+                """, (batch_size,))
+                count = cur.rowcount
+            if not count:
+                return migrated
+            migrated += count
 
 
     # Cleanup functions
-    def mark_expired_tasks(self):
-        """Mark expired pending tasks as 'expired'"""
-        conn = self.get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            """UPDATE simulations_queue 
-               SET status = 'expired' 
-               WHERE expires_at <= CURRENT_TIMESTAMP AT TIME ZONE 'UTC'"""
-        )
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-
-    def clean_expired_tasks(self):
-        """Remove tasks that have expired from the queue"""
-        conn = self.get_db_connection()
-        cur = conn.cursor()
-        
-        # Delete all expired tasks regardless of status
-        cur.execute(
-            """DELETE FROM simulations_queue 
-            WHERE expires_at <= CURRENT_TIMESTAMP AT TIME ZONE 'UTC'"""
-        )
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+    @metrics.db_call
+    def renew_leases(self):
+        """Heartbeat: extend the leases this worker holds on in_progress rows, returning how many."""
+        with transaction() as cur:
+            cur.execute(
+                "UPDATE simulations_queue SET lease_expires_at = %s WHERE lease_owner = %s AND status = 'in_progress'",
+                (_utcnow() + timedelta(seconds=LEASE_SECONDS), self.worker_id)
+            )
+            return cur.rowcount
+
+    @metrics.db_call
+    def reclaim_expired_leases(self, batch_size=SWEEP_BATCH_SIZE):
+        """
+        Put up to batch_size in_progress rows whose lease lapsed (their worker died) back to 'pending'.
+
+        Rows claimed before leases existed have no lease and are reclaimed too. Returns the number of rows.
+        """
+        with transaction() as cur:
+            cur.execute(
+                f"""UPDATE simulations_queue SET status = 'pending', lease_owner = NULL, lease_expires_at = NULL
+                WHERE id IN (
+                    SELECT id FROM simulations_queue
+                    WHERE status = 'in_progress' AND (lease_expires_at IS NULL OR lease_expires_at <= %s)
+                    LIMIT %s
+                    {_skip_locked()}
+                )""",
+                (_utcnow(), batch_size)
+            )
+            return cur.rowcount
+
+    @metrics.db_call
+    def mark_expired_tasks(self, batch_size=SWEEP_BATCH_SIZE):
+        """
+        Mark up to batch_size pending rows that outlived their retention as 'expired'.
+
+        Returns:
+        - dict: {user_id: number of rows expired}, so their quota reservations can be released
+        """
+        now = _utcnow()
+        with transaction() as cur:
+            cur.execute(
+                f"""UPDATE simulations_queue SET status = 'expired', expires_at = %s
+                WHERE id IN (
+                    SELECT id FROM simulations_queue
+                    WHERE status = 'pending' AND expires_at <= %s
+                    LIMIT %s
+                    {_skip_locked()}
+                )
+                RETURNING user_id""",
+                (_expires_at('expired', now), now, batch_size)
+            )
+            expired = {}
+            for (user_id,) in cur.fetchall():
+                expired[user_id] = expired.get(user_id, 0) + 1
+            return expired
+
+    @metrics.db_call
+    def clean_expired_tasks(self, batch_size=SWEEP_BATCH_SIZE):
+        """
+        Delete up to batch_size finished rows past their retention, returning how many were deleted.
+
+        Each call is one short transaction, callers loop until fewer than batch_size rows come back.
+        """
+        with transaction() as cur:
+            cur.execute(
+                f"""DELETE FROM simulations_queue
+                WHERE id IN (
+                    SELECT id FROM simulations_queue
+                    WHERE status = ANY(%s) AND expires_at <= %s
+                    LIMIT %s
+                    {_skip_locked()}
+                )""",
+                (list(FINAL_STATUSES), _utcnow(), batch_size)
+            )
+            return cur.rowcount
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
     db = SimulationDB()
-    print("\n=== Testing SimulationDB Operations ===")
+    logging.info("=== Testing SimulationDB Operations ===")
     
-    print("\n1. Adding simulations to queue...")
+    logging.info("1. Adding simulations to queue...")
     db.queue_simulation('storm_data', 'catg_data', 1.0, 1.0, 1.0, 1.0, 'user_id', 'task_id')
     db.queue_simulation('storm_data2', 'catg_data2', 2.0, 2.0, 2.0, 2.0, 'user_id2', 'task_id2')
-    print(f"Queue status after adding: {db}")
+    logging.info("Queue status after adding: %s", db)
 
-    print("\n2. Committing simulations to database...")
+    logging.info("2. Committing simulations to database...")
     simulation_ids = db.commit_local_simulations()
-    print(f"Queue status after commit: {db}")
-    print(f"Created simulation IDs: {simulation_ids}")
+    logging.info("Queue status after commit: %s", db)
+    logging.info("Created simulation IDs: %s", simulation_ids)
 
-    print("\n3. Testing simulation status update...")
-    print("Updating first simulation status to 'completed'")
+    logging.info("3. Testing simulation status update...")
+    logging.info("Updating first simulation status to 'completed'")
+    db.claim_simulations(task_id='task_id', chunk_size=1)
     db.queue_update(simulation_ids[0], 'completed', 'result')
     db.commit_local_updates()
-    print(f"Queue status after update commit: {db}")
+    logging.info("Queue status after update commit: %s", db)
 
-    print("\n4. Testing cleanup and retrieval operations...")
-    print("Cleaning expired tasks...")
+    logging.info("4. Testing cleanup and retrieval operations...")
+    logging.info("Cleaning expired tasks...")
     db.clean_expired_tasks()
-    print(f"Database status after cleanup: {db}")
+    logging.info("Database status after cleanup: %s", db)
 
-    print("\n5. Retrieving simulation details:")
+    logging.info("5. Retrieving simulation details:")
     simulation = db.get_simulation_by_id(simulation_ids[0])
     # Convert datetime objects to strings before JSON serialization
     def format_simulation_dates(sim):
@@ -310,16 +865,16 @@ if __name__ == "__main__":
         return sim
 
     format_simulation_dates(simulation)
-    print(f"First simulation details: {json.dumps(simulation, indent=2)}")
+    logging.debug("First simulation details: %s", json.dumps(simulation, indent=2))
 
-    print("\n6. Retrieving simulations by status:")
+    logging.info("6. Retrieving simulations by status:")
     pending_sims = [format_simulation_dates(sim) for sim in db.get_simulations_by_status('pending', chunk_size=1)]
-    print(f"Pending simulations (limit 1): {json.dumps(pending_sims, indent=2)}")
+    logging.debug("Pending simulations (limit 1): %s", json.dumps(pending_sims, indent=2))
     
     completed_sims = [format_simulation_dates(sim) for sim in db.get_simulations_by_status('completed', chunk_size=1)]
-    print(f"Completed simulations (limit 1): {json.dumps(completed_sims, indent=2)}")
+    logging.debug("Completed simulations (limit 1): %s", json.dumps(completed_sims, indent=2))
 
-    print("\n7. Retrieving all simulations:")
-    all_sims = [format_simulation_dates(sim) for sim in db.get_all_simulations(chunk_size=10)]
-    print(f"All simulations (limit 10): {json.dumps(all_sims, indent=2)}")
+    logging.info("7. Retrieving all simulations:")
+    all_sims = [format_simulation_dates(sim) for sim in db.get_all_simulations(chunk_size=10, columns=METADATA_COLUMNS)]
+    logging.debug("All simulations (limit 10): %s", json.dumps(all_sims, indent=2))
 
@@ -0,0 +1,217 @@
+"""
+Embedded SQLite backend, used instead of Postgres when DATABASE_BACKEND=sqlite.
+
+api.lib.db.connection delegates connection() and transaction() here, so the db
+modules keep writing psycopg2-style SQL: %s placeholders are rewritten to ?, and
+"= ANY(%s)" with a list becomes "IN (?, ?, ...)". Statements that have no SQLite
+equivalent (JSONB operators, SKIP LOCKED, COPY, ...) are branched on is_sqlite()
+in the modules themselves.
+
+The database runs in WAL mode, so readers never wait for the single writer, and
+every transaction() starts with BEGIN IMMEDIATE: writers queue on the write lock
+up front (for up to SQLITE_BUSY_TIMEOUT seconds) instead of failing when a read
+transaction tries to upgrade. Each thread reuses one connection.
+
+Functions:
+    - connection() -> context manager yielding this thread's connection
+    - transaction(cursor_factory=None) -> context manager yielding a cursor inside BEGIN IMMEDIATE ... COMMIT
+    - execute_values(cur, sql, argslist, template=None, page_size=100, fetch=False): psycopg2.extras.execute_values for SQLite
+    - close(): Close this thread's connection
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from psycopg2.extras import Json
+
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'hydroget.sqlite3')
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 30))
+
+_PLACEHOLDERS = re.compile(r"=\s*ANY\(%s\)|%s")
+
+
+def _adapt_datetime(value):
+    # Stored as UTC text that sorts and compares like CURRENT_TIMESTAMP ('YYYY-MM-DD HH:MM:SS')
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(sep=' ')
+
+
+def _convert_timestamp(value):
+    parsed = datetime.fromisoformat(value.decode())
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_adapter(Json, lambda value: json.dumps(value.adapted))
+sqlite3.register_adapter(uuid.UUID, str)
+sqlite3.register_converter('TIMESTAMPTZ', _convert_timestamp)
+sqlite3.register_converter('TIMESTAMP', _convert_timestamp)
+
+
+def translate(query, params=()):
+    """Rewrite a psycopg2-style query and its parameters for sqlite3."""
+    params = list(params or ())
+    values = []
+    position = 0
+
+    def replace(match):
+        nonlocal position
+        value = params[position]
+        position += 1
+        if match.group(0) == '%s':
+            values.append(value)
+            return '?'
+        values.extend(value)
+        return f"IN ({', '.join('?' * len(value))})"
+
+    query = _PLACEHOLDERS.sub(replace, query)
+    if position != len(params):
+        raise ValueError(f"Query has {position} placeholders but {len(params)} parameters were given")
+    return query, values
+
+
+class Cursor:
+    """sqlite3 cursor accepting psycopg2-style queries."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        # Set by callers that use server-side cursors on Postgres; SQLite already steps rows lazily
+        self.itersize = None
+
+    def execute(self, query, params=()):
+        self._cursor.execute(*translate(query, params))
+
+    def executemany(self, query, params_list):
+        self._cursor.executemany(query.replace('%s', '?'), params_list)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Connection:
+    """sqlite3 connection with the psycopg2 methods the db modules use."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, name=None, cursor_factory=None):
+        return Cursor(self._conn.cursor())
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute("COMMIT")
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def close(self):
+        self._conn.close()
+
+
+def _connect():
+    conn = sqlite3.connect(SQLITE_PATH, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                           detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.create_function('gen_random_uuid', 0, lambda: str(uuid.uuid4()))
+    return Connection(conn)
+
+
+_local = threading.local()
+
+
+@contextmanager
+def connection():
+    """Yield this thread's connection, rolling back anything left uncommitted."""
+    if getattr(_local, 'in_use', False):
+        # Nested use (e.g. writes while iterating a read) gets its own short-lived connection
+        conn = _connect()
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            conn.close()
+        return
+
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        conn = _local.conn = _connect()
+        _local.pid = os.getpid()
+    _local.in_use = True
+    try:
+        yield conn
+    finally:
+        _local.in_use = False
+        conn.rollback()
+
+
+@contextmanager
+def transaction(cursor_factory=None):
+    with connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            yield cur
+            conn.commit()
+        finally:
+            cur.close()
+
+
+def execute_values(cur, sql, argslist, template=None, page_size=100, fetch=False):
+    """
+    Run an INSERT ... VALUES %s statement for every row of argslist.
+
+    Rows are inserted one statement each: that is cheap in-process, and it keeps
+    RETURNING rows in argslist order, which multi-row SQLite inserts do not guarantee.
+    """
+    rows = []
+    statement = None
+    for args in argslist:
+        if statement is None:
+            statement = sql.replace('%s', template or f"({', '.join(['%s'] * len(args))})", 1)
+        cur.execute(statement, args)
+        if fetch:
+            rows.extend(cur.fetchall())
+    return rows if fetch else None
+
+
+def close():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
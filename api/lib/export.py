@@ -0,0 +1,173 @@
+"""
+Streaming export of calibration results as CSV, NDJSON or Parquet.
+
+Rows are read through a server-side cursor (calibration_kc_db.iter_kc_result_rows /
+iter_sweep_rows) and encoded a batch at a time, so an export runs in constant memory
+however many rows the task has:
+
+- grid calibrations: one row per (kc, hydrograph), with the task's m / initial loss /
+  continuous loss and every result field (peak, critical duration, ...)
+- sweeps: one row per (point, hydrograph), with the point's kc / m / initial loss /
+  continuous loss and every result field
+
+Rows come in a fixed order, so a download resumes by skipping the rows it already has
+(offset). CSV leaves out the header when resuming, so the rest can be appended.
+
+Parquet needs pyarrow, an optional extra that is not in requirements.txt (the endpoint
+answers 501 without it); each batch of PARQUET_ROW_GROUP_SIZE rows is one row group.
+"""
+
+import asyncio
+import csv
+import importlib.util
+import io
+import itertools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from api.lib import sweep
+from api.lib.db import calibration_kc_db
+
+EXPORT_FORMATS = ('csv', 'ndjson', 'parquet')
+MEDIA_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson', 'parquet': 'application/vnd.apache.parquet'}
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+# Rows encoded per chunk of the response
+EXPORT_BATCH_SIZE = 1000
+PARQUET_ROW_GROUP_SIZE = int(os.environ.get('EXPORT_PARQUET_ROW_GROUP_SIZE', 10_000))
+
+
+def export_kind(task):
+    """'sweep' or 'grid' for tasks whose results can be exported, None otherwise."""
+    if task.get('search_mode') == 'sweep':
+        return 'sweep'
+    if 'params' in task and 'total_kc' in task:
+        return 'grid'
+    return None
+
+
+def _single(value):
+    # Stored per-kc mappings hold one-element lists
+    return value[0] if isinstance(value, list) and len(value) == 1 else value
+
+
+def iter_rows(task_id, task, offset=0):
+    """Yield the task's result rows as dicts, skipping the first offset rows."""
+    if export_kind(task) == 'sweep':
+        layout = calibration_kc_db.get_sweep_layout(task_id) or {}
+        for index, key, point, fields in calibration_kc_db.iter_sweep_rows(task_id, offset):
+            if point is None:
+                point = sweep.grid_point(layout, index)
+            yield {'point': index, 'hydrograph': key, **dict(zip(sweep.AXES, point)), **fields}
+        return
+
+    params = task['params']
+    for _, kc, key, values in calibration_kc_db.iter_kc_result_rows(task_id, offset):
+        yield {
+            'hydrograph': key,
+            'kc': kc,
+            'm': params['m'],
+            'initial_loss': params['initial_loss'],
+            'continuous_loss': params['continuous_loss'],
+            **{field: _single(value) for field, value in values.items() if field != 'kc'},
+        }
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+def iter_csv(rows, header=True):
+    """Encode rows as CSV chunks; the columns are those of the first row."""
+    buffer = io.StringIO()
+    writer = None
+    for batch in _batches(rows, EXPORT_BATCH_SIZE):
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(batch[0]), extrasaction='ignore')
+            if header:
+                writer.writeheader()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def iter_ndjson(rows):
+    """Encode rows as newline-delimited JSON chunks."""
+    for batch in _batches(rows, EXPORT_BATCH_SIZE):
+        yield ''.join(json.dumps(row) + '\n' for row in batch)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting what pyarrow writes until take() hands it to the response."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_parquet(rows):
+    """Encode rows as a Parquet file, one row group per batch, streamed as it is written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = schema = None
+    for batch in _batches(rows, PARQUET_ROW_GROUP_SIZE):
+        if writer is None:
+            # Columns that are empty in the first batch hold numbers once they have values
+            schema = pa.schema([field.with_type(pa.float64()) if pa.types.is_null(field.type) else field
+                                for field in pa.Table.from_pylist(batch).schema])
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+        yield sink.take()
+    if writer is None:
+        writer = pq.ParquetWriter(sink, pa.schema([('hydrograph', pa.string())]))
+    writer.close()
+    yield sink.take()
+
+
+def iter_export(task_id, task, export_format, offset=0):
+    """Return a generator of the encoded chunks of the task's results from row offset on."""
+    rows = iter_rows(task_id, task, offset)
+    if export_format == 'csv':
+        return iter_csv(rows, header=offset == 0)
+    if export_format == 'ndjson':
+        return iter_ndjson(rows)
+    return iter_parquet(rows)
+
+
+async def iterate_in_thread(chunks):
+    """
+    Iterate a blocking generator from async code, always on the same dedicated thread.
+
+    The generator holds a database cursor, which has to stay on the thread that opened it
+    (SQLite connections are per thread). Closing this iterator, e.g. when the client
+    disconnects, closes the generator and with it the cursor.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='export')
+    loop = asyncio.get_running_loop()
+    try:
+        while (chunk := await loop.run_in_executor(executor, next, chunks, None)) is not None:
+            yield chunk
+    finally:
+        executor.submit(chunks.close)
+        executor.shutdown(wait=False)
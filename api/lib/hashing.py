@@ -0,0 +1,10 @@
+import hashlib
+
+
+def content_hash(data):
+    """Return the hex sha256 of file content, hashing str content as UTF-8."""
+    if data is None:
+        data = b''
+    elif isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
@@ -0,0 +1,102 @@
+"""
+Compact binary storage for the long float series (hydrographs) inside RORB results.
+
+split_series moves every list of at least MIN_POINTS numbers out of a JSON-like
+result, leaving a {"$series": path} marker in its place, and encode packs the
+series as float64 arrays compressed with zlib. join_series puts them back, so a
+result round-trips unchanged while the scalar parts (peaks, durations, ...) stay
+queryable as JSONB and the bulky parts stay small on disk.
+
+Functions:
+    - split_series(result, min_points=MIN_POINTS) -> (result, {path: [float, ...]})
+    - join_series(result, series) -> result with the markers replaced
+    - series_paths(result) -> list: Paths of the markers present in result
+    - encode(series) -> bytes
+    - decode(data, paths=None) -> {path: [float, ...]}, only the requested paths when given
+"""
+
+import json
+import struct
+import sys
+import zlib
+from array import array
+
+MIN_POINTS = 32
+MARKER = '$series'
+_HEADER = struct.Struct('<I')
+
+
+def _is_series(value, min_points):
+    return (isinstance(value, list) and len(value) >= min_points
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value))
+
+
+def split_series(result, min_points=MIN_POINTS):
+    series = {}
+
+    def walk(value, path):
+        if _is_series(value, min_points):
+            key = '/'.join(path)
+            series[key] = value
+            return {MARKER: key}
+        if isinstance(value, dict):
+            return {k: walk(v, path + [str(k)]) for k, v in value.items()}
+        if isinstance(value, list):
+            return [walk(v, path + [str(i)]) for i, v in enumerate(value)]
+        return value
+
+    return walk(result, []), series
+
+
+def _is_marker(value):
+    return isinstance(value, dict) and len(value) == 1 and MARKER in value
+
+
+def join_series(result, series):
+    if _is_marker(result):
+        return series.get(result[MARKER], result)
+    if isinstance(result, dict):
+        return {k: join_series(v, series) for k, v in result.items()}
+    if isinstance(result, list):
+        return [join_series(v, series) for v in result]
+    return result
+
+
+def series_paths(result):
+    if _is_marker(result):
+        return [result[MARKER]]
+    if isinstance(result, dict):
+        return [path for v in result.values() for path in series_paths(v)]
+    if isinstance(result, list):
+        return [path for v in result for path in series_paths(v)]
+    return []
+
+
+def encode(series):
+    """Pack {path: numbers} as a JSON index of (path, length) followed by float64 values, zlib compressed."""
+    index = json.dumps([[path, len(values)] for path, values in series.items()]).encode('utf-8')
+    values = array('d')
+    for path_values in series.values():
+        values.extend(float(v) for v in path_values)
+    if sys.byteorder == 'big':
+        values.byteswap()  # always stored little endian
+    return zlib.compress(_HEADER.pack(len(index)) + index + values.tobytes())
+
+
+def decode(data, paths=None):
+    raw = zlib.decompress(bytes(data))
+    (index_size,) = _HEADER.unpack_from(raw)
+    index = json.loads(raw[_HEADER.size:_HEADER.size + index_size])
+    values = array('d')
+    values.frombytes(raw[_HEADER.size + index_size:])
+    if sys.byteorder == 'big':
+        values.byteswap()
+
+    wanted = None if paths is None else set(paths)
+    series = {}
+    offset = 0
+    for path, length in index:
+        if wanted is None or path in wanted:
+            series[path] = values[offset:offset + length].tolist()
+        offset += length
+    return series
@@ -0,0 +1,67 @@
+"""
+In-process LRU cache of catchment and storm inputs keyed by content hash.
+
+A long-running worker claims many batches that reference the same catchment and
+storm files. Keeping their text here means each file is fetched from input_blobs
+and decoded once per process instead of once per batch. LRUCache exposes the
+dict methods SimulationDB._resolve_blobs uses, so it can be passed wherever a
+plain dict blob cache is accepted.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+INPUT_CACHE_MAX_ENTRIES = int(os.environ.get('INPUT_CACHE_MAX_ENTRIES', 256))
+
+
+class LRUCache:
+    """Thread-safe mapping that drops the least recently used entries beyond max_entries."""
+
+    def __init__(self, max_entries=INPUT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self._misses += 1
+                return default
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def update(self, items):
+        with self._lock:
+            for key, value in dict(items).items():
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+            }
+
+
+blobs = LRUCache()
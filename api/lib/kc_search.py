@@ -0,0 +1,152 @@
+"""
+Adaptive kc search.
+
+Instead of running every storm at every kc of an arange grid, each storm gets its
+own bracketing (bisection) search for the kc whose modelled peak matches a target
+peak. Every evaluation is a single RORB run, so the cost grows with
+log2((kc_max - kc_min) / tolerance) rather than with the grid resolution.
+"""
+
+from api.lib import parallel_calibration
+
+DEFAULT_MAX_EVALUATIONS = 20
+
+
+class _Stopped(Exception):
+    pass
+
+
+def _peak(mapping, target_key=None):
+    """Extract the single peak value from a one-storm, one-kc rorb_kc_qmax_mapping."""
+    key = target_key if target_key is not None else next(iter(mapping))
+    if key not in mapping:
+        raise ValueError(f"Hydrograph '{key}' not found in results, available: {list(mapping)}")
+    return mapping[key]['peak'][0]
+
+
+def search_kc(evaluate, target_peak, kc_min, kc_max, tolerance, max_evaluations=DEFAULT_MAX_EVALUATIONS, should_stop=None):
+    """
+    Bisect [kc_min, kc_max] for the kc where evaluate(kc) equals target_peak.
+
+    Parameters:
+    - evaluate (callable): kc -> modelled peak, one RORB run per call
+    - target_peak (float): Peak flow the storm should reproduce
+    - kc_min, kc_max (float): Search interval
+    - tolerance (float): Stop once the bracketing interval is narrower than this
+    - max_evaluations (int): Hard cap on the number of evaluate calls
+    - should_stop (callable): Checked before every evaluate call; once it returns True the
+      search ends with 'stopped' set and only the evaluations already made
+
+    Returns:
+    - dict: kc, peak, target, evaluations, converged, stopped and the (kc, peak) history
+    """
+    history = []
+
+    def f(kc):
+        if should_stop is not None and should_stop():
+            raise _Stopped()
+        peak = evaluate(kc)
+        history.append([kc, peak])
+        return peak - target_peak
+
+    def result(kc, peak, converged, stopped=False):
+        return {
+            'kc': kc,
+            'peak': peak,
+            'target': target_peak,
+            'evaluations': len(history),
+            'converged': converged,
+            'stopped': stopped,
+            'history': history,
+        }
+
+    try:
+        return _bisect(f, result, target_peak, kc_min, kc_max, tolerance, max_evaluations, history)
+    except _Stopped:
+        if not history:
+            return result(None, None, False, stopped=True)
+        best_kc, best_peak = min(history, key=lambda point: abs(point[1] - target_peak))
+        return result(best_kc, best_peak, False, stopped=True)
+
+
+def _bisect(f, result, target_peak, kc_min, kc_max, tolerance, max_evaluations, history):
+    lo, hi = kc_min, kc_max
+    f_lo = f(lo)
+    if f_lo == 0 or max_evaluations <= 1:
+        return result(lo, f_lo + target_peak, f_lo == 0)
+    f_hi = f(hi)
+    if f_hi == 0:
+        return result(hi, target_peak, True)
+
+    if (f_lo > 0) == (f_hi > 0):
+        # Target is outside the range the interval can produce, report the closest end
+        best_kc, best_f = (lo, f_lo) if abs(f_lo) <= abs(f_hi) else (hi, f_hi)
+        return result(best_kc, best_f + target_peak, False)
+
+    while hi - lo > tolerance and len(history) < max_evaluations:
+        mid = (lo + hi) / 2
+        f_mid = f(mid)
+        if f_mid == 0:
+            return result(mid, target_peak, True)
+        if (f_mid > 0) == (f_lo > 0):
+            lo, f_lo = mid, f_mid
+        else:
+            hi, f_hi = mid, f_mid
+
+    best_kc, best_f = (lo, f_lo) if abs(f_lo) <= abs(f_hi) else (hi, f_hi)
+    return result(best_kc, best_f + target_peak, hi - lo <= tolerance)
+
+
+def _search_storm(storm_data, catg_data, target_peak, kc_min, kc_max, m, initial_loss, continuous_loss,
+                  tolerance, max_evaluations, target_key, should_stop=None):
+    def evaluate(kc):
+        mapping = parallel_calibration.kc_calibration(catg_data, [storm_data], [kc], m, initial_loss, continuous_loss)
+        return _peak(mapping, target_key)
+
+    return search_kc(evaluate, target_peak, kc_min, kc_max, tolerance, max_evaluations, should_stop)
+
+
+def _search_storm_in_worker(args):
+    storm_index, target_peak, kc_min, kc_max, tolerance, max_evaluations, target_key, should_stop = args
+    catg_data, storms_data, m, initial_loss, continuous_loss = parallel_calibration.worker_inputs()
+    return _search_storm(storms_data[storm_index], catg_data, target_peak, kc_min, kc_max, m, initial_loss,
+                         continuous_loss, tolerance, max_evaluations, target_key, should_stop)
+
+
+def adaptive_kc_search(catg_data, storms_data, target_peaks, kc_min, kc_max, m, initial_loss, continuous_loss,
+                       tolerance, max_evaluations=DEFAULT_MAX_EVALUATIONS, target_key=None, workers=1, should_stop=None):
+    """
+    Run an independent kc search for every storm.
+
+    Parameters:
+    - catg_data (str): Decoded catchment file
+    - storms_data (list[str]): Decoded storm files
+    - target_peaks (list[float]): Target peak per storm, or a single value shared by all storms
+    - kc_min, kc_max (float): Search interval
+    - m, initial_loss, continuous_loss (float): RORB model parameters
+    - tolerance (float): kc precision to stop at
+    - max_evaluations (int): RORB run budget per storm
+    - target_key (str): Hydrograph in the results to match, defaults to the first one
+    - workers (int): Number of worker processes storms are spread across
+    - should_stop (callable): Checked before every RORB run, in the worker processes too, so it
+      must be picklable. Once it returns True the remaining searches stop early and report
+      'stopped', with only the evaluations they made
+
+    Returns:
+    - list[dict]: One search result per storm, in storm order
+    """
+    if len(target_peaks) == 1:
+        target_peaks = list(target_peaks) * len(storms_data)
+    if len(target_peaks) != len(storms_data):
+        raise ValueError(f"Expected 1 or {len(storms_data)} target peaks, got {len(target_peaks)}")
+
+    if workers <= 1 or len(storms_data) <= 1:
+        return [
+            _search_storm(storm, catg_data, target, kc_min, kc_max, m, initial_loss, continuous_loss,
+                          tolerance, max_evaluations, target_key, should_stop)
+            for storm, target in zip(storms_data, target_peaks)
+        ]
+
+    jobs = [(i, target, kc_min, kc_max, tolerance, max_evaluations, target_key, should_stop) for i, target in enumerate(target_peaks)]
+    with parallel_calibration.process_pool(min(workers, len(jobs)), catg_data, storms_data, m, initial_loss, continuous_loss) as pool:
+        return list(pool.map(_search_storm_in_worker, jobs))
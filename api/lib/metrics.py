@@ -0,0 +1,209 @@
+"""
+In-process metrics, exposed in the Prometheus text format by /api/py/metrics.
+
+Metrics live in this process only: every API process and simulation worker keeps
+its own counters, and Prometheus sums them across scrape targets. Recording a
+sample is a dict lookup and a few additions under a lock, cheap enough for
+every db call.
+
+Functions:
+    - timed(histogram, **labels) -> context manager observing the seconds spent in its block
+    - timed_function(histogram, **labels) -> decorator timing a function, coroutine or generator
+    - db_call(fn) -> decorator timing a db-module function into DB_CALL_SECONDS and counting its errors
+    - render(extra=()) -> str: Every metric in the Prometheus text exposition format
+"""
+
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from sub-millisecond db calls up to long calibrations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+_registry = []
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=()):
+    pairs = [*key, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(values.items()):
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # per-bucket counts, then +Inf, sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def render(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+INGEST_SECONDS = Histogram('hydroget_ingest_seconds', 'Time spent spooling the uploaded files of a request')
+DECODE_SECONDS = Histogram('hydroget_decode_seconds', 'Time spent decoding catchment and storm files')
+KC_CALIBRATION_SECONDS = Histogram('hydroget_kc_calibration_seconds', 'Time spent running kc calibrations, by search mode')
+DB_CALL_SECONDS = Histogram('hydroget_db_call_seconds', 'Time spent in db-module calls, by call')
+DB_CALL_ERRORS = Counter('hydroget_db_call_errors_total', 'db-module calls that raised, by call')
+SIMULATE_BATCH_SECONDS = Histogram('hydroget_simulate_batch_seconds', 'Time spent claiming, running and storing one simulate() batch')
+SIMULATIONS = Counter('hydroget_simulations_total', 'Simulations finished by simulate(), by status')
+SIMULATIONS_PER_SECOND = Gauge('hydroget_simulations_per_second', 'Simulations per second of the last simulate() batch')
+
+
+@contextmanager
+def timed(histogram, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def timed_function(histogram, errors=None, **labels):
+    """Time every call of the decorated function; generators are timed until exhausted or closed."""
+
+    def decorate(fn):
+        def observe(started, failed):
+            histogram.observe(time.perf_counter() - started, **labels)
+            if failed and errors is not None:
+                errors.inc(**labels)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                started, failed = time.perf_counter(), True
+                try:
+                    result = await fn(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    observe(started, failed)
+        elif inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started, failed = time.perf_counter(), True
+                try:
+                    yield from fn(*args, **kwargs)
+                    failed = False
+                except GeneratorExit:
+                    failed = False
+                    raise
+                finally:
+                    observe(started, failed)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started, failed = time.perf_counter(), True
+                try:
+                    result = fn(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    observe(started, failed)
+        # For callers that are timed themselves and must not record the call twice
+        wrapper.untimed = fn
+        return wrapper
+
+    return decorate
+
+
+def db_call(fn):
+    """Time a db-module function (or method) into DB_CALL_SECONDS, labelled module.function."""
+    call = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+    return timed_function(DB_CALL_SECONDS, errors=DB_CALL_ERRORS, call=call)(fn)
+
+
+def render(extra=()):
+    """
+    Render every registered metric, followed by extra metrics computed at scrape time.
+
+    Parameters:
+    - extra (iterable[tuple]): (name, help, type, {labels tuple: value}) entries
+
+    Returns:
+    - str: The Prometheus text exposition format
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for name, help, kind, values in extra:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(values.items()):
+            lines.append(f"{name}{_format_labels(key)} {value}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,48 @@
+import logging
+
+from fastapi.responses import PlainTextResponse
+
+from api.lib import auth, metrics
+from api.lib.db import async_connection, connection
+from api.lib.db.simulation_db import SimulationDB
+
+
+def _gauge(name, help, values, label=None):
+    return name, help, 'gauge', {((label, key),) if label else (): value for key, value in values.items()}
+
+
+def _scrape_time_metrics():
+    """Metrics read when scraped: queue depth and connection counts."""
+    extra = []
+    pool = connection.pool_stats()
+    if pool:
+        extra.append(_gauge('hydroget_db_pool_connections', 'Connections of this process\' pool, by state',
+                            {'in_use': pool['in_use'], 'max': pool['max_size']}, label='state'))
+        extra.append(('hydroget_db_pool_checkouts_total', 'Connections checked out of this process\' pool', 'counter', {(): pool['checkouts']}))
+        extra.append(('hydroget_db_pool_exhausted_total', 'Checkouts that had to wait for a free connection', 'counter', {(): pool['exhausted']}))
+        extra.append(('hydroget_db_pool_timeouts_total', 'Checkouts that gave up waiting for a connection', 'counter', {(): pool['timeouts']}))
+        extra.append(('hydroget_db_pool_discarded_total', 'Pooled connections found dead at checkout and replaced', 'counter', {(): pool['discarded']}))
+
+    async_pool = async_connection.pool_stats()
+    if async_pool:
+        extra.append(_gauge('hydroget_db_async_pool_connections', 'Connections of this process\' async pool, by state',
+                            {'open': async_pool['size'], 'idle': async_pool['idle'], 'max': async_pool['max_size']}, label='state'))
+
+    auth_stats = auth.cache_stats()
+    extra.append(('hydroget_auth_cache_requests_total', 'Token verifications, by whether the verified token cache had them', 'counter',
+                  {(('result', 'hit'),): auth_stats['hits'], (('result', 'miss'),): auth_stats['misses']}))
+
+    # A failing database should not take the in-process metrics down with it
+    try:
+        extra.append(_gauge('hydroget_simulation_queue_depth', 'Queued simulations, by status',
+                            SimulationDB().get_queue_depth(), label='status'))
+        extra.append(_gauge('hydroget_db_server_connections', 'Connections to the database, by state',
+                            connection.server_connections(), label='state'))
+    except Exception as e:
+        logging.warning("Could not read database metrics: %s", e)
+    return extra
+
+
+def get_metrics():
+    """Serve this process' metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(_scrape_time_metrics()), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,154 @@
+"""
+Parallel execution of the kc calibration grid.
+
+The grid is split along the kc axis: every chunk runs all storms for a subset of
+kc values, so pyrorb still sees the complete storm ensemble it aggregates over
+(critical duration / pattern) and the fragments can be concatenated back into the
+same rorb_kc_qmax_mapping shape a single kc_calibration call returns.
+"""
+
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+MAX_CALIBRATION_WORKERS = int(os.environ.get('MAX_CALIBRATION_WORKERS', os.cpu_count() or 1))
+CHUNKS_PER_WORKER = 4  # more chunks than workers keeps the pool busy when chunks finish unevenly
+SEQUENTIAL_CHUNKS = 20  # chunks of a single-process run, so progress is reported in ~5% steps
+START_METHOD = os.environ.get('CALIBRATION_START_METHOD', 'spawn')
+
+# Inputs shared by every chunk, set once per worker process by _init_worker
+_worker_inputs = None
+
+
+def kc_calibration(catg_data, storms_data, kc_list, m, initial_loss, continuous_loss):
+    """
+    Run pyrorb's kc_calibration.
+
+    pyrorb and the scientific stack behind it are imported on the first call rather than
+    with this module, so API cold starts that never run a calibration do not pay for them.
+    """
+    from pyrorb.tools import kc_calibration as pyrorb_kc_calibration
+    return pyrorb_kc_calibration.kc_calibration(catg_data, storms_data, kc_list, m, initial_loss, continuous_loss)
+
+
+def resolve_workers(requested=None):
+    """Clamp the requested worker count to [1, MAX_CALIBRATION_WORKERS]."""
+    if not requested:
+        return 1
+    return max(1, min(int(requested), MAX_CALIBRATION_WORKERS))
+
+
+def split_chunks(values, n_chunks):
+    """Split values into at most n_chunks contiguous, order-preserving chunks."""
+    if not values:
+        return []
+    size = math.ceil(len(values) / max(1, n_chunks))
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def merge_kc_mappings(mappings):
+    """Concatenate rorb_kc_qmax_mapping fragments computed over consecutive kc chunks."""
+    merged = {}
+    for mapping in mappings:
+        for key, series in mapping.items():
+            target = merged.setdefault(key, {})
+            for field, values in series.items():
+                if isinstance(values, list):
+                    target.setdefault(field, []).extend(values)
+                else:
+                    target.setdefault(field, values)
+    return merged
+
+
+def split_kc_mapping(mapping, n_kc):
+    """Split a rorb_kc_qmax_mapping over n_kc kc values into n_kc single-kc mappings."""
+    columns = [{} for _ in range(n_kc)]
+    for key, series in mapping.items():
+        for i, column in enumerate(columns):
+            column[key] = {
+                field: [values[i]] if isinstance(values, list) else values
+                for field, values in series.items()
+            }
+    return columns
+
+
+def _init_worker(catg_data, storms_data, m, initial_loss, continuous_loss):
+    global _worker_inputs
+    _worker_inputs = (catg_data, storms_data, m, initial_loss, continuous_loss)
+
+
+def worker_inputs():
+    """Return (catg_data, storms_data, m, initial_loss, continuous_loss) inside a pool worker."""
+    return _worker_inputs
+
+
+def process_pool(workers, catg_data, storms_data, m, initial_loss, continuous_loss):
+    """Create a process pool whose workers hold the shared calibration inputs."""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(START_METHOD),
+        initializer=_init_worker,
+        initargs=(catg_data, storms_data, m, initial_loss, continuous_loss),
+    )
+
+
+def _run_kc_chunk(kc_chunk):
+    catg_data, storms_data, m, initial_loss, continuous_loss = _worker_inputs
+    return kc_calibration(catg_data, storms_data, kc_chunk, m, initial_loss, continuous_loss)
+
+
+def cancel_pending(futures):
+    """Cancel the futures that have not started, so closing the pool waits only for running ones."""
+    for future in futures:
+        future.cancel()
+
+
+def run_kc_calibration(catg_data, storms_data, kc_list, m, initial_loss, continuous_loss, workers=1):
+    """
+    Run kc_calibration over kc_list, optionally spread across a process pool.
+
+    Parameters:
+    - catg_data (str): Decoded catchment file
+    - storms_data (list[str]): Decoded storm files
+    - kc_list (list[float]): kc values to evaluate
+    - m, initial_loss, continuous_loss (float): RORB model parameters
+    - workers (int): Number of worker processes, 1 runs in the calling thread
+
+    Returns:
+    - dict: rorb_kc_qmax_mapping, identical in shape to a single kc_calibration call
+    """
+    if workers <= 1 or len(kc_list) <= 1:
+        return kc_calibration(catg_data, storms_data, kc_list, m, initial_loss, continuous_loss)
+
+    chunks = split_chunks(kc_list, workers * CHUNKS_PER_WORKER)
+    with process_pool(min(workers, len(chunks)), catg_data, storms_data, m, initial_loss, continuous_loss) as pool:
+        # map preserves submission order, so fragments come back in kc order
+        return merge_kc_mappings(pool.map(_run_kc_chunk, chunks))
+
+
+def iter_kc_calibration(catg_data, storms_data, kc_list, m, initial_loss, continuous_loss, workers=1):
+    """
+    Run kc_calibration over kc_list chunk by chunk, yielding results as chunks finish.
+
+    Yields:
+    - tuple: (positions, mapping) where positions are the indices into kc_list the
+      rorb_kc_qmax_mapping fragment covers. With workers > 1 chunks arrive in completion order.
+    """
+    positions = list(range(len(kc_list)))
+    if workers <= 1:
+        for chunk in split_chunks(positions, SEQUENTIAL_CHUNKS):
+            yield chunk, kc_calibration(catg_data, storms_data, [kc_list[i] for i in chunk], m, initial_loss, continuous_loss)
+        return
+
+    chunks = split_chunks(positions, workers * CHUNKS_PER_WORKER)
+    if not chunks:
+        return
+    with process_pool(min(workers, len(chunks)), catg_data, storms_data, m, initial_loss, continuous_loss) as pool:
+        futures = {pool.submit(_run_kc_chunk, [kc_list[i] for i in chunk]): chunk for chunk in chunks}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # When the caller stops early (e.g. the task was cancelled) only running chunks are waited for
+            cancel_pending(futures)
@@ -0,0 +1,118 @@
+"""
+Scheduled maintenance of simulations_queue.
+
+Each sweep:
+1. reclaims in_progress rows whose worker lease lapsed (the worker crashed or was killed),
+   putting them back to 'pending' for another worker to claim
+2. marks pending rows past their retention as 'expired' and releases their quota reservations
+3. deletes finished rows past their retention
+4. releases the quota reservations of calibrations and sweeps whose run stopped sending
+   heartbeats (TASK_STALE_SECONDS) before it could release them, marking unfinished ones 'error'
+
+Every step runs in batches of SIMULATION_SWEEP_BATCH_SIZE rows, one short transaction per
+batch, so a large backlog never holds locks on the queue for long. The sweeper runs as a
+thread of the simulation_worker parent process, or from cron when no worker runs:
+
+Usage:
+    python -m api.lib.queue_sweeper            # one sweep
+    python -m api.lib.queue_sweeper --loop     # sweep every SIMULATION_SWEEP_INTERVAL seconds
+"""
+
+import argparse
+import logging
+import os
+import threading
+
+from api.lib import metrics
+from api.lib.db import accounting, calibration_kc_db
+from api.lib.db.simulation_db import SWEEP_BATCH_SIZE, SimulationDB
+
+SWEEP_INTERVAL = float(os.environ.get('SIMULATION_SWEEP_INTERVAL', 60))
+# Batches per step and sweep, so one sweep of a huge backlog still ends; the rest waits for the next one
+SWEEP_MAX_BATCHES = 100
+
+SWEPT_ROWS = metrics.Counter('hydroget_queue_swept_rows_total', 'simulations_queue rows handled by the sweeper, by action')
+
+
+def _batches(step, batch_size, max_batches):
+    total = 0
+    for _ in range(max_batches):
+        count = step(batch_size)
+        total += count
+        if count < batch_size:
+            break
+    return total
+
+
+def _expire(db, batch_size):
+    expired = db.mark_expired_tasks(batch_size)
+    # Expired rows never ran, so the simulations reserved for them are given back
+    for user_id, count in expired.items():
+        if user_id:
+            accounting.record_simulations(user_id, 0, released_simulations=count)
+    return sum(expired.values())
+
+
+def _release_dead_tasks(batch_size):
+    released = calibration_kc_db.release_stale_reservations(batch_size)
+    for user_id, count in released:
+        if user_id:
+            accounting.record_simulations(user_id, 0, released_simulations=count)
+    return len(released)
+
+
+def sweep_once(db=None, batch_size=SWEEP_BATCH_SIZE, max_batches=SWEEP_MAX_BATCHES):
+    """
+    Run one sweep of simulations_queue.
+
+    Returns:
+    - dict: Number of rows reclaimed, expired and deleted, and of dead tasks whose reservation was released
+    """
+    db = db or SimulationDB()
+    counts = {
+        'reclaimed': _batches(db.reclaim_expired_leases, batch_size, max_batches),
+        'expired': _batches(lambda size: _expire(db, size), batch_size, max_batches),
+        'deleted': _batches(db.clean_expired_tasks, batch_size, max_batches),
+        'released': _batches(_release_dead_tasks, batch_size, max_batches),
+    }
+    for action, count in counts.items():
+        SWEPT_ROWS.inc(count, action=action)
+    # Idle sweeps only show up at DEBUG, so --loop does not log a line a minute
+    logging.log(logging.INFO if any(counts.values()) else logging.DEBUG, "Queue sweep: %s", counts)
+    return counts
+
+
+def run_sweeper(stop_event, interval=SWEEP_INTERVAL, batch_size=SWEEP_BATCH_SIZE):
+    """Sweep every interval seconds until stop_event is set; a failed sweep is logged and retried next time."""
+    db = SimulationDB()
+    while not stop_event.is_set():
+        try:
+            sweep_once(db, batch_size=batch_size)
+        except Exception as e:
+            logging.warning("Queue sweep failed: %s", e)
+        stop_event.wait(interval)
+
+
+def start_sweeper(interval=SWEEP_INTERVAL):
+    """Start run_sweeper in a daemon thread, returning the event that stops it."""
+    stop_event = threading.Event()
+    threading.Thread(target=run_sweeper, args=(stop_event, interval), name='queue-sweeper', daemon=True).start()
+    return stop_event
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--loop', action='store_true')
+    parser.add_argument('--interval', type=float, default=SWEEP_INTERVAL)
+    parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+    if args.loop:
+        run_sweeper(threading.Event(), args.interval, args.batch_size)
+    else:
+        sweep_once(batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,94 +1,27 @@
-
-import asyncio
 import logging
+import time
 from datetime import datetime
 from typing import Annotated, List, Optional
 
-from fastapi import BackgroundTasks, Depends, File, Form, UploadFile
+from fastapi import Depends, File, Form, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from fastapi.security import HTTPAuthorizationCredentials
-from pyrorb.tools import kc_calibration
 
-from api.lib import auth
-from api.lib.db import calibration_kc_db, accounting
+from api.lib import auth, metrics
+from api.lib.accounting_endpoints import quota_exceeded_response
+from api.lib.calibrate_kc import kc_count, kc_values
+from api.lib.db import calibration_kc_db, accounting, simulation_cache_db
 from api.lib.security import security
 from api.lib.db.simulation_db import SimulationDB
+from api.lib.hashing import content_hash
+from api.lib.uploads import close_uploads, decode_uploads, ingest_uploads
 
-from pyrorb.runner import ExperimentRunner
-from pyrorb.experiments.base_experiment import BaseExperiment
-
-
-# Helper functions
-def arange(start, stop, step):
-    """Generate a list of numbers from start to stop with given step size."""
-    current = start
-    result = []
-    while current <= stop:
-        result.append(current)
-        current += step
-    return result
-
-
-async def read_content(catg, storms):
-    """Read content from catchment and storm files concurrently."""
-    print(f"Starting concurrent reads at {datetime.now()}")
-    
-    # Use asyncio.gather() to perform concurrent I/O operations
-    catg_task = catg.read() if catg else None
-    storm_tasks = [storm.read() for storm in storms]
-    
-    # Gather all tasks (catg_task only if catg exists)
-    all_results = await asyncio.gather(catg_task, *storm_tasks)
-    
-    # Split results into catg_content and storms_content
-    catg_content = all_results[0] if catg_task else None
-    storms_content = all_results[1:] if catg_task else all_results    
-    print(f"Finished reading all contents at {datetime.now()}")    
-    return catg_content, storms_content
-
-
-# Core calibration functions
-def calibrate_kc(catg_data, storms_data, kc_min, kc_max, kc_step, m, initial_loss, continuous_loss, task_id, user_id=None):
-    """
-    Calibrates the kc value based on provided data and updates the CALIBRATION_TASKS dictionary.
-
-    Parameters:
-    - catg_data (bytes): Raw catchment file data in bytes format, will be decoded to ISO-8859-1
-    - storms_data (list[bytes]): List of raw storm file data in bytes format, will be decoded to ISO-8859-1
-    - kc_min (float): Minimum kc value to test in calibration
-    - kc_max (float): Maximum kc value to test in calibration  
-    - kc_step (float): Step size between kc values to test
-    - m (float): The m parameter value for RORB model
-    - initial_loss (float): The initial loss parameter for RORB model
-    - continuous_loss (float): The continuous loss parameter for RORB model
-    - task_id (str): Unique identifier for tracking this calibration task
-
-    Returns:
-    - None: Updates task status and results in database:
-        - Sets status to "in_progress" when starting
-        - Sets status to "completed" with rorb_kc_qmax_mapping results on success
-        - Sets status to "error" with error message on failure
-    """
-    
-
-    catg_data = catg_data.decode('ISO-8859-1') if catg_data else None
-    storms_data = [storm.decode('ISO-8859-1') for storm in storms_data] if storms_data else []
-    kc_list = arange(kc_min, kc_max, kc_step)
-
-    simulation_count = len(storms_data)*len(kc_list)
-
-    calibration_kc_db.update_task(task_id, {"status": "in_progress", "user_id": user_id})
-
-    try:
-        kc_q_mapping = kc_calibration.kc_calibration(catg_data, storms_data, kc_list, m, initial_loss, continuous_loss)
-        calibration_kc_db.update_task(task_id, {"status": "completed", "rorb_kc_qmax_mapping": kc_q_mapping, "user_id": user_id, "successful_simulation_count": simulation_count})
-        accounting.update_simulation_count(user_id, simulation_count)
-    except Exception as e:
-        calibration_kc_db.update_task(task_id, {"status": "error", "error_message": str(e), "user_id": user_id, "successful_simulation_count": 0})
+FINISHED_STATUSES = ('completed', 'error', 'expired', 'cancelled')
 
 
 # API endpoints
-def queue_simulations_for_kc_calibration(
+async def queue_simulations_for_kc_calibration(
     credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
     catg: UploadFile|None = None,
     storms: Optional[List[UploadFile]] = File(None),
@@ -99,28 +32,66 @@ def queue_simulations_for_kc_calibration(
     initialLoss: float = Form(...),
     continuousLoss: float = Form(...),    
 ):
+    """
+    Queue a kc grid as one simulations_queue row per (kc, storm), for simulation_worker
+    processes to run. The rows are written with SimulationDB's bulk insert; progress is
+    served by get_status and the task is cancelled with cancel_calibration.
+    """
     token = credentials.credentials
-    user_id = auth.user_id_from_token(token)
+    user_id = await run_in_threadpool(auth.user_id_from_token, token)
 
-    catg_content, storms_content = asyncio.run(read_content(catg, storms))
-    task_id = calibration_kc_db.new_task(user_id=user_id)
-    kc_list = arange(kcMin, kcMax, kcStep)
-    db = SimulationDB()
-    for kc in kc_list:
-        for storm in storms_content:
-            db.queue_simulation(storm, catg_content, kc, m, initialLoss, continuousLoss, user_id, task_id)
+    if kcStep <= 0 or kcMax < kcMin:
+        return JSONResponse(content={"message": "kcStep must be positive and kcMax at least kcMin"}, status_code=400)
 
-    db.commit()
-    return JSONResponse(content={"message": "Calibration started", "task_id": task_id, "time": str(datetime.now())})
+    catg_upload, storm_uploads = await ingest_uploads(catg, storms)
 
-def simulate(task_id: str):
-    db = SimulationDB()
-    simulations = db.get_simulations_by_task_id(task_id, status='pending', chunk_size=20)
+    # Every queued simulation is reserved before any is queued, simulate() bills them as they finish
+    reserved = len(storm_uploads) * kc_count(kcMin, kcMax, kcStep)
+    try:
+        await run_in_threadpool(accounting.reserve_simulations, user_id, reserved)
+    except accounting.QuotaExceededError as e:
+        close_uploads([catg_upload, *storm_uploads])
+        return quota_exceeded_response(e)
+
+    def queue_task():
+        catg_content, storms_content = decode_uploads(catg_upload, storm_uploads)
+        task_id = calibration_kc_db.new_task(user_id=user_id)
+        db = SimulationDB()
+        db.queue_grid(storms_content, catg_content, kc_values(kcMin, kcMax, kcStep), m, initialLoss, continuousLoss, user_id, task_id)
+        db.commit_local_simulations()
+        return task_id
+
+    try:
+        task_id = await run_in_threadpool(queue_task)
+    except Exception:
+        await run_in_threadpool(accounting.record_simulations, user_id, 0, released_simulations=reserved, flush=True)
+        raise
+    return JSONResponse(content={"message": "Calibration queued", "task_id": task_id, "time": str(datetime.now())})
+
+
+def simulate(task_id=None, chunk_size=20, db=None):
+    """
+    Claim up to chunk_size pending simulations, run them and store the results.
+
+    Claiming is a single UPDATE ... FOR UPDATE SKIP LOCKED statement, so any number of
+    workers can call this concurrently without running the same simulation twice.
 
-    #change status to in_progress
-    db.update_simulation_status(simulations, 'in_progress') # this should be  done in get_simulations_by_task_id
-    
+    Parameters:
+    - task_id (str): Only claim simulations of this task, any task when None
+    - chunk_size (int): Maximum number of simulations to claim
+    - db (SimulationDB): Reused between calls by long-running workers
+
+    Returns:
+    - dict: Number of simulations claimed, cache hits/misses among them and the seconds
+      spent building the experiments (pyrorb parses their inputs) and running them
+    """
+    # pyrorb is imported by the first batch, not by every process that imports this module
+    from pyrorb.experiments.base_experiment import BaseExperiment
+    from pyrorb.runner import ExperimentRunner
 
+    batch_started = time.perf_counter()
+    db = db or SimulationDB()
+    simulations = db.claim_simulations(task_id=task_id, chunk_size=chunk_size)
 
     def make_experiment(sim):
         return BaseExperiment(sim['catg_data'],
@@ -130,53 +101,112 @@ def simulate(task_id: str):
             il=sim['initial_loss'],
             cl=sim['continuous_loss'])
 
-    #simulate
-    experiments = [make_experiment(sim) for sim in simulations]
-    runner = ExperimentRunner(experiments)
-    runner.run()
-
-    #update results
-    for sim, exp in zip(simulations, runner.experiments):
+    def make_cache_key(sim):
+        return simulation_cache_db.cache_key('experiment',
+            sim['catg_hash'] or content_hash(sim['catg_data']),
+            sim['storm_hash'] or content_hash(sim['storm_data']),
+            sim['kc'], sim['m'], sim['initial_loss'], sim['continuous_loss'])
 
-        sim['result'] = exp.result # is this correct?
-        sim['status'] = 'completed'
+    #reuse cached results
+    keys = [make_cache_key(sim) for sim in simulations]
+    cached = simulation_cache_db.get_results(keys)
+    to_run = [(sim, key) for sim, key in zip(simulations, keys) if key not in cached]
 
-        db.queue_update(sim['id'], 'complete', exp.result)
+    #simulate
+    fresh = {}
+    failed = None
+    build_seconds = simulate_seconds = 0.0
+    if to_run:
+        try:
+            # pyrorb parses the catchment and storm text while building each experiment
+            started = time.perf_counter()
+            experiments = [make_experiment(sim) for sim, _ in to_run]
+            build_seconds = time.perf_counter() - started
+            runner = ExperimentRunner(experiments)
+            started = time.perf_counter()
+            runner.run()
+            simulate_seconds = time.perf_counter() - started
+            fresh = {key: exp.result for (_, key), exp in zip(to_run, runner.experiments)}
+            simulation_cache_db.put_results(fresh)
+        except Exception as e:
+            logging.exception(f"Simulation batch failed: {e}")
+            failed = str(e)
 
-    db.commit_local_updates()
-        
+    #update results
+    for sim, key in zip(simulations, keys):
+        if key in cached:
+            db.queue_update(sim['id'], 'completed', cached[key])
+        elif key in fresh:
+            db.queue_update(sim['id'], 'completed', fresh[key])
+        else:
+            db.queue_update(sim['id'], 'error', failed)
+
+    # Simulations whose lease lapsed meanwhile are saved, billed and counted by the worker that reclaimed them
+    saved = db.commit_local_updates()
+
+    #batch timings are split across tasks by the number of simulations each ran
+    task_counters = {}
+    usage = {}
+    for sim, key in zip(simulations, keys):
+        if sim['id'] not in saved:
+            continue
+        # [completed, claimed] per user: every saved simulation releases its reservation, completed ones are billed
+        user_usage = usage.setdefault(sim['user_id'], [0, 0])
+        user_usage[0] += int(key in cached or key in fresh)
+        user_usage[1] += 1
+        counters = task_counters.setdefault(sim['task_id'], {"cache_hits": 0, "cache_misses": 0, "build_seconds": 0.0, "simulate_seconds": 0.0})
+        if key in cached:
+            counters["cache_hits"] += 1
+        elif key in fresh:
+            counters["cache_misses"] += 1
+            counters["build_seconds"] += build_seconds / len(to_run)
+            counters["simulate_seconds"] += simulate_seconds / len(to_run)
+
+    for sim_task_id, counters in task_counters.items():
+        calibration_kc_db.add_task_counters(sim_task_id, counters)
+    for user_id, (completed, claimed) in usage.items():
+        if user_id is not None:
+            accounting.record_simulations(user_id, completed, released_simulations=claimed)
+
+    if simulations:
+        batch_seconds = time.perf_counter() - batch_started
+        succeeded = sum(completed for completed, _ in usage.values())
+        metrics.SIMULATE_BATCH_SECONDS.observe(batch_seconds)
+        metrics.SIMULATIONS.inc(succeeded, status='completed')
+        metrics.SIMULATIONS.inc(sum(saved for _, saved in usage.values()) - succeeded, status='error')
+        metrics.SIMULATIONS_PER_SECOND.set(succeeded / batch_seconds)
+
+    return {
+        "claimed": len(simulations),
+        "cache_hits": len(simulations) - len(to_run),
+        "cache_misses": len(to_run),
+        "build_seconds": build_seconds,
+        "simulate_seconds": simulate_seconds,
+    }
 
 
 def get_status(task_id: str):
     """Get the status of simulations for a given task ID."""
     db = SimulationDB()
-    simulations = db.get_simulation_by_task_id(task_id)
+    counts = db.get_status_counts(task_id)
 
-    if not simulations:
+    if not counts:
         return JSONResponse(
             content={"message": "No simulations found", "task_id": task_id},
             status_code=404
         )
 
+    # Always report the common statuses, plus any others present (in_progress, expired, ...)
     status_counts = {
         'pending': 0,
         'completed': 0, 
-        'error': 0
+        'error': 0,
+        **counts
     }
 
-    for sim in simulations:
-        status = sim['status']
-        if status in status_counts:
-            status_counts[status] += 1
-        else:
-            return JSONResponse(
-                content={"message": f"Invalid simulation status: {status}", "task_id": task_id},
-                status_code=400
-            )
-            
-
     total = sum(status_counts.values())
-    progress = (status_counts['completed'] + status_counts['error']) / total if total > 0 else 0
+    finished = sum(status_counts.get(status, 0) for status in FINISHED_STATUSES)
+    progress = finished / total if total > 0 else 0
 
     if progress == 1.0:
         result = {"result": "RESULT"}
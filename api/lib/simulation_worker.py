@@ -0,0 +1,123 @@
+"""
+Long-running simulation worker.
+
+Each worker process loops on simulation_manager.simulate, which claims pending
+simulations_queue rows with FOR UPDATE SKIP LOCKED, so workers can be started in
+any number of processes on any number of machines sharing the same database.
+
+Claimed rows are leased to the worker: a heartbeat thread renews the leases while a batch
+runs, and the parent process runs the queue sweeper (api.lib.queue_sweeper), which puts rows
+of a worker that died back to 'pending' once their lease lapses.
+
+Usage:
+    python -m api.lib.simulation_worker --processes 4
+    python -m api.lib.simulation_worker --task-id <task_id> --max-idle 30
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from api.lib import queue_sweeper, simulation_manager
+from api.lib.db.simulation_db import LEASE_SECONDS, SimulationDB
+
+DEFAULT_CHUNK_SIZE = 20
+DEFAULT_POLL_INTERVAL = 2.0  # seconds to wait when the queue is empty
+
+
+def run_worker(task_id=None, chunk_size=DEFAULT_CHUNK_SIZE, poll_interval=DEFAULT_POLL_INTERVAL, max_idle=None, stop_event=None):
+    """
+    Claim and run simulations until stopped.
+
+    Parameters:
+    - task_id (str): Only work on this task, any task when None
+    - chunk_size (int): Simulations claimed per batch
+    - poll_interval (float): Seconds to sleep when nothing could be claimed
+    - max_idle (float): Exit after the queue has been empty this many seconds, run forever when None
+    - stop_event (multiprocessing.Event): Exit between batches once set
+
+    Returns:
+    - int: Number of simulations processed
+    """
+    db = SimulationDB()
+    processed = 0
+    idle_since = None
+    heartbeat_stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(db, heartbeat_stop, LEASE_SECONDS / 3), name='lease-heartbeat', daemon=True).start()
+
+    try:
+        while not (stop_event and stop_event.is_set()):
+            try:
+                claimed = simulation_manager.simulate(task_id=task_id, chunk_size=chunk_size, db=db)['claimed']
+            except Exception as e:
+                logging.exception(f"Worker batch failed: {e}")
+                claimed = 0
+
+            if claimed:
+                processed += claimed
+                idle_since = None
+                continue
+
+            idle_since = idle_since or time.monotonic()
+            if max_idle is not None and time.monotonic() - idle_since >= max_idle:
+                break
+            if stop_event:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+    finally:
+        heartbeat_stop.set()
+
+    return processed
+
+
+def _heartbeat(db, stop_event, interval):
+    # Renews well within LEASE_SECONDS, so a live worker keeps its rows through a slow batch
+    while not stop_event.wait(interval):
+        try:
+            db.renew_leases()
+        except Exception as e:
+            logging.warning("Lease heartbeat failed: %s", e)
+
+
+def _worker_main(stop_event, kwargs):
+    # The parent handles SIGINT/SIGTERM and stops children through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    processed = run_worker(stop_event=stop_event, **kwargs)
+    logging.info("Worker %s processed %d simulations", multiprocessing.current_process().name, processed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--task-id', default=None)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL)
+    parser.add_argument('--max-idle', type=float, default=None)
+    parser.add_argument('--no-sweeper', action='store_true', help='Leave the queue sweeper to another worker or cron')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+    kwargs = dict(task_id=args.task_id, chunk_size=args.chunk_size, poll_interval=args.poll_interval, max_idle=args.max_idle)
+
+    ctx = multiprocessing.get_context('spawn')
+    stop_event = ctx.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
+    workers = [ctx.Process(target=_worker_main, args=(stop_event, kwargs), name=f"simulation-worker-{i}")
+               for i in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    if not args.no_sweeper:
+        queue_sweeper.start_sweeper()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
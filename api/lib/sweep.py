@@ -0,0 +1,200 @@
+"""
+Parameter sweeps over kc, m, initial loss and continuous loss.
+
+A sweep is a list of points (kc, m, initial_loss, continuous_loss), either the full
+cartesian product of the four axes ('grid') or a Latin hypercube sample of them
+('lhs'). Points sharing m / initial loss / continuous loss are run together, one
+kc_calibration call over their kc values, so a grid costs one pyrorb call per
+(m, initial_loss, continuous_loss) combination and kc chunk rather than per point.
+
+Results are returned as flat, row-major arrays per hydrograph and field, indexed
+by the point's position in the sweep: for a grid, point (i_kc, i_m, i_il, i_cl)
+is at ((i_kc * n_m + i_m) * n_il + i_il) * n_cl + i_cl.
+"""
+
+import itertools
+import json
+import math
+import os
+import random
+from concurrent.futures import as_completed
+
+from api.lib import parallel_calibration
+
+AXES = ('kc', 'm', 'initial_loss', 'continuous_loss')
+SWEEP_MODES = ('grid', 'lhs')
+SWEEP_MAX_POINTS = int(os.environ.get('SWEEP_MAX_POINTS', 100_000))
+
+
+def parse_axis(name, text):
+    """
+    Parse one sweep parameter from its form value.
+
+    Accepted JSON values are a number, a list of numbers, or an object with "min" and
+    "max" and, for grids, "step". Returns {'values': [...]} or {'min', 'max', 'step'}.
+    Raises ValueError for anything else.
+    """
+    try:
+        spec = json.loads(text)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number, a list of numbers or an object with min/max/step")
+
+    if isinstance(spec, (int, float)) and not isinstance(spec, bool):
+        return {'values': [float(spec)]}
+    if isinstance(spec, list) and spec and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in spec):
+        return {'values': [float(v) for v in spec]}
+    if isinstance(spec, dict) and 'min' in spec and 'max' in spec:
+        axis = {'min': float(spec['min']), 'max': float(spec['max']), 'step': spec.get('step')}
+        if axis['max'] < axis['min']:
+            raise ValueError(f"{name} max is below its min")
+        if axis['step'] is not None and float(axis['step']) <= 0:
+            raise ValueError(f"{name} step must be positive")
+        return axis
+    raise ValueError(f"{name} must be a number, a list of numbers or an object with min/max/step")
+
+
+def axis_count(name, axis):
+    """Number of values of an axis in a grid sweep, without building them."""
+    if 'values' in axis:
+        return len(axis['values'])
+    if axis['step'] is None:
+        raise ValueError(f"{name} needs a step in a grid sweep")
+    return max(math.floor((axis['max'] - axis['min']) / float(axis['step']) + 1e-9) + 1, 0)
+
+
+def axis_values(name, axis):
+    """Values of an axis in a grid sweep, min to max inclusive for ranges."""
+    if 'values' in axis:
+        return axis['values']
+    # Counted rather than accumulated, so the last value does not drift past max
+    step = float(axis['step'])
+    return [axis['min'] + i * step for i in range(axis_count(name, axis))]
+
+
+def _sample_axis(axis, u):
+    if 'values' in axis:
+        return axis['values'][min(int(u * len(axis['values'])), len(axis['values']) - 1)]
+    return axis['min'] + u * (axis['max'] - axis['min'])
+
+
+def latin_hypercube(axes, samples, seed=None):
+    """Return samples points, each axis split into samples equal strata sampled exactly once."""
+    rng = random.Random(seed)
+    columns = []
+    for axis in axes:
+        strata = list(range(samples))
+        rng.shuffle(strata)
+        columns.append([_sample_axis(axis, (stratum + rng.random()) / samples) for stratum in strata])
+    return list(zip(*columns))
+
+
+def build_sweep(mode, axes, samples=None, seed=None, max_points=SWEEP_MAX_POINTS):
+    """
+    Expand parsed axes into sweep points.
+
+    Parameters:
+    - mode (str): 'grid' for the cartesian product, 'lhs' for a Latin hypercube sample
+    - axes (list[dict]): Parsed kc, m, initial_loss and continuous_loss axes, in AXES order
+    - samples (int): Number of points of an 'lhs' sweep
+    - seed (int): Random seed of an 'lhs' sweep, for reproducible samples
+
+    Returns:
+    - tuple: (points, layout) where points is a list of (kc, m, initial_loss, continuous_loss)
+      and layout describes how the result arrays are indexed
+    """
+    if mode not in SWEEP_MODES:
+        raise ValueError(f"Unknown sweep mode: {mode}, expected one of {SWEEP_MODES}")
+
+    if mode == 'grid':
+        # Checked before any axis is built, so an oversized range is rejected without allocating it
+        shape = [axis_count(name, axis) for name, axis in zip(AXES, axes)]
+        if math.prod(shape) > max_points:
+            raise ValueError(f"Sweep has {math.prod(shape)} points, the limit is {max_points}")
+        values = [axis_values(name, axis) for name, axis in zip(AXES, axes)]
+        points = list(itertools.product(*values))
+        layout = {'mode': mode, 'dims': list(AXES), 'axes': dict(zip(AXES, values)), 'shape': shape}
+    else:
+        if not samples or samples < 1:
+            raise ValueError("A Latin hypercube sweep needs a positive number of samples")
+        if samples > max_points:
+            raise ValueError(f"Sweep has {samples} points, the limit is {max_points}")
+        points = latin_hypercube(axes, samples, seed)
+        layout = {'mode': mode, 'dims': list(AXES), 'points': [list(point) for point in points], 'shape': [samples], 'seed': seed}
+    return points, layout
+
+
+def grid_point(layout, index):
+    """Return the (kc, m, initial_loss, continuous_loss) at a position of a grid sweep's result arrays."""
+    point = []
+    for dim, size in zip(reversed(layout['dims']), reversed(layout['shape'])):
+        index, i = divmod(index, size)
+        point.append(layout['axes'][dim][i])
+    return point[::-1]
+
+
+def _jobs(points, positions, n_chunks):
+    """Group positions by (m, initial_loss, continuous_loss) and cut the groups into about n_chunks jobs."""
+    groups = {}
+    for i in positions:
+        groups.setdefault(points[i][1:], []).append(i)
+    size = max(1, math.ceil(len(positions) / max(1, n_chunks)))
+    return [group[start:start + size] for group in groups.values() for start in range(0, len(group), size)]
+
+
+def _run_job(catg_data, storms_data, points, job):
+    m, initial_loss, continuous_loss = points[job[0]][1:]
+    return parallel_calibration.kc_calibration(catg_data, storms_data, [points[i][0] for i in job], m, initial_loss, continuous_loss)
+
+
+def _run_job_in_worker(args):
+    kc_list, m, initial_loss, continuous_loss = args
+    catg_data, storms_data = parallel_calibration.worker_inputs()[:2]
+    return parallel_calibration.kc_calibration(catg_data, storms_data, kc_list, m, initial_loss, continuous_loss)
+
+
+def iter_sweep(catg_data, storms_data, points, positions, workers=1):
+    """
+    Run the sweep points at the given positions, yielding results as jobs finish.
+
+    Yields:
+    - tuple: (positions, mapping) where mapping is the rorb_kc_qmax_mapping of those
+      points, which share m / initial_loss / continuous_loss and are in kc order
+    """
+    if workers <= 1:
+        for job in _jobs(points, positions, parallel_calibration.SEQUENTIAL_CHUNKS):
+            yield job, _run_job(catg_data, storms_data, points, job)
+        return
+
+    jobs = _jobs(points, positions, workers * parallel_calibration.CHUNKS_PER_WORKER)
+    if not jobs:
+        return
+    with parallel_calibration.process_pool(min(workers, len(jobs)), catg_data, storms_data, None, None, None) as pool:
+        futures = {
+            pool.submit(_run_job_in_worker, ([points[i][0] for i in job], *points[job[0]][1:])): job
+            for job in jobs
+        }
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            parallel_calibration.cancel_pending(futures)
+
+
+def to_arrays(columns, n_points):
+    """
+    Turn {point_index: single-point rorb_kc_qmax_mapping} into flat arrays.
+
+    Returns:
+    - dict: {hydrograph: {field: [value per point]}} for every field but kc, with None at
+      points that have no result. Scalar fields (e.g. duration) come from the kc_calibration
+      call that ran the point, so they are kept per point like the rest
+    """
+    arrays = {}
+    for i, column in columns.items():
+        for key, series in column.items():
+            target = arrays.setdefault(key, {})
+            for field, values in series.items():
+                if field == 'kc':
+                    continue
+                target.setdefault(field, [None] * n_points)[i] = values[0] if isinstance(values, list) else values
+    return arrays
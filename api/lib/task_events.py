@@ -0,0 +1,115 @@
+"""
+Task change notifications for push-based status endpoints.
+
+Writers call publish_task_changed(cur, task_id) inside the transaction that changes a
+calibration task. That queues a Postgres NOTIFY, delivered to other processes on
+commit. Writers then call notifier.publish(task_id) after the commit to wake waiters
+in the same process. Readers subscribe before reading the task and then await the
+subscription, so a change between the read and the wait cannot be missed.
+"""
+
+import asyncio
+import logging
+import os
+import select
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+from api.lib.db.connection import is_sqlite
+
+CHANNEL = 'calibration_task_status'
+LISTEN_ENABLED = os.environ.get('TASK_EVENTS_LISTEN', '1') != '0'
+LISTEN_RECONNECT_SECONDS = 5
+
+
+class TaskNotifier:
+    """Wakes asyncio waiters of a task from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}
+
+    @contextmanager
+    def subscribe(self, task_id):
+        """Register interest in task_id and yield an asyncio.Event that is set on its next change."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.setdefault(task_id, set()).add(waiter)
+        try:
+            yield waiter[1]
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(task_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[task_id]
+
+    def publish(self, task_id):
+        with self._lock:
+            waiters = list(self._waiters.get(task_id, ()))
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+
+notifier = TaskNotifier()
+
+
+def publish_task_changed(cur, task_id):
+    """Queue a cross-process notification for task_id, sent when cur's transaction commits."""
+    if is_sqlite():
+        return  # no NOTIFY; other processes see changes by re-reading (see ensure_listener)
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, str(task_id)))
+
+
+class _Listener(threading.Thread):
+    """Forwards Postgres notifications on CHANNEL to the in-process notifier."""
+
+    def __init__(self):
+        super().__init__(name='task-events-listener', daemon=True)
+        self.connected = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                logging.warning(f"Task events listener disconnected: {e}")
+            self.connected.clear()
+            time.sleep(LISTEN_RECONNECT_SECONDS)
+
+    def _listen(self):
+        conn = psycopg2.connect(os.environ['POSTGRES_URL'])
+        try:
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            self.connected.set()
+            while True:
+                if select.select([conn], [], [], LISTEN_RECONNECT_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notifier.publish(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def ensure_listener():
+    """Start the LISTEN thread on first use. Returns True while it is connected."""
+    global _listener
+    if not LISTEN_ENABLED or is_sqlite():
+        return False
+    with _listener_lock:
+        if _listener is None:
+            _listener = _Listener()
+            _listener.start()
+    return _listener.connected.is_set()
@@ -0,0 +1,118 @@
+"""
+Bounded-memory ingestion of uploaded catchment and storm files.
+
+Uploads are copied in chunks into spooled temporary files (kept in memory while
+small, rolled over to disk when large) that outlive the request, so background
+tasks can read them after the response is sent. Nothing is decoded here:
+callers decode a file with decode_upload only when they actually need its text.
+"""
+
+import os
+import tempfile
+
+from fastapi import HTTPException
+
+from api.lib import metrics
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_SPOOL_MAX_MEMORY = int(os.environ.get('UPLOAD_SPOOL_MAX_MEMORY', 1024 * 1024))
+UPLOAD_MAX_FILE_BYTES = int(os.environ.get('UPLOAD_MAX_FILE_BYTES', 20 * 1024 * 1024))
+UPLOAD_MAX_REQUEST_BYTES = int(os.environ.get('UPLOAD_MAX_REQUEST_BYTES', 200 * 1024 * 1024))
+FILE_ENCODING = 'ISO-8859-1'
+
+
+class SpooledUpload:
+    """An uploaded file copied to spooled temporary storage."""
+
+    def __init__(self, filename, file, size):
+        self.filename = filename
+        self.file = file
+        self.size = size
+
+    def read_bytes(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def read_text(self, encoding=FILE_ENCODING):
+        return self.read_bytes().decode(encoding)
+
+    def close(self):
+        self.file.close()
+
+    def __repr__(self):
+        # Never include the content, these objects end up in logs and task arguments
+        return f"SpooledUpload(filename={self.filename!r}, size={self.size})"
+
+
+def _too_large(message):
+    return HTTPException(status_code=413, detail=message)
+
+
+async def spool_upload(upload, max_file_bytes=UPLOAD_MAX_FILE_BYTES, remaining_request_bytes=None):
+    """Copy an UploadFile into a SpooledUpload chunk by chunk, enforcing the size limits."""
+    if upload.size is not None and upload.size > max_file_bytes:
+        raise _too_large(f"File {upload.filename} exceeds the {max_file_bytes} byte limit")
+
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY)
+    size = 0
+    try:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_file_bytes:
+                raise _too_large(f"File {upload.filename} exceeds the {max_file_bytes} byte limit")
+            if remaining_request_bytes is not None and size > remaining_request_bytes:
+                raise _too_large("Upload exceeds the request size limit")
+            spooled.write(chunk)
+    except BaseException:
+        spooled.close()
+        raise
+    return SpooledUpload(upload.filename, spooled, size)
+
+
+@metrics.timed_function(metrics.INGEST_SECONDS)
+async def ingest_uploads(catg, storms, max_file_bytes=UPLOAD_MAX_FILE_BYTES, max_request_bytes=UPLOAD_MAX_REQUEST_BYTES):
+    """
+    Spool the catchment and storm uploads of one request.
+
+    Returns:
+    - tuple: (SpooledUpload | None, list[SpooledUpload]), raises HTTPException(413) when a limit is exceeded
+    """
+    uploads = ([catg] if catg else []) + list(storms or [])
+    spooled = []
+    remaining = max_request_bytes
+    try:
+        for upload in uploads:
+            item = await spool_upload(upload, max_file_bytes, remaining)
+            remaining -= item.size
+            spooled.append(item)
+    except BaseException:
+        close_uploads(spooled)
+        raise
+
+    if catg:
+        return spooled[0], spooled[1:]
+    return None, spooled
+
+
+def decode_upload(data, encoding=FILE_ENCODING):
+    """Return the text of a SpooledUpload or raw bytes, passing str and None through."""
+    if data is None or isinstance(data, str):
+        return data
+    if isinstance(data, SpooledUpload):
+        return data.read_text(encoding)
+    return data.decode(encoding)
+
+
+@metrics.timed_function(metrics.DECODE_SECONDS)
+def decode_uploads(catg, storms, encoding=FILE_ENCODING):
+    """Decode a request's catchment and storm files, releasing their temporary storage."""
+    try:
+        return decode_upload(catg, encoding), [decode_upload(storm, encoding) for storm in storms or []]
+    finally:
+        close_uploads([catg, *(storms or [])])
+
+
+def close_uploads(uploads):
+    for upload in uploads:
+        if isinstance(upload, SpooledUpload):
+            upload.close()
@@ -76,14 +76,15 @@ export function KcCalibrationMain() {
       form.clearErrors("kcMax");
     }
 
-    const numKcValues = Math.ceil((kcMax - kcMin) / kcStep) + 1;
+    // Same count and spacing as the API's kc grid (api/lib/sweep.py axis_values)
+    const numKcValues = Math.floor((kcMax - kcMin) / kcStep + 1e-9) + 1;
     const calculatedSimulations = numKcValues * stormFiles.length;
     setTotalSimulations(calculatedSimulations);
 
     // Calculate Kc values
     const kcs: number[] = [];
-    for (let kc = kcMin; kc <= kcMax; kc += kcStep) {
-      kcs.push(Number(kc.toFixed(3)));
+    for (let i = 0; i < numKcValues; i++) {
+      kcs.push(Number((kcMin + i * kcStep).toFixed(3)));
     }
     setKcValues(kcs);
 
@@ -108,26 +109,37 @@ export function KcCalibrationMain() {
   ]);
 
   useEffect(() => {
-    let intervalId: NodeJS.Timeout;
+    if (!taskId) return;
 
-    if (taskId) {
-      NProgress.start(); // Start the progress bar when the task begins
-      intervalId = setInterval(checkCalibrationStatus, 5000);
-    }
+    let active = true;
+    NProgress.start(); // Start the progress bar when the task begins
 
-    return () => {
-      if (intervalId) {
-        clearInterval(intervalId);
+    // Long-poll: each request returns as soon as the task changes (or times out unchanged)
+    (async () => {
+      let version: number | undefined = undefined;
+      while (active) {
+        const nextVersion = await checkCalibrationStatus(taskId, version);
+        if (nextVersion === null) break;
+        version = nextVersion;
       }
+    })();
+
+    return () => {
+      active = false;
       NProgress.done(); // Ensure the progress bar is completed on unmount
     };
   }, [taskId]);
 
-  async function checkCalibrationStatus() {
+  // Returns the task version to wait on next, or null once the task has finished
+  async function checkCalibrationStatus(
+    id: string,
+    version?: number
+  ): Promise<number | null> {
     console.log("Checking calibration status");
     try {
       const response = await axios.get(
-        `/api/py/get_calibration_status/${taskId}`
+        `/api/py/watch_calibration_status/${id}`,
+        { params: version === undefined ? {} : { version } }
       );
 
       const { result } = response.data;
@@ -153,6 +165,7 @@ export function KcCalibrationMain() {
         });
         NProgress.done(); // Complete the progress bar
         console.log("Calibration completed", mappingData);
+        return null;
       } else if (result.status === "error") {
         setTaskId(null);
         setIsLoading(false);
@@ -163,9 +176,20 @@ export function KcCalibrationMain() {
           duration: 3000,
         });
         NProgress.done(); // Complete the progress bar
-      } else if (result.status === "pending") {
-        // Task is still running, do nothing and wait for the next interval
+        return null;
+      } else if (result.status === "cancelled") {
+        setTaskId(null);
+        setIsLoading(false);
+        toast({
+          title: "Cancelled",
+          description: "Calibration was cancelled",
+          duration: 3000,
+        });
+        NProgress.done(); // Complete the progress bar
+        return null;
       }
+      // Task is still running, wait for its next change
+      return result.version;
     } catch (error) {
       console.error("Error checking calibration status:", error);
       setTaskId(null);
@@ -177,6 +201,7 @@ export function KcCalibrationMain() {
         duration: 3000,
       });
       NProgress.done(); // Complete the progress bar on error
+      return null;
     }
   }
 